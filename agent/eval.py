@@ -14,6 +14,8 @@ import psutil
 import shutil
 import time
 from utils.misc import extract_fuzzer_name
+from utils.event_log import Stage, EVENT_FILE, read_events, find_events
+from utils.run_ledger import RunStatus
 
 class HarnessEval(FuzzENV):
     def __init__(self,  benchcfg: BenchConfig, function_signature: str, project_name: str, local_harness: Path, n_run: int=1):
@@ -38,6 +40,8 @@ class HarnessEval(FuzzENV):
         # Run the fuzzer
         fuzz_res, _, _ = fuzzer.run_fuzzing(counter=0, fuzzer_name=fuzzer_name, 
                                             ignore_crashes=self.benchcfg.ignore_crashes, no_log=self.benchcfg.no_log)
+        self.event_log.emit(Stage.Fuzzer, "end", result=fuzz_res, fuzzer_name=fuzzer_name)
+        self.event_log.flush()
         if fuzz_res != ValResult.NoError:
             self.logger.error(f"Crash when fuzzing: {fuzz_res}") if self.logger else None
             
@@ -73,7 +77,12 @@ def process_single_result(args: tuple[str, str, Path, BenchConfig]): # type: ign
     local_harness_file = work_dir / "harness.txt"
     
     fuzzer_info_file = work_dir / "fuzzer_info.json"
-    if not fuzzer_info_file.exists():
+    # the last compiled fuzzer of the run
+    compile_events = [e for e in find_events(read_events(work_dir / EVENT_FILE), Stage.Compiler, "end") if e.get("fuzzer_name")]
+    if not fuzzer_info_file.exists() and compile_events:
+        fuzzer_name = compile_events[-1]["fuzzer_name"]
+        remote_harness_path = compile_events[-1].get("fuzzer_path", "")
+    elif not fuzzer_info_file.exists():
         # read the agent log
         agent_log_file = work_dir / "agent.log"
         log_lines = agent_log_file.read_text().splitlines()
@@ -98,6 +107,8 @@ def process_single_result(args: tuple[str, str, Path, BenchConfig]): # type: ign
     # print("harness_path:", remote_harness_path)
     remote_harness_path = Path(remote_harness_path)
 
+    evaluator = None
+    run_status = RunStatus.Finished
     try:
         # get the evaluator
         evaluator = HarnessEval(benchcfg=benchcfg, function_signature=function_signature,
@@ -119,7 +130,12 @@ def process_single_result(args: tuple[str, str, Path, BenchConfig]): # type: ign
         return project_name, function_signature, init_cov, final_cov
     except Exception as e:
         print(f"Error processing {project_name}/{function_signature}: {e}")
+        run_status = RunStatus.Error
         return project_name, function_signature, 0, 0
+    finally:
+        # close the ledger row opened by FuzzENV
+        if evaluator is not None and not evaluator.early_exit_flag:
+            evaluator.ledger.finish_run(evaluator.save_dir, run_status)
 
 def run_evaluation(output_path: Path, benchcfg:BenchConfig, n_run:int=1, n_partitations:int=1, partitation_id:int=0): 
     """Run the evaluation in parallel"""
@@ -1,11 +1,11 @@
 from constants import LanguageType, CompileResults
 from agent_tools.code_retriever import CodeRetriever
 import logging
-import tiktoken
 from typing import Any, Optional
 from bench_cfg import BenchConfig
 from ossfuzz_gen import benchmark as benchmarklib
 from utils.misc import add_lineno_to_code
+from utils.token_budget import truncate_head_lines
 
 class FixerPromptBuilder:
     # (self.benchcfg, self.project_name, self.new_project_name, self.code_retriever, self.logger,
@@ -27,11 +27,8 @@ class FixerPromptBuilder:
         self.project_lang = project_lang
 
     def reduce_msg(self, error_msg: str) -> str:
-        enc = tiktoken.encoding_for_model("gpt-4o")
-        while len(enc.encode(error_msg)) > self.benchcfg.model_token_limit // 2:
-            # remove the first line until the error message is short enough
-            error_msg = error_msg.split("\n", 1)[1]
-        return error_msg
+        # remove the first lines until the error message is short enough
+        return truncate_head_lines(error_msg, self.benchcfg.model_token_limit // 2)
 
     def build_compile_prompt(self, harness_code: str, error_msg: str, fuzzer_path: str)-> str:
         '''
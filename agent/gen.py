@@ -1,8 +1,7 @@
 import os
-import io
-import contextlib
+import time
+import asyncio
 import logging
-import tiktoken
 import json
 from pathlib import Path
 from langgraph.graph import StateGraph, END, START  # type: ignore
@@ -21,7 +20,14 @@ from agent.modules.validation import Validation
 from agent.modules.generator import HarnessGenerator
 from agent.modules.fixer import CodeFixer
 from agent.modules.semantic_check import SemaCheck
-from typing import Any, Optional
+from agent.modules.history import HistoryCompactor
+from agent.modules.speculation import DraftWorkspace
+from utils.event_log import EventLog, Stage, emit_event, set_event_log
+from utils.docker_utils import set_cancel_event
+from utils.llm_cache import LLMDiskCache, get_llm_cache
+from utils.token_budget import fits, count_tokens_batch
+from utils.rate_limiter import get_rate_limiter
+from typing import Any, Callable, Optional
 from langchain_core.language_models import BaseChatModel
 from bench_cfg import BenchConfig
 from agent_tools.code_search import search_public_usage
@@ -49,28 +55,38 @@ class FuzzState(TypedDict):
 
 class SemaCheckNode:
     def __init__(self, oss_fuzz_dir: Path, benchmark_dir: Path, project_name: str, new_project_name: str, 
-                 function_signature: str, project_lang: LanguageType, mode: str, logger: logging.Logger):
+                 function_signature: str, project_lang: LanguageType, mode: str, logger: logging.Logger,
+                 on_pass: Optional[Callable[[], None]] = None):
         self.oss_fuzz_dir = oss_fuzz_dir
         self.project_name = project_name
         self.new_project_name = new_project_name
         self.mode = mode
         self.func_name = extract_name(function_signature, keep_namespace=True, language=project_lang)
         self.logger = logger
+        # called when the harness passes, e.g., to stop the other speculative drafts
+        self.on_pass = on_pass
         self.checker = SemaCheck(oss_fuzz_dir, benchmark_dir, project_name, new_project_name, self.func_name, project_lang)
 
     def check(self, state: dict[str, Any]) -> dict[str, Any]:
         
         if self.mode == "no":
             self.logger.info("No semantic check")
+            emit_event(Stage.SemanticCheck, "result", result="skipped")
+            if self.on_pass:
+                self.on_pass()
             return {"messages": ("user", END)}
 
         # run semantic check
         flag = self.checker.check(state["harness_code"], state["fuzzer_path"], state["fuzzer_name"])
         if flag:
             self.logger.info("Semantic check passed")
+            emit_event(Stage.SemanticCheck, "result", result="passed")
+            if self.on_pass:
+                self.on_pass()
             return{"messages": ("user", END)}
         else:
             self.logger.info("Semantic check failed")
+            emit_event(Stage.SemanticCheck, "result", result="failed")
             if self.mode == "both":
                 msg = "The harness code is grammly correct, but it could not pass the semantic check. The reason is the harness code does not correctly fuzz the function." \
                 " Maybe the harness code didn't correctly feed the fuzze data to correct position (like file or buffer)." 
@@ -91,6 +107,8 @@ class ISSTAFuzzer(FuzzENV):
     FuzzerNode = "Fuzzer"
     FixBuilderNode = "FixBuilder"
     SemanticCheckNode = "SemanticCheckNode"
+    GeneratorCompactNode = "GeneratorCompact"
+    FixerCompactNode = "FixerCompact"
    
     def __init__(self, benchcfg: BenchConfig, function_signature: str, project_name: str, n_run: int):
         super().__init__(benchcfg, function_signature, project_name, n_run)
@@ -132,7 +150,7 @@ class ISSTAFuzzer(FuzzENV):
             if FuzzEntryFunctionMapping[self.project_lang] in code["source_code"]:
                 continue
             # token limit
-            if len(code["source_code"].split()) > self.benchcfg.usage_token_limit:
+            if not fits(code["source_code"], self.benchcfg.usage_token_limit):
                 continue
             filter_code_usage.append(code)
 
@@ -197,19 +215,21 @@ class ISSTAFuzzer(FuzzENV):
     def comment_example(self, example_list: list[dict[str, str]]) -> str:
         # leave some tokens for the prompt
         margin_token = self.benchcfg.usage_token_limit
-        enc = tiktoken.encoding_for_model("gpt-4o")
 
         final_example_str = ""
 
-        total_token = self.benchcfg.usage_token_limit
-        n_used = 0
-        for i, example in enumerate(example_list):
+        commented_examples: list[str] = []
+        for example in example_list:
             function_usage = example["source_code"]
             function_usage = "\n//".join(function_usage.splitlines())
-            function_usage = "\n// " + function_usage
+            commented_examples.append("\n// " + function_usage)
+        n_tokens = count_tokens_batch(commented_examples)
 
+        total_token = self.benchcfg.usage_token_limit
+        n_used = 0
+        for i, function_usage in enumerate(commented_examples):
             # token limit
-            total_token += len(enc.encode(function_usage))
+            total_token += n_tokens[i]
             if total_token > self.benchcfg.model_token_limit - margin_token:
                 n_used = i-1
                 break
@@ -219,7 +239,14 @@ class ISSTAFuzzer(FuzzENV):
         self.logger.info(f"Use {n_used+1} examples.")
         return final_example_str
    
-    def select_example(self, example_list: list[dict[str, str]]) -> str:
+    def select_example(self, example_list: list[dict[str, str]], window: Optional[int] = None) -> str:
+        '''
+        Select n_examples examples. Each run uses its own window of the examples (window n_run-1),
+        a speculative draft may ask for another window and falls back to the window of the run if it is empty.
+        '''
+        run_window = self.n_run - 1
+        if window is None:
+            window = run_window
 
         if self.benchcfg.n_examples == 0:
             self.logger.info("No examples selected, return empty string")
@@ -231,7 +258,9 @@ class ISSTAFuzzer(FuzzENV):
         if self.benchcfg.example_mode == "random":
             
             # do not repeat the examples for different runs
-            selected_list = example_list[(self.n_run-1)*self.benchcfg.n_examples:self.n_run*self.benchcfg.n_examples]
+            selected_list = example_list[window*self.benchcfg.n_examples:(window+1)*self.benchcfg.n_examples]
+            if not selected_list:
+                selected_list = example_list[run_window*self.benchcfg.n_examples:(run_window+1)*self.benchcfg.n_examples]
             return self.comment_example(selected_list)
         
         elif self.benchcfg.example_mode == "rank":
@@ -253,12 +282,18 @@ class ISSTAFuzzer(FuzzENV):
             # random.shuffle(other_list)
 
             # do not repeat the examples for different runs
-            selected_list = rank_list[(self.n_run-1)*self.benchcfg.n_examples:self.n_run*self.benchcfg.n_examples]
-            n_rest = self.benchcfg.n_examples - len(selected_list)
-
-            if n_rest > 0:
-                # if the rank list is empty, use the other examples
-                selected_list += other_list[(self.n_run-1)*n_rest:self.n_run*n_rest]
+            def window_examples(window: int) -> list[dict[str, str]]:
+                selected_list = rank_list[window*self.benchcfg.n_examples:(window+1)*self.benchcfg.n_examples]
+                n_rest = self.benchcfg.n_examples - len(selected_list)
+
+                if n_rest > 0:
+                    # if the rank list is empty, use the other examples
+                    selected_list += other_list[window*n_rest:(window+1)*n_rest]
+                return selected_list
+
+            selected_list = window_examples(window)
+            if not selected_list:
+                selected_list = window_examples(run_window)
             return self.comment_example(selected_list)
         
         return ""
@@ -290,7 +325,7 @@ class ISSTAFuzzer(FuzzENV):
 
         return code_usages
             
-    def get_function_usage(self, function_name: str) -> str:
+    def get_function_usage(self, function_name: str, example_window: Optional[int] = None) -> str:
         self.logger.info(f"Using {self.benchcfg.example_source} for example source")
 
         if self.benchcfg.example_source == CodeSearchAPIName.Sourcegraph:
@@ -302,7 +337,8 @@ class ISSTAFuzzer(FuzzENV):
 
         if self.benchcfg.example_mode == "rank":
             self.logger.info("Using rank mode for example selection")
-            code_usages = cache_example_selection(example_json_file, function_name, self.project_name, self.benchcfg.model_name)
+            code_usages = cache_example_selection(example_json_file, function_name, self.project_name, self.benchcfg.model_name,
+                                                  max_workers=self.benchcfg.example_score_workers, prefilter=self.benchcfg.example_prefilter)
         
         filter_code_usage = self.filter_examples(code_usages) # type: ignore
 
@@ -310,10 +346,10 @@ class ISSTAFuzzer(FuzzENV):
         
         function_usage = ""
         if len(filter_code_usage) > 0:
-            function_usage = self.select_example(filter_code_usage)
+            function_usage = self.select_example(filter_code_usage, example_window)
         return function_usage
         
-    def build_init_prompt(self, prompt_template: str) -> str:
+    def build_init_prompt(self, prompt_template: str, example_window: Optional[int] = None, save_dir: Optional[Path] = None) -> str:
 
         # If extract_all_functions is enabled, extract all symbols and exit
         if self.benchcfg.extract_all_functions:
@@ -333,7 +369,7 @@ class ISSTAFuzzer(FuzzENV):
         header_string = self.get_header(function_name)
 
         # get the function usage from the project and the public
-        function_usage = self.get_function_usage(function_name)
+        function_usage = self.get_function_usage(function_name, example_window)
 
         # TODO, no document
         # {function_document}
@@ -359,7 +395,7 @@ class ISSTAFuzzer(FuzzENV):
         # comment the prompt template
         prompt_template = "// " + prompt_template.replace("\n", "\n// ") + "\n"
         # save the prompt template to file
-        save_code_to_file(prompt_template, self.save_dir / "prompt.txt")
+        save_code_to_file(prompt_template, (save_dir if save_dir else self.save_dir) / "prompt.txt")
 
         return prompt_template
 
@@ -422,19 +458,44 @@ class ISSTAFuzzer(FuzzENV):
             prompt_template = prompt_template.replace(f"{{{key}}}", value) # type: ignore
         return prompt_template
 
-    def load_model(self) -> BaseChatModel:
-
-        if self.benchcfg.model_name.startswith("gpt"):
+    def load_cache(self, namespace: Optional[str] = None) -> Optional[LLMDiskCache]:
+        # the iteration is part of the key, so the iterations stay independent samples
+        return get_llm_cache(self.benchcfg.cache_root, self.benchcfg.llm_cache_mode, namespace=namespace if namespace else f"run{self.n_run}",
+                             max_size_mb=self.benchcfg.llm_cache_size_mb)
+
+    def load_model(self, temperature: Optional[float] = None, namespace: Optional[str] = None) -> BaseChatModel:
+
+        if temperature is None:
+            temperature = self.benchcfg.temperature
+        # None means no cache
+        cache = self.load_cache(namespace)
+        # shared by the workers through a file under cache_root, only called on cache misses
+        self.rate_limiter = get_rate_limiter(self.benchcfg.cache_root / "rate_limits", self.benchcfg.model_name,
+                                             self.benchcfg.llm_rpm, self.benchcfg.llm_tpm)
+        rate_limiter = self.rate_limiter
+        if self.benchcfg.llm_base_url:
+            # a self-hosted or mock OpenAI-compatible server, e.g., utils/mock_llm_server.py
+            llm = ChatOpenAI(
+                cache=cache,
+                rate_limiter=rate_limiter,
+                api_key=os.getenv("LLM_API_KEY", "mock"), # type: ignore
+                base_url=self.benchcfg.llm_base_url,
+                model=self.benchcfg.model_name,
+                temperature=temperature,
+                )
+        elif self.benchcfg.model_name.startswith("gpt"):
             if "gpt-5-mini" in self.benchcfg.model_name:
-                llm = ChatOpenAI(model=self.benchcfg.model_name)
+                llm = ChatOpenAI(model=self.benchcfg.model_name, cache=cache, rate_limiter=rate_limiter)
             else:
-                llm = ChatOpenAI(model=self.benchcfg.model_name, temperature=self.benchcfg.temperature)
+                llm = ChatOpenAI(model=self.benchcfg.model_name, temperature=temperature, cache=cache, rate_limiter=rate_limiter)
         elif self.benchcfg.model_name.startswith("anthropic"):
             llm = ChatOpenAI(
+                cache=cache,
+                rate_limiter=rate_limiter,
                 api_key=os.getenv("OPENROUTER_API_KEY", ""), # type: ignore
                 base_url="https://openrouter.ai/api/v1",
                 model=self.benchcfg.model_name,
-                temperature=self.benchcfg.temperature,
+                temperature=temperature,
                  extra_body={
                     "reasoning": {
                         "enabled": self.benchcfg.reasoning,       # enables reasoning
@@ -447,10 +508,12 @@ class ISSTAFuzzer(FuzzENV):
     # }
         else:
             llm = ChatOpenAI(
+                cache=cache,
+                rate_limiter=rate_limiter,
                 api_key=os.getenv("OPENROUTER_API_KEY", ""), # type: ignore
                 base_url="https://openrouter.ai/api/v1",
                 model=self.benchcfg.model_name,
-                temperature=self.benchcfg.temperature,
+                temperature=temperature,
                 # disabled_params={"parallel_tool_calls": None}
                 
                 )
@@ -463,39 +526,46 @@ class ISSTAFuzzer(FuzzENV):
 
         header_tool = StructuredTool.from_function(  # type: ignore
                 func=self.code_retriever.get_symbol_header_tool,
+                coroutine=self.code_retriever.aget_symbol_header_tool,
                 name="get_symbol_header_tool",
                 description=self.code_retriever.get_symbol_header.__doc__,
             )
         definition_tool = StructuredTool.from_function( # type: ignore
             func=self.code_retriever.get_symbol_definition_tool,
+            coroutine=self.code_retriever.aget_symbol_definition_tool,
             name="get_symbol_definition_tool",
             description=self.code_retriever.get_symbol_definition.__doc__,
         )
 
         declaration_tool = StructuredTool.from_function( # type: ignore
             func=self.code_retriever.get_symbol_declaration_tool,
+            coroutine=self.code_retriever.aget_symbol_declaration_tool,
             name="get_symbol_declaration_tool",
             description=self.code_retriever.get_symbol_declaration.__doc__,
         )
         view_tool = StructuredTool.from_function( # type: ignore
             func=self.code_retriever.view_code,
+            coroutine=self.code_retriever.aview_code,
             name="view_code",
             description=self.code_retriever.view_code.__doc__,
         )
 
         struct_tool = StructuredTool.from_function(  # type: ignore
             func=self.code_retriever.get_struct_related_functions_tool,
+            coroutine=self.code_retriever.aget_struct_related_functions_tool,
             name="get_struct_related_functions_tool",
             description=self.code_retriever.get_struct_related_functions.__doc__,
         )
         reference_tool = StructuredTool.from_function(  # type: ignore
             func=self.code_retriever.get_symbol_references_tool,
+            coroutine=self.code_retriever.aget_symbol_references_tool,
             name="get_symbol_references_tool",
             description=self.code_retriever.get_symbol_references.__doc__,
         )
 
         location_tool = StructuredTool.from_function(  # type: ignore
             func=self.code_retriever.get_file_location_tool,
+            coroutine=self.code_retriever.aget_file_location_tool,
             name="get_file_location_tool",
             description=self.code_retriever.get_file_location_tool.__doc__,
         )
@@ -503,6 +573,7 @@ class ISSTAFuzzer(FuzzENV):
         # this tool should not be used for LLM4FDG benchmark since the functions are from the driver examples
         driver_tool = StructuredTool.from_function(  # type: ignore
             func=self.code_retriever.get_driver_example_tool,
+            coroutine=self.code_retriever.aget_driver_example_tool,
             name="get_driver_example_tool",
             description=self.code_retriever.get_driver_example_tool.__doc__,
         )
@@ -521,15 +592,28 @@ class ISSTAFuzzer(FuzzENV):
         return tools
 
     
-    def build_graph(self) -> StateGraph:
-
-
-        llm_extract = ChatOpenAI(model="gpt-5.1-mini")
-        llm = self.load_model()
+    def build_graph(self, draft: Optional[DraftWorkspace] = None) -> StateGraph:
+        '''
+        Build the generation graph of the run, or of a speculative draft in its own workspace.
+        '''
+        new_project_name = draft.new_project_name if draft else self.new_project_name
+        save_dir = draft.save_dir if draft else self.save_dir
+        logger: logging.Logger = draft.logger if draft else self.logger # type: ignore
+        event_log = draft.event_log if draft else self.event_log
+        # each draft has its own cache namespace, otherwise drafts at the same temperature get the same answers
+        namespace = f"run{self.n_run}_draft{draft.index}" if draft else None
+
+        # the extractor shares the cache, a replay must not call any LLM
+        if self.benchcfg.llm_base_url:
+            llm_extract = ChatOpenAI(model="gpt-5.1-mini", cache=self.load_cache(namespace), base_url=self.benchcfg.llm_base_url,
+                                     api_key=os.getenv("LLM_API_KEY", "mock")) # type: ignore
+        else:
+            llm_extract = ChatOpenAI(model="gpt-5.1-mini", cache=self.load_cache(namespace))
+        llm = self.load_model(draft.temperature if draft else None, namespace)
 
         # code formatter
         llm_code_extract: BaseChatModel = llm_extract.with_structured_output(CodeAnswerStruct) # type: ignore
-        code_formater = CodeFormatTool(llm_code_extract, load_prompt_template(f"{PROJECT_PATH}/agent/prompts/extract_code.txt"))
+        code_formater = CodeFormatTool(llm_code_extract, load_prompt_template(f"{PROJECT_PATH}/agent/prompts/extract_code.txt"), self.project_lang)
 
         tools = self.load_tools()
         if len(tools) > 0:
@@ -537,8 +621,9 @@ class ISSTAFuzzer(FuzzENV):
         else:
             tool_llm = llm
 
-        draft_responder = HarnessGenerator(tool_llm, self.benchcfg.max_tool_call, continue_flag=True, save_dir=self.save_dir, 
-                                        code_callback=code_formater.extract_code, logger=self.logger, model_name=self.benchcfg.model_name)
+        draft_responder = HarnessGenerator(tool_llm, self.benchcfg.max_tool_call, continue_flag=True, save_dir=save_dir, 
+                                        code_callback=code_formater.extract_code, logger=logger, model_name=self.benchcfg.model_name,
+                                 rate_limiter=self.rate_limiter)
 
 
         compile_fix_prompt = load_prompt_template(f"{PROJECT_PATH}/agent/prompts/compile_prompt.txt")
@@ -556,44 +641,64 @@ class ISSTAFuzzer(FuzzENV):
         else:
             prompt_builder = FixerPromptBuilder
 
-        fix_builder = prompt_builder(self.benchcfg, self.oss_fuzz_benchmark, self.project_name, self.new_project_name, self.code_retriever, self.logger,
+        fix_builder = prompt_builder(self.benchcfg, self.oss_fuzz_benchmark, self.project_name, new_project_name, self.code_retriever, logger,
                                         local_compile_fix_prompt, local_fuzz_fix_prompt, self.project_lang)
 
-        code_fixer = CodeFixer(tool_llm, self.benchcfg.max_fix, self.benchcfg.max_tool_call,  self.save_dir, self.benchcfg.cache_root,
-                                 code_callback=code_formater.extract_code, logger=self.logger, model_name=self.benchcfg.model_name)
+        code_fixer = CodeFixer(tool_llm, self.benchcfg.max_fix, self.benchcfg.max_tool_call,  save_dir, self.benchcfg.cache_root,
+                                 code_callback=code_formater.extract_code, logger=logger, model_name=self.benchcfg.model_name,
+                                 rate_limiter=self.rate_limiter)
 
-        fuzzer = Validation(self.benchcfg.oss_fuzz_dir, self.new_project_name, self.project_lang, 
-                             self.benchcfg.run_time,  self.save_dir,  self.logger)
+        fuzzer = Validation(self.benchcfg.oss_fuzz_dir, new_project_name, self.project_lang, 
+                             self.benchcfg.run_time,  save_dir,  logger)
+        if draft:
+            fuzzer.cancel_event = draft.cancel_event
         
         if self.benchcfg.header_mode == "all":
             # use the header compiler wrapper
-            self.logger.info("Using HeaderCompilerWraper for compiling")
-            compiler = HeaderCompilerWraper(self.benchcfg.oss_fuzz_dir, self.project_name, self.new_project_name, self.code_retriever, 
-                                            self.project_lang, self.harness_pairs, self.save_dir, self.benchcfg.cache_root, self.logger)
+            logger.info("Using HeaderCompilerWraper for compiling")
+            compiler = HeaderCompilerWraper(self.benchcfg.oss_fuzz_dir, self.project_name, new_project_name, self.code_retriever, 
+                                            self.project_lang, self.harness_pairs, save_dir, self.benchcfg.cache_root, logger)
         else:
-            compiler = CompilerWraper(self.benchcfg.oss_fuzz_dir, self.benchcfg.benchmark_dir, self.project_name, self.new_project_name, self.code_retriever, self.project_lang,
-                                       self.harness_pairs, self.benchcfg.compile_enhance, self.save_dir, self.benchcfg.cache_root, self.logger)
-        checker = SemaCheckNode(self.benchcfg.oss_fuzz_dir, self.benchcfg.benchmark_dir, self.project_name, self.new_project_name, self.function_signature, self.project_lang, self.benchcfg.semantic_mode, self.logger)
+            compiler = CompilerWraper(self.benchcfg.oss_fuzz_dir, self.benchcfg.benchmark_dir, self.project_name, new_project_name, self.code_retriever, self.project_lang,
+                                       self.harness_pairs, self.benchcfg.compile_enhance, save_dir, self.benchcfg.cache_root, logger)
+        checker = SemaCheckNode(self.benchcfg.oss_fuzz_dir, self.benchcfg.benchmark_dir, self.project_name, new_project_name, self.function_signature, self.project_lang, self.benchcfg.semantic_mode, logger,
+                                on_pass=draft.passed.set if draft else None)
 
         # build the graph
         builder = StateGraph(FuzzState)
         # add nodes
         tool_node = ToolNode(tools)
 
-        builder.add_node(self.HarnessGeneratorNode, draft_responder.respond) # type: ignore
-        builder.add_node(self.CompilerNode, compiler.compile)  # type: ignore
-        builder.add_node(self.FixBuilderNode, fix_builder.respond)  # type: ignore
-        builder.add_node(self.CodeFixerNode, code_fixer.respond)  # type: ignore
+        # each node emits its start/end events and result to events.jsonl
+        def trace(stage: Stage, node: Callable[[dict[str, Any]], dict[str, Any]]) -> Callable[[dict[str, Any]], dict[str, Any]]:
+            traced = event_log.trace_node(stage, node)
+            # the nodes of a draft are also counted, its workspace is removed only when none is running
+            return draft.track(traced) if draft else traced
+        builder.add_node(self.HarnessGeneratorNode, trace(Stage.Generator, draft_responder.respond)) # type: ignore
+        builder.add_node(self.CompilerNode, trace(Stage.Compiler, compiler.compile))  # type: ignore
+        builder.add_node(self.FixBuilderNode, trace(Stage.FixBuilder, fix_builder.respond))  # type: ignore
+        builder.add_node(self.CodeFixerNode, trace(Stage.Fixer, code_fixer.respond))  # type: ignore
         builder.add_node(self.FixerToolNode, tool_node) # type: ignore
         builder.add_node(self.GenerationToolNode, tool_node) # type: ignore
-        builder.add_node(self.FuzzerNode, fuzzer.run_fuzzing) # type: ignore
-        builder.add_node(self.SemanticCheckNode, checker.check) # type: ignore
+        builder.add_node(self.FuzzerNode, trace(Stage.Fuzzer, fuzzer.run_fuzzing)) # type: ignore
+        builder.add_node(self.SemanticCheckNode, trace(Stage.SemanticCheck, checker.check)) # type: ignore
 
         # add edges
         builder.add_edge(START, self.HarnessGeneratorNode)
-        builder.add_edge(self.FixerToolNode, self.CodeFixerNode)
-        builder.add_edge(self.FixBuilderNode, self.CodeFixerNode)
-        builder.add_edge(self.GenerationToolNode, self.HarnessGeneratorNode)
+        if self.benchcfg.history_token_budget > 0:
+            # compact the history before the LLM sees the new tool results or error messages
+            compactor = HistoryCompactor(self.benchcfg.history_token_budget, logger)
+            builder.add_node(self.GeneratorCompactNode, compactor.compact) # type: ignore
+            builder.add_node(self.FixerCompactNode, compactor.compact) # type: ignore
+            builder.add_edge(self.FixerToolNode, self.FixerCompactNode)
+            builder.add_edge(self.FixBuilderNode, self.FixerCompactNode)
+            builder.add_edge(self.FixerCompactNode, self.CodeFixerNode)
+            builder.add_edge(self.GenerationToolNode, self.GeneratorCompactNode)
+            builder.add_edge(self.GeneratorCompactNode, self.HarnessGeneratorNode)
+        else:
+            builder.add_edge(self.FixerToolNode, self.CodeFixerNode)
+            builder.add_edge(self.FixBuilderNode, self.CodeFixerNode)
+            builder.add_edge(self.GenerationToolNode, self.HarnessGeneratorNode)
 
         # add conditional edges
         builder.add_conditional_edges(self.HarnessGeneratorNode, self.generator_mapping,  [self.CompilerNode, self.GenerationToolNode, END])
@@ -620,29 +725,124 @@ class ISSTAFuzzer(FuzzENV):
         else:
             raise ValueError(f"Unsupported language for harness generation: {ext_lang}") 
         
+        if self.benchcfg.speculative_drafts > 1:
+            self.run_speculative(generator_prompt_template)
+            return
+
         # build the prompt for initial generator
         generator_prompt = self.build_init_prompt(generator_prompt_template)
 
         # plot_graph(graph)
         config = {"configurable": {"thread_id": "1"}, "recursion_limit": 200} # type: ignore
-        events = graph.stream( # type: ignore
-            {"messages": [("user", generator_prompt)], "function_signature": self.function_signature},
+        inputs = {"messages": [("user", generator_prompt)], "function_signature": self.function_signature}
+        # run the graph in an event loop, so that the tool calls of one turn run concurrently
+        asyncio.run(self.astream_graph(graph, inputs, config))
+
+    async def astream_graph(self, graph: StateGraph, inputs: dict[str, Any], config: dict[str, Any],
+                            save_dir: Optional[Path] = None, event_log: Optional[EventLog] = None) -> None:
+        save_dir = save_dir if save_dir else self.save_dir
+        event_log = event_log if event_log else self.event_log
+        events = graph.astream( # type: ignore
+            inputs,
             config,
             stream_mode="values",
         )
 
-        with open(os.path.join(self.save_dir, "output.log"), "w") as f:
-            for i, step in enumerate(events): # type: ignore
+        with open(os.path.join(save_dir, "output.log"), "w") as f:
+            i = 0
+            # the compactor steps end with the same tool messages, log them once
+            seen_tools: set[str] = set()
+            async for step in events: # type: ignore
                 f.write(f"Step {i}\n")  # Save step number if needed
-                output = io.StringIO()  # Create an in-memory file-like object
-                with contextlib.redirect_stdout(output):  # Capture print output
-                    if step["messages"][-1].type != "tool": # type: ignore
-                        step["messages"][-1].pretty_print()  # type: ignore
-                    else:
-                        for msg in step["messages"][::-1]:  # type: ignore
-                            if msg.type != "tool":  # type: ignore
-                                break
-                            msg.pretty_print()  # type: ignore
-                f.write(output.getvalue() + "\n")  # Write captured output to file
-
-                f.flush()
\ No newline at end of file
+                i += 1
+                # pretty_repr instead of capturing pretty_print, redirect_stdout is global to the process
+                if step["messages"][-1].type != "tool": # type: ignore
+                    f.write(step["messages"][-1].pretty_repr() + "\n")  # type: ignore
+                else:
+                    for msg in step["messages"][::-1]:  # type: ignore
+                        if msg.type != "tool" or msg.id in seen_tools:  # type: ignore
+                            break
+                        seen_tools.add(msg.id)  # type: ignore
+                        f.write(msg.pretty_repr() + "\n")  # type: ignore
+                        event_log.emit(Stage.Tool, "result", tool=msg.name, status=getattr(msg, "status", "success"), # type: ignore
+                                            size=len(str(msg.content))) # type: ignore
+                f.write("\n")
+
+                f.flush()
+
+    def run_speculative(self, generator_prompt_template: str) -> None:
+        """
+        Fork speculative_drafts drafts from the initial prompt, each with its own temperature, example window and workspace,
+        and run their generate/compile/fix/fuzz loops concurrently. The first draft that passes the semantic check wins,
+        its files and events are merged into the run dir and the other drafts are cancelled.
+        """
+        drafts: list[DraftWorkspace] = []
+        for k in range(self.benchcfg.speculative_drafts):
+            drafts.append(DraftWorkspace(k, self.benchcfg.oss_fuzz_dir, self.project_name, self.new_project_name, self.project_lang, self.save_dir,
+                                         temperature=min(self.benchcfg.temperature + k * self.benchcfg.speculative_temperature_step, 1.0),
+                                         # windows after the ones of all iterations, draft 0 uses the window of the run
+                                         example_window=self.n_run - 1 + k * self.benchcfg.iterations,
+                                         logger=self.logger))
+        try:
+            jobs: list[tuple[DraftWorkspace, StateGraph, str]] = []
+            for draft in drafts:
+                draft.create()
+                prompt = self.build_init_prompt(generator_prompt_template, example_window=draft.example_window, save_dir=draft.save_dir)
+                jobs.append((draft, self.build_graph(draft), prompt))
+            # not asyncio.run: it joins the worker threads, a node of a losing draft (e.g., an LLM call) would delay the winner
+            loop = asyncio.new_event_loop()
+            try:
+                winner = loop.run_until_complete(self.race_drafts(jobs))
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+            if winner is None:
+                self.logger.info(f"No draft of {len(drafts)} passed")
+                return
+            self.logger.info(f"Draft {winner.index} passed first, merge it into the run")
+            winner.merge_into(self.save_dir, self.event_log)
+            self.event_log.emit(Stage.Draft, "win", draft=winner.index, temperature=winner.temperature, example_window=winner.example_window)
+        finally:
+            for draft in drafts:
+                draft.clean_when_idle()
+
+    async def race_drafts(self, jobs: list[tuple[DraftWorkspace, StateGraph, str]]) -> Optional[DraftWorkspace]:
+        tasks = {asyncio.create_task(self.run_draft(draft, graph, prompt)): draft for draft, graph, prompt in jobs}
+        pending = set(tasks.keys())
+        winner: Optional[DraftWorkspace] = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if tasks[task].passed.is_set() and winner is None:
+                    winner = tasks[task]
+
+        # a node already running in a worker thread finishes (the fuzzer and the builds stop at the cancel event),
+        # its result is dropped
+        for task in pending:
+            tasks[task].cancel_event.set()
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return winner
+
+    async def run_draft(self, draft: DraftWorkspace, graph: StateGraph, prompt: str) -> str:
+        # the task has its own context, the events of the nodes go to the event log of the draft
+        set_event_log(draft.event_log)
+        set_cancel_event(draft.cancel_event)
+        start = time.time()
+        self.event_log.emit(Stage.Draft, "start", draft=draft.index, temperature=draft.temperature, example_window=draft.example_window)
+        result = "failed"
+        try:
+            config = {"configurable": {"thread_id": "1"}, "recursion_limit": 200} # type: ignore
+            inputs = {"messages": [("user", prompt)], "function_signature": self.function_signature}
+            await self.astream_graph(graph, inputs, config, draft.save_dir, draft.event_log)
+            result = "passed" if draft.passed.is_set() else "failed"
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        except Exception as e:
+            draft.logger.error(f"Exit. An exception occurred: {e}")
+            result = "error"
+        finally:
+            draft.event_log.flush()
+            self.event_log.emit(Stage.Draft, "end", draft=draft.index, result=result, duration=round(time.time() - start, 3))
+        return result
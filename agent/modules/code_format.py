@@ -1,7 +1,14 @@
 from langchain_core.language_models import BaseChatModel
 from pydantic import BaseModel, Field
+from typing import Optional
 import re
-import tiktoken
+from constants import LanguageType, FuzzEntryFunctionMapping
+from agent_tools.code_tools.parsers.harness_analysis import get_harness_parser
+from utils.event_log import Stage, emit_event
+from utils.token_budget import fits
+
+# ```cpp ... ``` blocks, the language tag is optional
+FENCE_PATTERN = re.compile(r"```[\w+#.-]*[ \t]*\n(.*?)```", re.DOTALL)
 
 
 class CodeAnswerStruct(BaseModel):
@@ -13,16 +20,75 @@ class CodeAnswerStruct(BaseModel):
 
 class CodeFormatTool():
 
-    def __init__(self, llm: BaseChatModel, prompt: str):
+    def __init__(self, llm: BaseChatModel, prompt: str, project_lang: Optional[LanguageType] = None):
         self.llm = llm
         self.prompt = prompt
+        # without the language, every answer goes to the LLM extractor
+        self.project_lang = project_lang
+        # how often the local extractor is used vs the LLM fallback
+        self.stats: dict[str, int] = {"local": 0, "llm": 0}
+
+    def has_fuzz_entry(self, code: str, strict: bool) -> bool:
+        '''Check the code defines the fuzz entry. If strict, the code must also parse without errors.'''
+        assert self.project_lang is not None
+        entry_function = FuzzEntryFunctionMapping[self.project_lang]
+        if entry_function not in code:
+            return False
+        parser = get_harness_parser(self.project_lang)(None, code) # type: ignore
+        if strict and parser.tree.root_node.has_error:
+            return False
+        return parser.get_definition_node(entry_function) is not None
+
+    def local_extract(self, response: str) -> tuple[Optional[str], str]:
+        '''
+        Extract the code without LLM: the only fenced block if it has the fuzz entry, or the whole answer if it is plain code.
+        Returns:
+            tuple[Optional[str], str]: The code (None if failed), and the reason.
+        '''
+        if self.project_lang not in FuzzEntryFunctionMapping:
+            return None, "unsupported_language"
+
+        blocks = [block for block in FENCE_PATTERN.findall(response) if block.strip()]
+        # the code may be split over several blocks (e.g., the includes and the entry), or the other blocks are snippets
+        # of the explanation, leave it to the LLM
+        if len(blocks) > 1:
+            return None, "multiple_fences"
+        if blocks:
+            if self.has_fuzz_entry(blocks[0], strict=False):
+                return blocks[0], "fence"
+            return None, "no_entry_in_fence"
+
+        # no fence, the answer is either pure code or code mixed with prose
+        if self.has_fuzz_entry(response, strict=True):
+            return response, "plain"
+        return None, "no_fence"
 
     def extract_code(self, response: str) -> str:
+        '''Extract the code from the response, the LLM is only used if the local extractor fails'''
+
+        source_code, reason = self.local_extract(response) if self.project_lang else (None, "disabled")
+        if source_code is not None:
+            self.stats["local"] += 1
+            emit_event(Stage.CodeFormat, "extract", method="local", reason=reason)
+        else:
+            self.stats["llm"] += 1
+            emit_event(Stage.CodeFormat, "extract", method="llm", reason=reason)
+            source_code = self.llm_extract(response)
+
+        # remove the line number if exists
+        source_code = re.sub(r'^//\s+\d+:\s?', '', source_code, flags=re.MULTILINE)
+        # remove some useless string
+        source_code = source_code.replace("```cpp", "")
+        source_code = source_code.replace("```", "")
+        # if source_code and source_code.startswith("c\n"):
+            # source_code = source_code[1:]
+        return source_code
+
+    def llm_extract(self, response: str) -> str:
         '''Extract the code from the response with LLM'''
 
         extract_prompt = self.prompt.format(response=response)
-        enc = tiktoken.encoding_for_model("gpt-4o")
-        if len(enc.encode(extract_prompt)) > 2000:
+        if not fits(extract_prompt, 2000):
             # remove the first line until the error message is short enough
             print("Extract prompt is too long, remove the first line.")
 
@@ -31,12 +97,4 @@ class CodeFormatTool():
         # deal with the new line
         # if "\\n" in source_code:
             # source_code = source_code.replace("\\n", "\n")
-
-        # remove the line number if exists
-        source_code = re.sub(r'^//\s+\d+:\s?', '', source_code, flags=re.MULTILINE)
-        # remove some useless string
-        source_code = source_code.replace("```cpp", "")
-        source_code = source_code.replace("```", "")
-        # if source_code and source_code.startswith("c\n"):
-            # source_code = source_code[1:]
         return source_code
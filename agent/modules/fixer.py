@@ -1,15 +1,20 @@
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 import logging
-from typing import Callable, Any
+from typing import Callable, Any, Optional
 from utils.misc import save_code_to_file
 from pathlib import Path
 from utils.misc import fix_qwen_tool_calls, fix_claude_tool_calls
 from langgraph.graph import END # type: ignore
+from utils.event_log import Stage, emit_event, usage_fields
+from utils.timing import span
+from utils.rate_limiter import LLMRateLimiter, invoke_llm
+from utils.llm_cache import retry_attempt
 
 class CodeFixer:
     def __init__(self, runnable: BaseChatModel, max_fix: int, max_tool_call: int, save_dir: Path, 
-                    cache_dir: Path, code_callback:Callable[[str], str] , logger:logging.Logger, model_name: str = ""):
+                    cache_dir: Path, code_callback:Callable[[str], str] , logger:logging.Logger, model_name: str = "",
+                    rate_limiter: Optional[LLMRateLimiter] = None):
 
         self.runnable = runnable
         self.save_dir = save_dir
@@ -19,6 +24,8 @@ class CodeFixer:
         self.logger = logger
         self.max_tool_call = max_tool_call
         self.model_name = model_name
+        # None if the requests are not rate limited
+        self.rate_limiter = rate_limiter
         self.max_fix = max_fix
         self.tool_call_counter = 0
 
@@ -27,8 +34,10 @@ class CodeFixer:
         self.logger.info(f"Fix start for draft_fix{fix_counter}.")
         
         response = None # type: ignore
-        for _ in range(3):
-            response: BaseMessage = self.runnable.invoke(state["messages"])
+        for attempt in range(3):
+            with span("llm.fixer"), retry_attempt(attempt):
+                response: BaseMessage = invoke_llm(self.runnable, state["messages"], self.rate_limiter)
+            emit_event(Stage.Fixer, "llm", **usage_fields(response))
             if hasattr(response, 'invalid_tool_calls') and response.invalid_tool_calls: # type: ignore
                 # Choose the appropriate fix function based on model type
                 if self.model_name.startswith("anthropic"):
@@ -70,6 +79,7 @@ class CodeFixer:
             return {"messages": f"{END}. Empty code returned, stop fixing.", "fix_counter": fix_counter}
         new_save_name = "draft_fix{}.txt".format(fix_counter)
         save_code_to_file(source_code, self.save_dir / new_save_name)
+        emit_event(Stage.Fixer, "artifact", path=self.save_dir / new_save_name, fix_counter=fix_counter)
         # update the harness code
         return {"messages": ("assistant", source_code), "harness_code": source_code, "fix_counter": fix_counter}
 
@@ -12,6 +12,10 @@ from utils.docker_utils import DockerUtils
 from pathlib import Path
 from bench_cfg import BenchConfig
 from utils import introspector_utils
+from utils.run_ledger import RunLedger
+from utils.event_log import EventLog, Stage, EVENT_FILE, set_event_log
+from utils.profiler import RETRIEVER_PROFILE_DIR
+from utils.docker_tape import load_docker_tape, set_docker_tape
 
 class FuzzENV():
 
@@ -30,11 +34,22 @@ class FuzzENV():
         function_name = extract_name(function_signature, keep_namespace=True, language=self.benchcfg.language)
         function_name = function_name.replace("::", "_")  # replace namespace with underscore
 
+        self.ledger = RunLedger(self.benchcfg.save_root)
         if self.exist_workspace(function_name, n_run):
             self.early_exit_flag = True
             return
         self.save_dir = self.benchcfg.save_root / project_name.lower() / function_name.lower() / self.new_project_name
+        self.ledger.start_run(project_name, function_signature, function_name, n_run, self.save_dir)
         self.logger = self.setup_logging()
+        # typed events of this run, the nodes emit to the current event log
+        self.event_log = EventLog(self.save_dir / EVENT_FILE)
+        set_event_log(self.event_log)
+        # the docker calls of this run are recorded or replayed
+        self.docker_tape = load_docker_tape(self.benchcfg.docker_tape_mode, self.benchcfg.save_root, self.save_dir, self.benchcfg.docker_tape_dir,
+                                            project_name, function_name, n_run)
+        set_docker_tape(self.docker_tape)
+        if self.docker_tape is not None:
+            self.logger.info(f"Docker tape: {self.docker_tape.mode.value} {self.docker_tape.tape_file}")
 
         self.oss_tool = OSSFuzzUtils(self.benchcfg.oss_fuzz_dir, self.benchcfg.benchmark_dir, self.project_name, self.new_project_name)
         
@@ -42,11 +57,18 @@ class FuzzENV():
         self.project_lang = self.oss_tool.get_project_language()
 
         self.docker_tool = DockerUtils(self.benchcfg.oss_fuzz_dir, self.project_name, self.new_project_name, self.project_lang)
-        self.init_workspace()
+        with self.event_log.stage(Stage.Workspace, project=self.project_name, function_signature=function_signature, n_run=n_run):
+            self.init_workspace()
         
         self.eval_flag = eval_flag
         if not self.eval_flag:
-            self.code_retriever = CodeRetriever(self.benchcfg.oss_fuzz_dir, self.project_name, self.new_project_name, self.project_lang, self.benchcfg.usage_token_limit, self.benchcfg.cache_root, self.logger)
+            self.code_retriever = CodeRetriever(self.benchcfg.oss_fuzz_dir, self.project_name, self.new_project_name, self.project_lang, self.benchcfg.usage_token_limit, self.benchcfg.cache_root, self.logger,
+                                                mixed_timeout=self.benchcfg.mixed_retriever_timeout,
+                                                max_concurrent_exec=self.benchcfg.tool_concurrency,
+                                                debug_retriever_files=self.benchcfg.debug_retriever_files,
+                                                # the mirror reads would bypass the tape
+                                                src_mirror=self.benchcfg.src_mirror and self.docker_tape is None,
+                                                profile_retrievers=self.benchcfg.profile_retrievers)
             self.harness_pairs = self.get_all_harness_fuzzer_pairs(cache=self.benchcfg.use_cache_harness_pairs)
              # set the harness pairs in code retriever
             self.code_retriever.set_harness_pairs(self.harness_pairs)
@@ -80,6 +102,11 @@ class FuzzENV():
         '''Create the workspace for the project/function'''
 
         # skip existing project
+        if self.ledger.has_run(self.project_name, function_name, n_run):
+            print(f"Skip existing project: {self.project_name}/{function_name} run{n_run}")
+            return True
+
+        # runs that are not in the ledger (e.g., old output trees)
         function_dir = self.benchcfg.save_root / self.project_name.lower() / function_name.lower() 
         if function_dir.exists():
             for work_dir in function_dir.iterdir():
@@ -281,6 +308,11 @@ class FuzzENV():
             if not self.eval_flag:
                 self.code_retriever.remove_container()
 
+            # keep the profiles of the in-container retrievers before /out is removed
+            profile_dir = self.benchcfg.oss_fuzz_dir / "build" / "out" / self.new_project_name / RETRIEVER_PROFILE_DIR
+            if self.benchcfg.profile_retrievers and profile_dir.exists():
+                shutil.copytree(profile_dir, self.save_dir / RETRIEVER_PROFILE_DIR, dirs_exist_ok=True)
+
             # first remove the out directory
             self.docker_tool.clean_build_dir()
             
@@ -298,5 +330,6 @@ class FuzzENV():
                 # shutil.rmtree(corpus_dir)
         except:
             pass
+        self.event_log.close()
 
 
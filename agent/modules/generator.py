@@ -1,15 +1,20 @@
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 import logging
-from typing import Callable, Any
+from typing import Callable, Any, Optional
 from utils.misc import save_code_to_file
 from pathlib import Path
 from utils.misc import fix_qwen_tool_calls, fix_claude_tool_calls
 from langgraph.graph import END # type: ignore
+from utils.event_log import Stage, emit_event, usage_fields
+from utils.timing import span
+from utils.rate_limiter import LLMRateLimiter, invoke_llm
+from utils.llm_cache import retry_attempt
 
 class HarnessGenerator:
     def __init__(self, runnable: BaseChatModel, max_tool_call: int, continue_flag: bool, 
-                 save_dir: Path, code_callback: Callable[[str], str], logger: logging.Logger, model_name: str = ""):
+                 save_dir: Path, code_callback: Callable[[str], str], logger: logging.Logger, model_name: str = "",
+                 rate_limiter: Optional[LLMRateLimiter] = None):
 
         self.runnable = runnable
         self.save_dir = save_dir
@@ -20,12 +25,16 @@ class HarnessGenerator:
         self.continue_flag = continue_flag
         self.count_tool_call = 0 # count the number of tool calls
         self.model_name = model_name
+        # None if the requests are not rate limited
+        self.rate_limiter = rate_limiter
 
     def respond(self, state: dict[str, Any]) -> dict[str, Any]:
         # prompt is in the messages
         response = None # type: ignore
-        for _ in range(3):
-            response: BaseMessage = self.runnable.invoke(state["messages"])
+        for attempt in range(3):
+            with span("llm.generator"), retry_attempt(attempt):
+                response: BaseMessage = invoke_llm(self.runnable, state["messages"], self.rate_limiter)
+            emit_event(Stage.Generator, "llm", **usage_fields(response))
         
             if hasattr(response, 'invalid_tool_calls') and response.invalid_tool_calls: # type: ignore
                 # Choose the appropriate fix function based on model type
@@ -68,6 +77,7 @@ class HarnessGenerator:
             return {"messages": f"{END}. Empty code returned, stop generating."}
         # save source code to file
         save_code_to_file(full_source_code,  self.save_dir / "draft_fix0.txt")
+        emit_event(Stage.Generator, "artifact", path=self.save_dir / "draft_fix0.txt", fix_counter=0)
 
         self.logger.info(f"Generate Draft Code.")
         return {"messages": ("assistant", source_code), "harness_code": full_source_code, "fix_counter": 0}
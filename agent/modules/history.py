@@ -0,0 +1,125 @@
+import difflib
+import logging
+from typing import Any, Optional
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage, ToolMessage, SystemMessage
+from utils.event_log import Stage, emit_event
+from utils.token_budget import count_tokens_batch
+
+# lines of an old tool result kept in its summary
+SUMMARY_LINES = 6
+# lines of an old error message kept
+ERROR_LINES = 12
+
+
+def message_text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+class HistoryCompactor:
+    '''
+    Compact the message history before an LLM call when it exceeds the token budget.
+    The first prompt, the latest draft, the latest user message (error) and the results of the latest tool calls
+    are kept. From the oldest message on, older drafts become diffs against the next draft, older tool results
+    become a few lines (the retriever caches them, so calling the tool again is cheap) and older error messages
+    are cut, until the history fits the budget.
+    The compacted messages keep their ids, so add_messages replaces them in place.
+    '''
+
+    def __init__(self, token_budget: int, logger: Optional[logging.Logger] = None):
+        self.token_budget = token_budget
+        self.logger = logger
+
+    def protected_indexes(self, messages: list[BaseMessage]) -> set[int]:
+        protected = {0}
+        last_draft = last_user = last_tool_call = -1
+        for i, message in enumerate(messages):
+            if isinstance(message, SystemMessage):
+                protected.add(i)
+            elif isinstance(message, HumanMessage):
+                last_user = i
+            elif isinstance(message, AIMessage):
+                if message.tool_calls:
+                    last_tool_call = i
+                elif message_text(message).strip():
+                    last_draft = i
+        protected.update({last_draft, last_user})
+        if last_tool_call > last_draft:
+            # the results the model is waiting for: the tool messages right after the call, no draft has used them yet
+            i = last_tool_call + 1
+            while i < len(messages) and isinstance(messages[i], ToolMessage):
+                protected.add(i)
+                i += 1
+        return protected
+
+    def compact_draft(self, draft: str, newer_draft: Optional[str]) -> Optional[str]:
+        if newer_draft is None:
+            return None
+        diff = list(difflib.unified_diff(newer_draft.splitlines(), draft.splitlines(), "next_draft", "this_draft", n=1, lineterm=""))
+        compacted = "[Compacted draft, shown as a diff against the next draft]\n" + "\n".join(diff)
+        return compacted if len(compacted) < len(draft) else None
+
+    def compact_tool_result(self, message: ToolMessage, text: str) -> Optional[str]:
+        lines = text.splitlines()
+        if len(lines) <= SUMMARY_LINES:
+            return None
+        return "\n".join(lines[:SUMMARY_LINES]) + \
+            f"\n... [{len(lines) - SUMMARY_LINES} more lines omitted, call {message.name or 'the tool'} again to see the full result]"
+
+    def compact_error(self, text: str) -> Optional[str]:
+        lines = text.splitlines()
+        if len(lines) <= ERROR_LINES:
+            return None
+        return "\n".join(lines[:ERROR_LINES]) + f"\n... [{len(lines) - ERROR_LINES} more lines of the old error omitted]"
+
+    def compact(self, state: dict[str, Any]) -> dict[str, Any]:
+        """Graph node: returns the compacted messages (replaced by id), or no update if the history fits."""
+        messages: list[BaseMessage] = state["messages"]
+        if self.token_budget <= 0 or len(messages) < 3:
+            return {}
+
+        texts = [message_text(message) for message in messages]
+        tokens = count_tokens_batch(texts)
+        total = sum(tokens)
+        if total <= self.token_budget:
+            return {}
+
+        protected = self.protected_indexes(messages)
+        # the draft that follows each draft, to diff against
+        next_draft: dict[int, str] = {}
+        newer: Optional[str] = None
+        for i in range(len(messages) - 1, -1, -1):
+            message = messages[i]
+            if isinstance(message, AIMessage) and not message.tool_calls and texts[i].strip():
+                if newer is not None:
+                    next_draft[i] = newer
+                newer = texts[i]
+
+        replaced: list[BaseMessage] = []
+        replaced_tokens: list[tuple[int, str]] = []
+        for i, message in enumerate(messages):
+            if total <= self.token_budget:
+                break
+            if i in protected or message.id is None or texts[i].startswith("[Compacted"):
+                continue
+            compacted: Optional[str] = None
+            if isinstance(message, ToolMessage):
+                compacted = self.compact_tool_result(message, texts[i])
+            elif isinstance(message, AIMessage) and not message.tool_calls:
+                compacted = self.compact_draft(texts[i], next_draft.get(i))
+            elif isinstance(message, HumanMessage):
+                compacted = self.compact_error(texts[i])
+            if compacted is None:
+                continue
+            replaced.append(message.model_copy(update={"content": compacted}))
+            replaced_tokens.append((i, compacted))
+            # estimate with the length ratio, counted exactly below
+            total -= tokens[i] - tokens[i] * len(compacted) // max(len(texts[i]), 1)
+
+        if not replaced:
+            return {}
+        new_total = sum(tokens) - sum(tokens[i] for i, _ in replaced_tokens) + sum(count_tokens_batch([text for _, text in replaced_tokens]))
+        emit_event(Stage.History, "compact", messages=len(messages), compacted=len(replaced), tokens_before=sum(tokens),
+                   tokens_after=new_total, budget=self.token_budget)
+        if self.logger:
+            self.logger.info(f"Compacted {len(replaced)} of {len(messages)} messages: {sum(tokens)} -> {new_total} tokens.")
+        return {"messages": replaced}
@@ -0,0 +1,102 @@
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, MutableMapping
+from constants import LanguageType
+from utils.docker_utils import DockerUtils
+from utils.event_log import EventLog, EVENT_FILE, read_events
+
+DRAFT_DIR = "drafts"
+
+
+class DraftLogger(logging.LoggerAdapter): # type: ignore
+    '''Log to the run logger with the draft index in front of the message.'''
+
+    def process(self, msg: Any, kwargs: MutableMapping[str, Any]) -> tuple[Any, MutableMapping[str, Any]]:
+        return f"[draft{self.extra['draft']}] {msg}", kwargs # type: ignore
+
+
+class DraftWorkspace():
+    '''
+    The workspace of one speculative draft: a copy of the oss-fuzz project of the run (so the draft has its own image
+    and /out), a save dir under <save_dir>/drafts and its own event log. The drafts share the retriever container of the run.
+    The winner's files and events are merged into the save dir of the run, the workspaces of all drafts are removed.
+    A cancelled draft may still run a node in a worker thread (e.g., an LLM call), its workspace is removed after that node returns.
+    '''
+
+    def __init__(self, index: int, oss_fuzz_dir: Path, project_name: str, run_project_name: str, project_lang: LanguageType,
+                 run_save_dir: Path, temperature: float, example_window: int, logger: logging.Logger):
+        self.index = index
+        self.oss_fuzz_dir = oss_fuzz_dir
+        self.run_project_name = run_project_name
+        self.new_project_name = f"{run_project_name}_d{index}"
+        self.save_dir = run_save_dir / DRAFT_DIR / f"draft{index}"
+        self.temperature = temperature
+        self.example_window = example_window
+        self.logger = DraftLogger(logger, {"draft": index})
+        self.event_log = EventLog(self.save_dir / EVENT_FILE)
+        # set by the semantic check node when the harness of the draft passes
+        self.passed = threading.Event()
+        # stops the fuzzer of the draft when another draft wins
+        self.cancel_event = threading.Event()
+        # number of nodes of the draft running in worker threads
+        self.n_running = 0
+        self.idle = threading.Condition()
+        self.docker_tool = DockerUtils(oss_fuzz_dir, project_name, self.new_project_name, project_lang)
+
+    def track(self, node: Callable[[dict[str, Any]], dict[str, Any]]) -> Callable[[dict[str, Any]], dict[str, Any]]:
+        """Wrap a graph node to count it as running, so the workspace is not removed under it."""
+        def tracked(state: dict[str, Any]) -> dict[str, Any]:
+            with self.idle:
+                self.n_running += 1
+            try:
+                # the draft lost the race before its node started, the output is dropped anyway
+                if self.cancel_event.is_set():
+                    return {}
+                return node(state)
+            finally:
+                with self.idle:
+                    self.n_running -= 1
+                    self.idle.notify_all()
+        return tracked
+
+    def clean_when_idle(self) -> None:
+        """Remove the workspace now if no node of the draft is running, otherwise in a thread once the node returns."""
+        with self.idle:
+            running = self.n_running > 0
+        if not running:
+            self.clean()
+            return
+        self.logger.info("Remove the workspace after the running node returns")
+        # not a daemon, the process waits for the workspace to be removed before it exits
+        threading.Thread(target=self.clean_after_nodes, name=f"{self.new_project_name}_clean").start()
+
+    def clean_after_nodes(self) -> None:
+        with self.idle:
+            self.idle.wait_for(lambda: self.n_running == 0)
+        self.clean()
+
+    def create(self) -> None:
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        # the project of the run already has the modified Dockerfile, the image layers are shared by the docker cache
+        dst_path = self.oss_fuzz_dir / "projects" / self.new_project_name
+        if dst_path.exists():
+            shutil.rmtree(dst_path)
+        shutil.copytree(self.oss_fuzz_dir / "projects" / self.run_project_name, dst_path)
+
+    def merge_into(self, run_save_dir: Path, run_event_log: EventLog) -> None:
+        """Copy the files of the winning draft into the run dir and append its events to the run events."""
+        self.event_log.close()
+        shutil.copytree(self.save_dir, run_save_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(EVENT_FILE))
+        run_event_log.append_events(read_events(self.save_dir / EVENT_FILE), draft=self.index)
+
+    def clean(self) -> None:
+        self.event_log.close()
+        try:
+            self.docker_tool.clean_build_dir()
+            self.docker_tool.remove_image()
+            shutil.rmtree(self.oss_fuzz_dir / "projects" / self.new_project_name, ignore_errors=True)
+            shutil.rmtree(self.oss_fuzz_dir / "build" / "out" / self.new_project_name, ignore_errors=True)
+        except Exception as e:
+            self.logger.error(f"Failed to clean the draft workspace: {e}")
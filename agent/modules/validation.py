@@ -9,6 +9,7 @@ from agent_tools.fuzz_tools.run_fuzzer import FuzzerRunner
 from constants import ValResult
 from agent_tools.code_tools.parsers.cpp_parser import CPPParser
 from agent_tools.code_tools.parsers.c_parser import CParser
+from agent_tools.code_tools.parsers.harness_analysis import HarnessAnalysis
 from utils.misc import extract_name
 import json
 
@@ -27,6 +28,8 @@ class Validation(FuzzerRunner):
         super().__init__(oss_fuzz_dir, new_project_name, project_lang, run_timeout, save_dir)
         self.logger = logger
         self.parser = self.get_language_parser()
+        # keeps the tree of the last draft, each fix iteration only reparses the edited part
+        self.harness_analysis = HarnessAnalysis(project_lang, self.parser)
             
         
     def get_language_parser(self) -> Any:
@@ -46,14 +49,13 @@ class Validation(FuzzerRunner):
 
         # do static validation  first, if it fails, return directly
 
-        parser = self.parser(file_path=None, source_code=state.get("harness_code", ""))
-
+        harness_code = state.get("harness_code", "")
         function_name = extract_name(state.get("function_signature", ""), language=self.project_lang)
-        if parser.is_function_defined(function_name):
+        if self.harness_analysis.is_function_defined(harness_code, function_name):
             self.logger.info(f"The function {function_name} is defined in the harness code.")
             return {"messages": ("user", ValResult.Fake), "fuzz_msg": FUZZMSG.get(ValResult.Fake, "")}
         
-        if not parser.is_function_called(function_name):
+        if not self.harness_analysis.is_function_called(harness_code, function_name):
             self.logger.info(f"The function {function_name} is not called in the harness code.")
             return {"messages": ("user", ValResult.NoCall), "fuzz_msg": FUZZMSG.get(ValResult.NoCall, "")}
 
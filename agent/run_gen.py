@@ -1,5 +1,6 @@
 import os
 import signal
+import argparse
 import sys
 import time
 import yaml
@@ -10,8 +11,12 @@ from agent.gen import ISSTAFuzzer
 from agent_tools.results_analysis import run_agent_res
 from bench_cfg import BenchConfig
 import traceback  # Add this at the top
-import json
-from constants import LanguageType
+from constants import LanguageType, EvalResult
+from typing import Optional
+from utils.run_ledger import RunLedger, RunStatus
+from utils.event_log import Stage
+from utils.metrics import MetricsExporter
+from utils.profiler import profile_run
 
 class Runner:
     def __init__(self, cfg_path: str):
@@ -21,23 +26,12 @@ class Runner:
         """
         self.config = BenchConfig(cfg_path)
         self.cfg_path = cfg_path
+        self.ledger = RunLedger(self.config.save_root)
+        self.metrics_exporter: Optional[MetricsExporter] = None
         
     def get_successful_func(self) -> list[str]:
-    
-        all_success_sig: list[str] = []
-        for i in range(1, self.config.iterations):
-
-            res_file = os.path.join(self.config.save_root, f"success_functions_{i}.json")
-            if not os.path.exists(res_file):
-                continue
-
-            with open(res_file, "r") as f:
-                success_data = json.load(f)
-                for proj_func in success_data.keys():
-                    _, func = proj_func.split("+")
-                    all_success_sig.append(func)
-
-        return all_success_sig
+        # functions that succeeded in any previous iteration
+        return self.ledger.get_successful_functions(EvalResult.Success.value, self.config.iterations)
 
 
     def filter_functions(self, function_dict: dict[str, list[str]], success_func: list[str]) -> dict[str, list[str]]:
@@ -70,34 +64,31 @@ class Runner:
         """Run the fuzzer on a single function."""
 
         agent_fuzzer = ISSTAFuzzer(config, function_signature, project_name, n_run=n_run)
+        if agent_fuzzer.early_exit_flag:
+            return
+        run_status = RunStatus.Finished
+        agent_fuzzer.event_log.emit(Stage.Run, "start", project=project_name, function_signature=function_signature, n_run=n_run)
         try:
         # Your main logic here
-            graph = agent_fuzzer.build_graph()
-            agent_fuzzer.run_graph(graph)
+            with profile_run(agent_fuzzer.save_dir, config.profile_mode):
+                graph = agent_fuzzer.build_graph()
+                agent_fuzzer.run_graph(graph)
 
         except Exception as e:
             agent_fuzzer.logger.error(f"Exit. An exception occurred: {e}")
             traceback.print_exc() 
+            run_status = RunStatus.Error
+            agent_fuzzer.event_log.emit(Stage.Run, "error", error=str(e))
         finally:
+            agent_fuzzer.event_log.emit(Stage.Run, "end", status=run_status)
             agent_fuzzer.clean_workspace()
+            agent_fuzzer.ledger.finish_run(agent_fuzzer.save_dir, run_status)
     
 
     def has_run(self, function_signature: str, project_name: str, n_run: int, language: LanguageType) -> bool:
         function_name = extract_name(function_signature, keep_namespace=True, language=language)
         function_name = function_name.replace("::", "_")  # replace namespace with underscore
-        save_dir = self.config.save_root / project_name.lower() / function_name.lower() 
-        
-        if not save_dir.exists():
-            return False
-        
-        run_flag = False
-        for path in save_dir.iterdir():  # ensure the directory exists
-            if path.name.startswith(f"run{n_run}"):
-                # print(f"Skipping {function_name} in {project_name} for run {n_run}, already exists.")
-                run_flag = True
-                break
-
-        return run_flag
+        return self.ledger.has_run(project_name, function_name, n_run)
 
     def run_all(self, max_num_function: int, function_dict: dict[str, list[str]],
                  n_run: int=1, language: LanguageType=LanguageType.CPP):
@@ -106,6 +97,8 @@ class Runner:
         with Pool(processes=self.config.num_processes) as pool:
             
             count = 0
+            if self.metrics_exporter:
+                self.metrics_exporter.set_iteration(n_run, count)
             for i in range(max_num_function):
                 for key in function_dict.keys():
                     if i >= len(function_dict[key]):
@@ -122,6 +115,8 @@ class Runner:
                     count += 1
 
             print(f"Iteration {n_run} of {self.config.iterations}: {count} functions to run")
+            if self.metrics_exporter:
+                self.metrics_exporter.set_iteration(n_run, count)
  
             pool.close()
             pool.join()
@@ -145,6 +140,14 @@ class Runner:
                                                  language=self.config.language)
 
        
+        # record the runs of an existing output tree, the scheduling only queries the ledger
+        n_imported = self.ledger.import_tree()
+        if n_imported:
+            print(f"Imported {n_imported} existing runs into {self.ledger.db_path}")
+
+        self.metrics_exporter = MetricsExporter(self.config.save_root, interval=self.config.metrics_interval)
+        self.metrics_exporter.start()
+
         start_time = time.time()
         for i in range(self.config.iterations):
             iter_res = self.config.save_root / "res_{}.txt".format(i+1)
@@ -162,8 +165,10 @@ class Runner:
         
             self.run_all(max_num_function, todo_function_dicts, n_run=i+1, language=self.config.language)
 
-            run_agent_res(self.config.save_root, semantic_mode="eval", n_run=i+1, language=self.config.language)
+            run_agent_res(self.config.save_root, semantic_mode="eval", n_run=i+1, language=self.config.language,
+                          num_workers=self.config.num_processes)
 
+        self.metrics_exporter.stop()
         print(f"Total time taken: {time.time()-start_time:.2f} seconds")
 
     # def run_single(self):
@@ -198,8 +203,16 @@ if __name__ == "__main__":
         # "/home/yk/code/LLM-reasoning-agents/cfg/gpt5_mini/c_study/gpt5_mini_basic+header+ossfuzz.yaml"
         "/home/yk/code/LLM-reasoning-agents/cfg/gpt5_mini/projects/gpt5_mini_agent_mosquitto.yaml"
     ]
-    for config_path in cfg_list:
+    parser = argparse.ArgumentParser(description="Run the fuzz driver generation agent.")
+    parser.add_argument("--config", type=str, nargs="+", default=cfg_list, help="The yaml config files.")
+    parser.add_argument("--profile", type=str, choices=["cprofile", "sampling"], default=None,
+                        help="Profile every run, overrides profile_mode of the configs.")
+    args = parser.parse_args()
+
+    for config_path in args.config:
         runner = Runner(config_path)
+        if args.profile:
+            runner.config.profile_mode = args.profile
 
         # Set up signal handling for graceful termination6
         def signal_handler(sig, frame): # type: ignore
@@ -5,13 +5,29 @@ import json
 import logging
 from constants import LSPResults, Retriever, DockerResults
 from pathlib import Path
-from typing import Callable, Any
+from typing import Callable, Any, Union, Optional
 import functools
 import re
 from utils.misc import add_lineno_to_code, filter_examples, extract_name, kill_process
 import time
 import random
+import shlex
+import os
 import subprocess as sp
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from agent_tools.code_tools.retriever_protocol import parse_result
+from agent_tools.source_mirror import SourceMirror
+from utils.timing import timed, span
+from utils.event_log import Stage, emit_event
+from utils.profiler import RETRIEVER_PROFILE_DIR
+
+# seconds between the mixed deadline and the exec timeout of the LSP retriever
+MIXED_DEADLINE_MARGIN = 10
+# set while a mixed query holds its exec slot, its paired LSP and parser execs do not take another one
+_exec_slot_held: contextvars.ContextVar[bool] = contextvars.ContextVar("exec_slot_held", default=False)
 
 def catch_exception(func: Callable[..., list[dict[str, Any]]]) -> Callable[..., list[dict[str, Any]]]:
     @functools.wraps(func)
@@ -36,7 +52,9 @@ class CodeRetriever():
     '''
 
     def __init__(self, oss_fuzz_dir: Path, project_name: str, new_project_name: str, 
-                 project_lang: LanguageType, usage_token_limit: int, cache_dir: Path, logger: logging.Logger):
+                 project_lang: LanguageType, usage_token_limit: int, cache_dir: Path, logger: logging.Logger,
+                 mixed_timeout: int = 45, max_concurrent_exec: int = 1, debug_retriever_files: bool = False,
+                 src_mirror: bool = True, profile_retrievers: bool = False):
 
         self.oss_fuzz_dir = oss_fuzz_dir
         self.project_name = project_name
@@ -45,6 +63,18 @@ class CodeRetriever():
         self.usage_token_limit = usage_token_limit
         self.cache_dir = cache_dir
         self.logger = logger
+        # deadline (seconds) for the LSP retriever in mixed mode, the parser result is used after it
+        self.mixed_timeout = mixed_timeout
+        # run the LSP and parser retrievers concurrently in mixed mode
+        self.retriever_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"{new_project_name}_retriever")
+        # limit the number of docker exec running at the same time in the retriever container
+        self.exec_slots = threading.BoundedSemaphore(max_concurrent_exec)
+        # the retrievers return results on stdout, if True they also dump the result into /out for debugging
+        self.debug_retriever_files = debug_retriever_files
+        # if True, every retriever call dumps a cProfile file into /out/retriever_profiles
+        self.profile_retrievers = profile_retrievers
+        # the workdir of the image, resolved once on the first retriever call
+        self.workdir = ""
         self.docker_tool = DockerUtils(self.oss_fuzz_dir, self.project_name, self.new_project_name, self.project_lang)
         # Start and keep the container running
         for _ in range(3):
@@ -55,31 +85,55 @@ class CodeRetriever():
         assert not self.container_id.startswith(DockerResults.Error.value), f"Failed to start container: {self.container_id}"
         # run 
         if self.project_lang in [LanguageType.C, LanguageType.CPP]:
-            res = self.docker_tool.exec_in_container(self.container_id, ["bear compile"], timeout=1200)
+            with span("retriever.bear_compile"):
+                res = self.docker_tool.exec_in_container(self.container_id, ["bear compile"], timeout=1200)
             self.logger.info(f"bear res: {res.splitlines()[-2:]}")
             if res.startswith(DockerResults.Error.value):
                 self.remove_container()
                 self.logger.error(f"Failed to run bear compile: {res}")
                 raise Exception(f"Failed to run bear compile: {res}")
 
+        # read-only local copy of /src for view_code and file lookups, exported after bear to include generated files
+        self.source_mirror = SourceMirror(self.cache_dir / "src_mirror" / self.project_name, self.logger)
+        self.driver_examples: Optional[list[tuple[str, str]]] = None
+        if src_mirror:
+            try:
+                if not self.source_mirror.build(self.docker_tool, self.container_id):
+                    self.logger.warning("Failed to export /src, read the source code from the container")
+            except Exception as e:
+                self.logger.warning(f"Failed to build the source mirror, read the source code from the container: {e}")
+
     def set_harness_pairs(self, harness_pairs: dict[str, Path]) -> None:
         self.harness_pairs = harness_pairs
+        self.driver_examples = None
 
     def gen_file_name(self, symbol_name: str, lsp_function: LSPFunction, retriever: Retriever) -> str:
         if lsp_function == LSPFunction.StructFunctions:
             file_name = f"{Path(symbol_name).stem}_{lsp_function.value}_{retriever.value}.json"
         else:
-            file_name = f"{symbol_name}_{lsp_function.value}_{retriever.value}.json"
+            # symbols like operator/ are not valid file names
+            file_name = f"{symbol_name.replace(os.sep, '_')}_{lsp_function.value}_{retriever.value}.json"
         return file_name
     
     def remove_container(self):
         # Ensure the container is stopped when the object is deleted
+        self.retriever_pool.shutdown(wait=False, cancel_futures=True)
         try:
             if hasattr(self, "container_id") and self.container_id:
                 self.docker_tool.remove_container(self.container_id)
         except Exception as e:
             self.logger.error(f"Error stopping container: {e}")
 
+    def exec_in_container(self, cmd: Union[list[str], str], timeout: int = 60) -> str:
+        """
+        Execute a command in the retriever container.
+        At most max_concurrent_exec commands (or mixed queries) run at the same time, the others wait for a free slot.
+        """
+        if _exec_slot_held.get():
+            return self.docker_tool.exec_in_container(self.container_id, cmd, timeout=timeout)
+        with self.exec_slots:
+            return self.docker_tool.exec_in_container(self.container_id, cmd, timeout=timeout)
+
     def get_file_location_tool(self, file_path: str) -> list[str]:
         """
         Get the absolute path of a file in the project codebase.
@@ -92,9 +146,14 @@ class CodeRetriever():
         new_path = Path(file_path).resolve(strict=False)  
         path_name = new_path.name
 
+        # the mirror keeps an index of all file names in /src
+        abs_paths = self.source_mirror.find(path_name)
+        if abs_paths is not None:
+            return abs_paths
+
         # find in container
         find_cmd = f"find /src -name {path_name}"
-        result = self.docker_tool.exec_in_container(self.container_id, find_cmd)
+        result = self.exec_in_container(find_cmd)
         if result.startswith(DockerResults.Error.value):
             self.logger.error(f"Failed to find file in container: {result}")
             return []
@@ -121,14 +180,21 @@ class CodeRetriever():
         Returns:
             list[tuple[str, str]]: A list of tuples containing harness file names and their content.
         """
+        # the harness files in the image do not change during a run
+        if self.driver_examples is not None:
+            return self.driver_examples
+
         driver_list: list[tuple[str, str]] = []
         end_line = 2000
         for _, harness_path in self.harness_pairs.items():
-            read_cmd = f"sed -n '1,{end_line}p' {harness_path}"
-            result = self.docker_tool.exec_in_container(self.container_id, read_cmd)
-            if "sed: " in result:
-                continue
+            result = self.source_mirror.read_lines(str(harness_path), 1, end_line)
+            if result is None:
+                read_cmd = f"sed -n '1,{end_line}p' {harness_path}"
+                result = self.exec_in_container(read_cmd)
+                if "sed: " in result or result.startswith(DockerResults.Error.value):
+                    continue
             driver_list.append((harness_path.name, add_lineno_to_code(result, start_lineno=1)))
+        self.driver_examples = driver_list
         return driver_list
     
 
@@ -189,8 +255,13 @@ class CodeRetriever():
                 kill_process(process)
                 return f"Error reading harness file {local_harness_path}: {e}"
 
+        # read from the local mirror first
+        result = self.source_mirror.read_lines(str(new_file_path), start_line, end_line)
+        if result is not None:
+            return add_lineno_to_code(result, start_lineno=start_line) if num_flag else result
+
         # Use exec_in_container instead of run_cmd
-        result = self.docker_tool.exec_in_container(self.container_id, read_cmd)
+        result = self.exec_in_container(read_cmd)
         if "sed: " in result:
             self.logger.warning(result)
             return f"There is no such file {file_path} in the project."
@@ -200,12 +271,23 @@ class CodeRetriever():
         return result
 
 
+    def retriever_timeout(self, lsp_function: LSPFunction) -> int:
+        """The timeout (seconds) of one in-container retriever call."""
+        if lsp_function == LSPFunction.AllSymbols:
+            return 300  # Increase timeout for all symbols:
+        elif self.project_lang == LanguageType.JAVA:
+            return 120  # Increase timeout for Java
+        return 60  # Default timeout for other functions
+
     @catch_exception
     def call_container_code_retriever(self, symbol_name: str, lsp_function: LSPFunction, retriever: Retriever) -> list[dict[str, Any]]:
 
-        compile_out_path = self.oss_fuzz_dir / "build" / "out" / self.new_project_name
-        compile_out_path.mkdir(parents=True, exist_ok=True)
-        workdir = self.docker_tool.run_cmd(["pwd"], volumes=None).strip()
+        if not self.workdir:
+            workdir = self.docker_tool.run_cmd(["pwd"], volumes=None).strip()
+            if workdir.startswith(DockerResults.Error.value):
+                self.logger.error(f"Failed to get the workdir of the image: {workdir}")
+                return []
+            self.workdir = workdir
         if retriever == Retriever.LSP:
             pyfile = "lsp_code_retriever"
         elif retriever == Retriever.Parser:
@@ -215,33 +297,26 @@ class CodeRetriever():
             self.logger.error(f"Error: {retriever} is not supported")
             return []
 
-        cmd_list = ["python", "-m", f"agent_tools.code_tools.{pyfile}", "--project", self.project_name, "--workdir", workdir, "--lsp-function", lsp_function.value,
-                    "--symbol-name", symbol_name, "--lang", self.project_lang.value]
+        cmd_list = ["python", "-m", f"agent_tools.code_tools.{pyfile}", "--project", self.project_name, "--workdir", self.workdir, "--lsp-function", lsp_function.value,
+                    "--symbol-name", shlex.quote(symbol_name), "--lang", self.project_lang.value]
+        if self.debug_retriever_files:
+            cmd_list.append("--debug-file")
+        if self.profile_retrievers:
+            cmd_list += ["--profile-dir", f"/out/{RETRIEVER_PROFILE_DIR}"]
 
         # Use exec_in_container instead of run_cmd
-        if lsp_function == LSPFunction.AllSymbols:
-            timeout = 300  # Increase timeout for all symbols:
-        elif self.project_lang == LanguageType.JAVA:
-            timeout = 120  # Increase timeout for Java
-        else:
-            timeout = 60  # Default timeout for other functions
-
-        res_str = self.docker_tool.exec_in_container(self.container_id, cmd_list, timeout=timeout)
+        res_str = self.exec_in_container(cmd_list, timeout=self.retriever_timeout(lsp_function))
         self.logger.info(f"Calling {retriever}_code_retriever to get {lsp_function} for {symbol_name}")
 
         if res_str.startswith(DockerResults.Error.value):
             self.logger.error(f"Docker Error in when calling {retriever}_code_retriever: {res_str}")
             return []
 
-        file_name = self.gen_file_name(symbol_name, lsp_function, retriever)
-        save_path = compile_out_path / file_name
-        if not save_path.exists():
-            self.logger.error(f"Retriever Error: {retriever}_code_retriever does not generate the response file: {save_path}")
+        # the retriever returns the result as a frame on stdout
+        res_json = parse_result(res_str)
+        if res_json is None:
+            self.logger.error(f"Retriever Error: {retriever}_code_retriever does not return a result frame: {res_str[-500:]}")
             return []
-        
-        # read code retriver response
-        with open(save_path, "r") as f:
-            res_json = json.load(f)
 
         msg, lsp_resp = res_json["message"], res_json["response"]
 
@@ -330,6 +405,7 @@ class CodeRetriever():
         return False
     
     @catch_exception
+    @timed("retriever.get_symbol_info")
     def get_symbol_info(self, symbol_name: str, lsp_function: LSPFunction, retriever: Retriever = Retriever.Mixed) -> list[dict[str, Any]]:
         """
         Retrieves the declaration information of a given symbol using the Language Server Protocol (LSP).
@@ -350,11 +426,7 @@ class CodeRetriever():
             self.logger.error("Error: symbol_name is empty!")
             return []
         if retriever == Retriever.Mixed:
-            start = time.time()
-            resp = self.get_symbol_info_retriever(symbol_name, lsp_function, Retriever.LSP)
-            print(f"get_symbol_info_retriever for {symbol_name} took {time.time() - start:.2f} seconds")
-            if not resp:
-                resp = self.get_symbol_info_retriever(symbol_name, lsp_function, Retriever.Parser)
+            resp = self.get_symbol_info_mixed(symbol_name, lsp_function)
         else:
             resp = self.get_symbol_info_retriever(symbol_name, lsp_function, retriever)
         
@@ -398,6 +470,53 @@ class CodeRetriever():
 
         return deduped_resp  # No declaration found
 
+    def get_symbol_info_mixed(self, symbol_name: str, lsp_function: LSPFunction) -> list[dict[str, Any]]:
+        """
+        Run the LSP and parser retrievers concurrently for the same query.
+        The LSP result is used when it is non-empty, otherwise the parser result is used.
+        The LSP retriever is only waited for up to self.mixed_timeout seconds, and always less than its exec timeout,
+        so the deadline fires before the exec is killed.
+        The query takes one exec slot for both retrievers, so they run concurrently even with max_concurrent_exec=1.
+        Args:
+            symbol_name (str): The name of the symbol.
+            lsp_function (LSPFunction): The information to retrieve.
+        Returns:
+             list[dict]: [{"source_code":"", "file_path":"", "line":""}]
+        """
+        if _exec_slot_held.get():
+            return self.mixed_query(symbol_name, lsp_function)
+        with self.exec_slots:
+            return self.mixed_query(symbol_name, lsp_function)
+
+    def mixed_query(self, symbol_name: str, lsp_function: LSPFunction) -> list[dict[str, Any]]:
+        start = time.time()
+        # run in a copy of the current context, so the spans of the retrievers go to the event log of this run,
+        # and the execs of the pair run in the slot of this query
+        token = _exec_slot_held.set(True)
+        try:
+            lsp_future = self.retriever_pool.submit(contextvars.copy_context().run, self.get_symbol_info_retriever, symbol_name, lsp_function, Retriever.LSP)
+            parser_future = self.retriever_pool.submit(contextvars.copy_context().run, self.get_symbol_info_retriever, symbol_name, lsp_function, Retriever.Parser)
+        finally:
+            _exec_slot_held.reset(token)
+
+        deadline = min(self.mixed_timeout, self.retriever_timeout(lsp_function) - MIXED_DEADLINE_MARGIN)
+        try:
+            resp = lsp_future.result(timeout=deadline)
+        except FutureTimeoutError:
+            # the LSP keeps running in the background (until its exec timeout) and its response is still cached when it finishes
+            self.logger.warning(f"LSP retriever exceeds {deadline}s for {symbol_name}, use the parser result")
+            resp = []
+
+        if resp:
+            # no need to wait for the parser, only drop it if it has not started yet
+            parser_future.cancel()
+            self.logger.info(f"Mixed retriever uses LSP result for {symbol_name}, took {time.time() - start:.2f} seconds")
+            return resp
+
+        resp = parser_future.result()
+        self.logger.info(f"Mixed retriever uses parser result for {symbol_name}, took {time.time() - start:.2f} seconds")
+        return resp
+
     @catch_exception
     def get_symbol_info_retriever(self, symbol_name: str, lsp_function: LSPFunction, retriever: Retriever = Retriever.LSP) -> list[dict[str, Any]]:
         """
@@ -412,9 +531,11 @@ class CodeRetriever():
         # get the lsp response from the cache if it exists
         if save_path.exists():
             self.logger.info(f"Getting {lsp_function} for {symbol_name} from cache")
+            emit_event(Stage.Cache, "lookup", cache="retrieval", hit=True)
             with open(save_path, "r") as f:
                 resp = json.load(f)
                 return resp # return the cached response
+        emit_event(Stage.Cache, "lookup", cache="retrieval", hit=False)
         
         # call the container code retriever
         lsp_resp = self.call_container_code_retriever(symbol_name, lsp_function, retriever)
@@ -494,15 +615,11 @@ class CodeRetriever():
             return stdlib_header
 
         # Continue with regular lookup process for non-standard library symbols
-        all_headers: set[str] = set()
-        all_headers: set[str] = self.get_header_helper(symbol_name, Retriever.LSP, LSPFunction.Declaration, forward=True)
-        if not all_headers:
-            all_headers: set[str] = self.get_header_helper(symbol_name, Retriever.Parser, LSPFunction.Declaration, forward=True)
+        # in mixed mode, each lookup runs the LSP and parser retrievers concurrently
+        all_headers: set[str] = self.get_header_helper(symbol_name, retriever, LSPFunction.Declaration, forward=True)
         # no need to forward for function definition
         if not all_headers:
-            all_headers: set[str] = self.get_header_helper(symbol_name, Retriever.LSP, LSPFunction.Definition, forward=False)
-        if not all_headers:
-            all_headers: set[str] = self.get_header_helper(symbol_name, Retriever.Parser, LSPFunction.Definition, forward=False)
+            all_headers: set[str] = self.get_header_helper(symbol_name, retriever, LSPFunction.Definition, forward=False)
         if not all_headers:
             self.logger.warning(f"No header for symbol {symbol_name} found!")
             return LSPResults.NoResult.value + f". No header for symbol {symbol_name} found!" # No header found
@@ -781,4 +898,23 @@ class CodeRetriever():
         return self.get_symbol_references(symbol_name, Retriever.Mixed)
     def get_struct_related_functions_tool(self, symbol_name: str) -> str:
         return self.get_struct_related_functions(symbol_name, Retriever.Mixed)
-  
\ No newline at end of file
+  
+
+    # async variants of the tools, used by the ToolNode to run the tool calls of one turn concurrently.
+    # the docker SDK is blocking, so each call runs in a worker thread and is limited by self.exec_slots
+    async def aget_symbol_header_tool(self, symbol_name: str) -> str:
+        return await asyncio.to_thread(self.get_symbol_header_tool, symbol_name)
+    async def aget_symbol_declaration_tool(self, symbol_name: str) -> str:
+        return await asyncio.to_thread(self.get_symbol_declaration_tool, symbol_name)
+    async def aget_symbol_definition_tool(self, symbol_name: str) -> str:
+        return await asyncio.to_thread(self.get_symbol_definition_tool, symbol_name)
+    async def aget_symbol_references_tool(self, symbol_name: str) -> str:
+        return await asyncio.to_thread(self.get_symbol_references_tool, symbol_name)
+    async def aget_struct_related_functions_tool(self, symbol_name: str) -> str:
+        return await asyncio.to_thread(self.get_struct_related_functions_tool, symbol_name)
+    async def aget_file_location_tool(self, file_path: str) -> list[str]:
+        return await asyncio.to_thread(self.get_file_location_tool, file_path)
+    async def aget_driver_example_tool(self) -> str:
+        return await asyncio.to_thread(self.get_driver_example_tool)
+    async def aview_code(self, file_path: str, lineno: int, context_window: int=100, num_flag: bool=True) -> str:
+        return await asyncio.to_thread(self.view_code, file_path, lineno, context_window, num_flag)
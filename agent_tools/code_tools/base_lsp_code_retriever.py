@@ -3,6 +3,7 @@ from agent_tools.code_tools.lsp_clients.multi_lsp_client import MultilspyClient
 from agent_tools.code_tools.parsers.c_parser import CParser
 from agent_tools.code_tools.parsers.cpp_parser import CPPParser
 from agent_tools.code_tools.parsers.java_parser import JavaParser
+from agent_tools.code_tools.parsers.parser_cache import get_file_parser
 from agent_tools.code_tools.parsers.python_parser import PythonParser
 from constants import LanguageType, LSPFunction, LSPResults
 from typing import Any
@@ -41,7 +42,7 @@ class BaseLSPCodeRetriever():
     def fectch_code(self, file_path: str, start_line: int, lsp_function: LSPFunction) -> list[dict[str, Any]]:
 
         query_key = ""
-        parser = self.lang_parser(Path(file_path), source_code=None)
+        parser = get_file_parser(self.lang_parser, Path(file_path))
         if lsp_function == LSPFunction.References:
             # get the full source code of the symbol
             source_code = parser.get_ref_source(self.symbol_name, start_line) # type: ignore
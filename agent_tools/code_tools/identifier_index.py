@@ -0,0 +1,65 @@
+import os
+import re
+import json
+from collections import Counter
+from pathlib import Path
+
+# the same file types as the old grep --include list
+INDEXED_EXTENSIONS = (".c", ".cpp", ".cc", ".h", ".hpp", ".hxx", ".java")
+SKIPPED_DIRS = {".git", ".svn", ".hg"}
+# an identifier directly followed by "(", i.e., calls and declarations
+CALL_PATTERN = re.compile(rb"([A-Za-z_][A-Za-z0-9_]*)\(")
+# the retriever runs as a new process for each query, keep the index on disk for the life of the container
+DEFAULT_INDEX_PATH = Path("/tmp/agent_tools_cache/identifier_index.json")
+
+
+class IdentifierIndex():
+    '''
+    Frequency of "name(" for every identifier in the source tree.
+    It is built with a single scan, so ranking functions by usage is a dictionary lookup instead of a grep per function.
+    '''
+
+    def __init__(self, counts: dict[str, int]):
+        self.counts = counts
+
+    @classmethod
+    def build(cls, root: str) -> "IdentifierIndex":
+        counter: Counter[bytes] = Counter()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIPPED_DIRS]
+            for file_name in filenames:
+                if not file_name.endswith(INDEXED_EXTENSIONS):
+                    continue
+                try:
+                    with open(os.path.join(dirpath, file_name), "rb") as f:
+                        counter.update(CALL_PATTERN.findall(f.read()))
+                except OSError:
+                    continue
+        return cls({name.decode("utf-8", errors="ignore"): n for name, n in counter.items()})
+
+    @classmethod
+    def load_or_build(cls, root: str = "/src", index_path: Path = DEFAULT_INDEX_PATH) -> "IdentifierIndex":
+        try:
+            with open(index_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("root") == root:
+                return cls(cached["counts"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(root)
+        try:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temp file first, other retriever processes may read the index at the same time
+            tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}")
+            with open(tmp_path, "w") as f:
+                json.dump({"root": root, "counts": index.counts}, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"Failed to save identifier index: {e}")
+        return index
+
+    def count(self, function_name: str) -> int:
+        # qualified names like ns::func are counted by the last part
+        name = function_name.split("::")[-1].split(".")[-1]
+        return self.counts.get(name, 0)
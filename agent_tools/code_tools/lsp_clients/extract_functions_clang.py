@@ -9,7 +9,9 @@ Outputs simplified JSON with: function name, namespace::class, file location, li
 import json
 import os
 import sys
-from typing import Dict, List, Set, Optional
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Set, Optional
 from pathlib import Path
 from dataclasses import dataclass, asdict
 import clang.cindex
@@ -18,6 +20,11 @@ from clang.cindex import CursorKind, Index, TranslationUnit
 from clang.cindex import Index, CursorKind, Config
 Config.set_library_file('/usr/local/lib/python3.11/site-packages/clang/native/libclang.so') 
 
+# the retriever runs as a new process for each query, keep the extraction results for the life of the container
+DEFAULT_CACHE_DIR = "/tmp/agent_tools_cache"
+# save the incremental cache every N parsed translation units, so a retry after a timeout can resume
+CACHE_SAVE_INTERVAL = 50
+
 @dataclass
 class FunctionInfo:
     """Simplified function information"""
@@ -31,16 +38,29 @@ class FunctionInfo:
 class LibclangExtractor:
     """Simplified C++ function extractor using libclang and compile_commands.json"""
     
-    def __init__(self, project_root: str, project_name: str = ""):
+    def __init__(self, project_root: str, project_name: str = "", num_workers: Optional[int] = None,
+                 incremental: bool = True, cache_dir: str = DEFAULT_CACHE_DIR):
         """
         Initialize the function extractor
         
         Args:
             project_root: Root directory of the project to filter functions
+            num_workers: Number of processes to parse translation units, default is the number of CPUs
+            incremental: Only re-parse translation units whose command, file or included project headers changed since the last extraction
+            cache_dir: Directory of the incremental cache
         """
         self.project_root = str(Path(project_root).resolve())
         self.project_name = project_name
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.incremental = incremental
+        self.cache_dir = cache_dir
         self.extracted_functions: Dict[str, FunctionInfo] = {}
+        # keys in extracted_functions that come from a definition
+        self.definition_keys: Set[str] = set()
+        # file path -> lines, the same header is read for every function it declares
+        self.file_lines: Dict[str, List[str]] = {}
+        # the project headers included by the last parsed translation unit
+        self.last_includes: Set[str] = set()
         self.index = Index.create()
     
     def _get_namespace_class(self, cursor) -> str:
@@ -106,9 +126,10 @@ class LibclangExtractor:
             
             # Read the file and extract the relevant lines
             file_path = str(start.file)
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                lines = content.splitlines(keepends=True)
+            if file_path not in self.file_lines:
+                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    self.file_lines[file_path] = f.read().splitlines(keepends=True)
+            lines = self.file_lines[file_path]
             
             # Check if this is a function definition (has body) or declaration
             is_definition = cursor.is_definition()
@@ -224,6 +245,8 @@ class LibclangExtractor:
             is_definition = cursor.is_definition()
             if key not in self.extracted_functions or is_definition:
                 self.extracted_functions[key] = func_info
+            if is_definition:
+                self.definition_keys.add(key)
         
         for child in cursor.get_children():
             self._traverse_ast(child)
@@ -276,11 +299,16 @@ class LibclangExtractor:
         ]
 
         # Parse with compile_commands.json arguments
+        # the TU is only read, not compiled, so skip the end-of-TU work; function bodies are not needed for headers
+        if header_flag:
+            options = TranslationUnit.PARSE_SKIP_FUNCTION_BODIES | TranslationUnit.PARSE_INCOMPLETE
+        else:
+            options = TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD | TranslationUnit.PARSE_INCOMPLETE
         try:
             translation_unit = self.index.parse(
                 file_path,
                 args=enhanced_args,
-                options=TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+                options=options
             )
         except Exception as e:
             print(f"Error parsing {file_path}: {e}")
@@ -301,6 +329,8 @@ class LibclangExtractor:
             return user_headers
 
         if translation_unit:
+            self.last_includes = {os.path.normpath(inclusion.include.name) for inclusion in translation_unit.get_includes()
+                                  if not inclusion.include.name.startswith("/usr")}
             # Check for diagnostics (errors/warnings)
             diagnostics = list(translation_unit.diagnostics)
             if diagnostics:
@@ -370,24 +400,128 @@ class LibclangExtractor:
     def get_all_functions(self, compile_db_path: str):
         """Process all files from compile_commands.json"""
         compile_db = self.load_compile_commands(compile_db_path)
-        
+        results = self._extract_all(compile_db, header_flag=False)
+
+        # merge in the order of compile_commands.json, prefer definitions over declarations like _traverse_ast
+        self.extracted_functions = {}
+        self.definition_keys = set()
         for src_file in compile_db:
-            directory, args = compile_db[src_file]
-            self.analyze_file(directory, src_file, args)
+            for key, func_dict, is_definition in results.get(src_file, []):
+                if key not in self.extracted_functions or is_definition:
+                    self.extracted_functions[key] = FunctionInfo(**func_dict)
+                if is_definition:
+                    self.definition_keys.add(key)
     
     
     def get_all_headers(self, compile_db_path: str) -> Set[str]:
         """Get all header files from compile_commands.json"""
         compile_db = self.load_compile_commands(compile_db_path)
+        results = self._extract_all(compile_db, header_flag=True)
         headers: Set[str] = set()
-        
         for src_file in compile_db:
-            directory, args = compile_db[src_file]
-            headers.update(self.analyze_file(directory, src_file, args, header_flag=True))
+            headers.update(results.get(src_file, []))
 
         return headers
 
-        return headers
+    def _tu_hash(self, directory: str, src_file: str, args: List[str], header_flag: bool) -> str:
+        """Hash of the compile command and the file content of a translation unit"""
+        hasher = hashlib.sha256(json.dumps([directory, src_file, args, header_flag]).encode("utf-8"))
+        file_path = os.path.normpath(os.path.join(directory, src_file))
+        try:
+            with open(file_path, "rb") as f:
+                hasher.update(f.read())
+        except OSError:
+            pass
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _dep_stamps(paths: List[str]) -> Dict[str, Any]:
+        """mtime and size of the included headers, None if a header is gone"""
+        stamps: Dict[str, Any] = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stamps[path] = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def _deps_unchanged(self, cached: Dict[str, Any]) -> bool:
+        # entries of an older cache have no deps, parse them again
+        if "deps" not in cached:
+            return False
+        deps: Dict[str, Any] = cached["deps"]
+        return self._dep_stamps(list(deps)) == deps
+
+    def _cache_path(self, header_flag: bool) -> str:
+        mode = "headers" if header_flag else "functions"
+        root_hash = hashlib.sha256(self.project_root.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"libclang_{mode}_{root_hash}.json")
+
+    def _load_cache(self, header_flag: bool) -> Dict[str, Any]:
+        if not self.incremental:
+            return {}
+        try:
+            with open(self._cache_path(header_flag), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: Dict[str, Any], header_flag: bool) -> None:
+        if not self.incremental:
+            return
+        cache_path = self._cache_path(header_flag)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Error saving libclang cache: {e}")
+
+    def _extract_all(self, compile_db: Dict[str, tuple], header_flag: bool) -> Dict[str, Any]:
+        """
+        Parse all translation units in a process pool, one Index per worker.
+        Returns:
+            dict: src_file -> list of (key, function dict, is_definition), or list of headers if header_flag
+        """
+        cache = self._load_cache(header_flag)
+        results: Dict[str, Any] = {}
+        tasks: List[tuple] = []
+        for src_file, (directory, args) in compile_db.items():
+            tu_hash = self._tu_hash(directory, src_file, args, header_flag)
+            cached = cache.get(src_file)
+            # _tu_hash only covers the command and the source file, the included headers are checked by their stamps
+            if cached and cached.get("hash") == tu_hash and self._deps_unchanged(cached):
+                results[src_file] = cached["result"]
+            else:
+                tasks.append((src_file, directory, args, tu_hash))
+
+        print(f"Parsing {len(tasks)} of {len(compile_db)} translation units with {self.num_workers} workers")
+        if not tasks:
+            return results
+
+        def collect(done: int, src_file: str, tu_hash: str, output: tuple) -> None:
+            result, deps = output
+            results[src_file] = result
+            cache[src_file] = {"hash": tu_hash, "result": result, "deps": deps}
+            if done % CACHE_SAVE_INTERVAL == 0:
+                self._save_cache(cache, header_flag)
+
+        initargs = (self.project_root, self.project_name, header_flag)
+        if self.num_workers <= 1 or len(tasks) == 1:
+            _init_worker(*initargs)
+            for done, task in enumerate(tasks, 1):
+                collect(done, task[0], task[3], _analyze_tu(task[:3]))
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.num_workers, len(tasks)), initializer=_init_worker, initargs=initargs) as pool:
+                for done, (task, result) in enumerate(zip(tasks, pool.map(_analyze_tu, [task[:3] for task in tasks], chunksize=4)), 1):
+                    collect(done, task[0], task[3], result)
+
+        self._save_cache(cache, header_flag)
+        return results
+
     def export_to_json(self, output_path: str):
         """Export functions to JSON"""
         functions_list = [asdict(func) for func in self.extracted_functions.values()]
@@ -397,6 +531,46 @@ class LibclangExtractor:
         
         print(f"Exported {len(functions_list)} functions to {output_path}")
 
+# per worker process state, each worker owns one extractor (and one libclang Index)
+_worker_extractor: Optional[LibclangExtractor] = None
+_worker_header_flag: bool = False
+
+
+def _init_worker(project_root: str, project_name: str, header_flag: bool) -> None:
+    global _worker_extractor, _worker_header_flag
+    _worker_extractor = LibclangExtractor(project_root, project_name, num_workers=1, incremental=False)
+    _worker_header_flag = header_flag
+
+
+def _analyze_tu(task: tuple) -> tuple:
+    """
+    Parse one translation unit in a worker, the result must be picklable and json serializable.
+    Returns:
+        tuple: The result, and the stamps of the project headers it includes.
+    """
+    src_file, directory, args = task
+    extractor = _worker_extractor
+    assert extractor is not None, "worker is not initialized"
+    if _worker_header_flag:
+        try:
+            headers = extractor.analyze_file(directory, src_file, args, header_flag=True)
+        except Exception as e:
+            print(f"Error analyzing {src_file}: {e}")
+            headers = None
+        headers = sorted(headers) if headers else []
+        return headers, extractor._dep_stamps(headers)
+
+    extractor.extracted_functions = {}
+    extractor.definition_keys = set()
+    extractor.last_includes = set()
+    try:
+        extractor.analyze_file(directory, src_file, args)
+    except Exception as e:
+        print(f"Error analyzing {src_file}: {e}")
+    result = [(key, asdict(info), key in extractor.definition_keys) for key, info in extractor.extracted_functions.items()]
+    return result, extractor._dep_stamps(sorted(extractor.last_includes))
+
+
 def main():
     """Main entry point"""
     import argparse
@@ -1,10 +1,10 @@
-import json
 import os
 import argparse
 import asyncio
 from constants import LanguageType, LSPFunction
 from agent_tools.code_tools.cpp_lsp_code_retriever import get_cpp_response
 from agent_tools.code_tools.multi_lsp_code_retriever import get_multi_response
+from agent_tools.code_tools.retriever_protocol import emit_result, profile_to
 
 async def main():
     parser = argparse.ArgumentParser(description='')
@@ -13,15 +13,19 @@ async def main():
     parser.add_argument('--lsp-function', type=str, default="declaration", choices=[e.value for e in LSPFunction], help='The LSP function name')
     parser.add_argument('--symbol-name', type=str, default="CppCheck::check", help='The function name or struct name.')
     parser.add_argument('--lang', type=str, default="CPP", choices=[e.value for e in LanguageType], help='The project language.')
+    parser.add_argument('--debug-file', action='store_true', help='Also write the result to a json file in /out.')
+    parser.add_argument('--profile-dir', type=str, default=None, help='Save a cProfile dump of this call into the directory.')
     args = parser.parse_args()
 
-    if args.lang in [LanguageType.CPP.value, LanguageType.C.value]:
-        msg, res = await get_cpp_response(args.workdir, args.project, args.lang, args.symbol_name, args.lsp_function)
-    else:
-        msg, res = await get_multi_response(args.workdir, args.project, args.lang, args.symbol_name, args.lsp_function)
-    file_name = f"{args.symbol_name}_{args.lsp_function}_lsp.json"
-    with open(os.path.join("/out", file_name), "w") as f:
-        f.write(json.dumps({"message": msg, "response": res}, indent=4))
+    # the event loop runs in this thread, so cProfile also sees the LSP client coroutines
+    with profile_to(args.profile_dir, f"lsp_{args.lsp_function}"):
+        if args.lang in [LanguageType.CPP.value, LanguageType.C.value]:
+            msg, res = await get_cpp_response(args.workdir, args.project, args.lang, args.symbol_name, args.lsp_function)
+        else:
+            msg, res = await get_multi_response(args.workdir, args.project, args.lang, args.symbol_name, args.lsp_function)
+
+    debug_file = os.path.join("/out", f"{args.symbol_name}_{args.lsp_function}_lsp.json") if args.debug_file else None
+    emit_result(msg, res, debug_file)
 
 if __name__ == "__main__":
     asyncio.run(main())
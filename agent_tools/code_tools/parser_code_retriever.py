@@ -1,4 +1,3 @@
-import json
 import os
 import argparse
 import subprocess as sp
@@ -6,7 +5,10 @@ import random
 from agent_tools.code_tools.parsers.cpp_parser import CPPParser
 from agent_tools.code_tools.parsers.c_parser import CParser
 from agent_tools.code_tools.parsers.java_parser import JavaParser
+from agent_tools.code_tools.parsers.parser_cache import get_file_parser
 from agent_tools.code_tools.parsers.base_parser import FunctionDeclaration
+from agent_tools.code_tools.retriever_protocol import emit_result, profile_to
+from agent_tools.code_tools.identifier_index import IdentifierIndex
 from constants import LanguageType, LSPFunction, LSPResults
 from pathlib import Path
 from typing import Any
@@ -48,7 +50,7 @@ class ParserCodeRetriever():
         ret_list:list[dict[str, Any]] = []
         query_key = ""
         start_line = 0
-        parser = self.lang_parser(Path(file_path), source_code=None)
+        parser = get_file_parser(self.lang_parser, Path(file_path))
         if self.lsp_function == LSPFunction.References:
             # get the full source code of the symbol
             source_code = parser.get_ref_source(self.symbol_name, lineno) # type: ignore
@@ -180,33 +182,20 @@ class ParserCodeRetriever():
 
         res_list: list[tuple[str, str]] = []
         for _path in path_list:
-            parser = self.lang_parser(Path(_path), source_code=None)
+            parser = get_file_parser(self.lang_parser, Path(_path))
             func_decl_list = parser.get_file_functions() 
             for func_info in func_decl_list:
                 res_list.append((func_info.signature, func_info.name))
 
         ret_list: list[dict[str, Any]] = []
-         # if the lsp function is related functions, we need to sort the results according to the time it appears in the file
+        # count how many times each function is used in the workspace, one scan for all functions
+        identifier_index = IdentifierIndex.load_or_build("/src")
         for src, function_name in res_list:
 
             res_json: dict[str, Any] = {}
             res_json["source_code"] = src
             res_json["function_name"] = function_name
-            # count the number of times the function name appears in the source code
-            include_str = ""
-            for extin in ["c", "cpp", "cc", "h", "hpp", "hxx", "java"]:
-                include_str += f" --include=*.{extin} "
-            cmd = f"grep -r {include_str} -o '{function_name}(' /src/ | wc -l"
-            
-            result = sp.run(cmd, shell=True, stdout=sp.PIPE, stderr=sp.PIPE, text=True)
-            if result.returncode == 0:
-                # Add the total count across the workspace
-                workspace_count = int(result.stdout.strip())
-                # Add count information to the result
-                res_json["count"] = workspace_count
-            else:
-                res_json["count"] = 1
-
+            res_json["count"] = identifier_index.count(function_name)
             ret_list.append(res_json)
 
         # sort the results by the count of the function name in the workspace
@@ -278,7 +267,7 @@ class ParserCodeRetriever():
      
         for file_path in header_files:
             
-            parser = self.lang_parser(Path(file_path), source_code=None)
+            parser = get_file_parser(self.lang_parser, Path(file_path))
             functions = parser.get_file_functions()
             if functions:
                 all_functions[str(file_path)] = functions
@@ -330,25 +319,30 @@ def main():
     parser.add_argument('--lsp-function', type=str, choices=[e.value for e in LSPFunction], default="all_symbols", help='The LSP function name')
     parser.add_argument('--symbol-name', type=str, default="ALL", help='The function name or struct name.')
     parser.add_argument('--lang', type=str, choices=[e.value for e in LanguageType], default="CPP", help='The project language.')
+    parser.add_argument('--debug-file', action='store_true', help='Also write the result to a json file in /out.')
+    parser.add_argument('--profile-dir', type=str, default=None, help='Save a cProfile dump of this call into the directory.')
     args = parser.parse_args()
     
 
     lsp = ParserCodeRetriever(args.project, args.workdir, LanguageType(args.lang), args.symbol_name, LSPFunction(args.lsp_function))
     # try:
-    msg, res = lsp.get_symbol_info()
+    with profile_to(args.profile_dir, f"parser_{args.lsp_function}"):
+        msg, res = lsp.get_symbol_info()
     # except Exception as e:
         # msg = f"{LSPResults.Error}: {e}"
         # res = []
 
     print(f"res: {len(res)} results found")
     print(f"message: {msg}")
-    if args.lsp_function == LSPFunction.StructFunctions.value:
-        file_name = f"{Path(lsp.symbol_name).stem}_struct_functions_parser.json"
-    else:
-        file_name = f"{lsp.symbol_name}_{lsp.lsp_function.value}_parser.json"
-    
-    with open(os.path.join("/out", file_name), "w") as f:
-        f.write(json.dumps({"message": msg, "response": res}, indent=4))
+    debug_file = None
+    if args.debug_file:
+        if args.lsp_function == LSPFunction.StructFunctions.value:
+            file_name = f"{Path(lsp.symbol_name).stem}_struct_functions_parser.json"
+        else:
+            file_name = f"{lsp.symbol_name}_{lsp.lsp_function.value}_parser.json"
+        debug_file = os.path.join("/out", file_name)
+
+    emit_result(msg, res, debug_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
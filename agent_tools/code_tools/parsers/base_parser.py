@@ -5,6 +5,9 @@ import tree_sitter_java  # For Java language
 from constants import LanguageType, FuzzEntryFunctionMapping, LSPFunction
 from pathlib import Path
 from typing import Optional, Any
+import functools
+import threading
+import re
 
 parser_language_mapping = {
     LanguageType.C: tree_sitter_c.language(),
@@ -12,6 +15,46 @@ parser_language_mapping = {
     LanguageType.JAVA: tree_sitter_java.language(),
 }
 
+# building Language/Parser objects and compiling queries costs much more than running them, so they are shared
+_parser_local = threading.local()
+# the symbol name is checked in Python after the capture, so one compiled query serves all symbols
+SYMBOL_PREDICATE = re.compile(r'\(#eq\?\s+@identifier_name\s+"\{\}"\s*\)')
+
+
+@functools.lru_cache(maxsize=None)
+def get_language(language: LanguageType) -> Language:
+    assert language in parser_language_mapping.keys(), f"Language {language} not supported."
+    return Language(parser_language_mapping[language])
+
+
+def get_parser(language: LanguageType) -> Parser:
+    # a Parser keeps parsing state, so each thread has its own
+    parsers: dict[LanguageType, Parser] = _parser_local.__dict__.setdefault("parsers", {})
+    if language not in parsers:
+        parsers[language] = Parser(get_language(language))
+    return parsers[language]
+
+
+@functools.lru_cache(maxsize=None)
+def get_query(language: LanguageType, query_str: str) -> Query:
+    return get_language(language).query(query_str)
+
+
+@functools.lru_cache(maxsize=None)
+def get_symbol_query(language: LanguageType, query_items: tuple[tuple[str, str], ...]) -> tuple[Query, tuple[str, ...]]:
+    """
+    Merge the queries of a query dict into one multi-pattern query without the symbol name predicate.
+    :return: the query and the dict key of each pattern index.
+    """
+    patterns: list[str] = []
+    pattern_keys: list[str] = []
+    for key, query_str in query_items:
+        pattern = SYMBOL_PREDICATE.sub("", query_str)
+        # a query string may hold several patterns
+        pattern_keys += [key] * get_query(language, pattern).pattern_count
+        patterns.append(pattern)
+    return get_query(language, "\n".join(patterns)), tuple(pattern_keys)
+
 class FunctionDeclaration:
     """Function declaration information"""
     def __init__(self, name: str, signature: str, file_path: str, line_number: int, 
@@ -48,7 +91,7 @@ class BaseParser:
         self.file_path = file_path
         self.project_lang = project_lang
         self.parser_language = self.set_language(project_lang)
-        self.parser = Parser(self.parser_language)
+        self.parser = get_parser(project_lang)
 
         if source_code:
             assert isinstance(source_code, str)
@@ -61,10 +104,100 @@ class BaseParser:
         # for fuzzing
         self.call_func_name, self.func_def_name = self.name_mapping()
         self.tree = self.parser.parse(self.source_code)
+        # query results on the root node of this tree
+        self.captures_cache: dict[str, dict[str, list[Node]]] = {}
+        self.symbol_matches_cache: dict[LSPFunction, list[tuple[str, str, Node]]] = {}
 
     def set_language(self, language: LanguageType) -> Language:
-        assert language in parser_language_mapping.keys(), f"Language {language} not supported."
-        return Language(parser_language_mapping[language])
+        return get_language(language)
+
+    def preprocess(self, source_code: str) -> str:
+        return source_code
+
+    def reparse(self, source_code: str) -> bool:
+        """
+        Update the tree to a new version of the source code, only the edited range is reparsed.
+        :return: False if the code is unchanged.
+        """
+        new_code = bytes(self.preprocess(source_code), "utf-8")
+        old_code = self.source_code
+        if new_code == old_code:
+            return False
+
+        # the edit is the range between the common prefix and the common suffix
+        start = 0
+        max_prefix = min(len(old_code), len(new_code))
+        while start < max_prefix and old_code[start] == new_code[start]:
+            start += 1
+        old_end, new_end = len(old_code), len(new_code)
+        while old_end > start and new_end > start and old_code[old_end - 1] == new_code[new_end - 1]:
+            old_end -= 1
+            new_end -= 1
+
+        def point(code: bytes, offset: int) -> tuple[int, int]:
+            row = code.count(b"\n", 0, offset)
+            return row, offset - (code.rfind(b"\n", 0, offset) + 1)
+
+        self.tree.edit(start, old_end, new_end, point(old_code, start), point(old_code, old_end), point(new_code, new_end))
+        self.tree = self.parser.parse(new_code, self.tree)
+        self.source_code = new_code
+        # nodes of the old tree are no longer valid
+        self.captures_cache.clear()
+        self.symbol_matches_cache.clear()
+        return True
+
+    def captures(self, query_str: str, query_node: Optional[Node] = None) -> dict[str, list[Node]]:
+        """
+        Run a (cached) query, the result on the root node is cached for this tree.
+        """
+        if query_node is not None and query_node != self.tree.root_node:
+            return get_query(self.project_lang, query_str).captures(query_node)
+        if query_str not in self.captures_cache:
+            self.captures_cache[query_str] = get_query(self.project_lang, query_str).captures(self.tree.root_node)
+        return self.captures_cache[query_str]
+
+    def get_symbol_matches(self, lsp_function: LSPFunction) -> list[tuple[str, str, Node]]:
+        """
+        Run the merged symbol query of lsp_function once on the tree.
+        :return: (query key, identifier name, node) for every match, in document order.
+        """
+        if lsp_function in self.symbol_matches_cache:
+            return self.symbol_matches_cache[lsp_function]
+
+        query_dict = self.decl_query_dict if lsp_function == LSPFunction.Declaration else self.def_query_dict
+        query, pattern_keys = get_symbol_query(self.project_lang, tuple(query_dict.items()))
+
+        matches: list[tuple[str, str, Node]] = []
+        for pattern_index, match in query.matches(self.tree.root_node):
+            id_nodes = match.get("identifier_name", [])
+            src_nodes = match.get("node_name", [])
+            id_nodes = id_nodes if isinstance(id_nodes, list) else [id_nodes]
+            src_nodes = src_nodes if isinstance(src_nodes, list) else [src_nodes]
+            if not id_nodes or not id_nodes[0].text:
+                continue
+            id_name = id_nodes[0].text.decode("utf-8", errors="ignore")
+            # like #eq?, all captured identifiers must have the same name
+            if any(node.text != id_nodes[0].text for node in id_nodes[1:]):
+                continue
+            for src_node in src_nodes:
+                matches.append((pattern_keys[pattern_index], id_name, src_node))
+
+        self.symbol_matches_cache[lsp_function] = matches
+        return matches
+
+    def find_symbol_nodes(self, symbol_name: str, line: int, lsp_function: LSPFunction) -> list[tuple[str, Node]]:
+        """
+        For each query key (in the order of the query dict), the first node of symbol_name that covers the line.
+        """
+        first_nodes: dict[str, Node] = {}
+        for key, id_name, src_node in self.get_symbol_matches(lsp_function):
+            if key in first_nodes or id_name != symbol_name or not src_node.text:
+                continue
+            if src_node.start_point.row <= line and line <= src_node.end_point.row:
+                first_nodes[key] = src_node
+
+        query_dict = self.decl_query_dict if lsp_function == LSPFunction.Declaration else self.def_query_dict
+        return [(key, first_nodes[key]) for key in query_dict if key in first_nodes]
 
     def name_mapping(self):
         call_name_dict = {
@@ -106,22 +239,13 @@ class BaseParser:
         # print("language: ", self.project_lang)
         # print("parser_language: ", self.parser_language)
         # type s
-        if lsp_function == LSPFunction.Declaration:
-            query_dict = self.decl_query_dict
-        elif lsp_function == LSPFunction.Definition:
-            query_dict = self.def_query_dict
-        else:
+        if lsp_function not in [LSPFunction.Declaration, LSPFunction.Definition]:
             print("Unsupported LSP function.")
             return "", "", 0
             
-        for key, query_str in query_dict.items():
-            # Execute the query
-            query_str = query_str.format(symbol_name)
-            query = self.parser_language.query(query_str)
-            src_node = self.exec_query(query, self.tree.root_node, line)
-            if src_node:
-                # Decode the source code to a string
-                return key, src_node.text.decode(encoding="utf-8", errors="ignore"), src_node.start_point.row # type: ignore
+        for key, src_node in self.find_symbol_nodes(symbol_name, line, lsp_function):
+            # Decode the source code to a string
+            return key, src_node.text.decode(encoding="utf-8", errors="ignore"), src_node.start_point.row # type: ignore
 
         return "", "", 0
     
@@ -168,10 +292,8 @@ class BaseParser:
         
         # find the callee node
         callee_node = None
-        query = self.parser_language.query(f"({self.call_func_name}) @func_call")
-
         # Execute the query
-        captures = query.captures( self.tree.root_node)
+        captures = self.captures(f"({self.call_func_name}) @func_call")
 
         if not captures:
             return ""
@@ -207,11 +329,8 @@ class BaseParser:
             print("Entry function not found.")
             return None
 
-        # Define a query to find "function_call" nodes
-        function_call_query = self.parser_language.query(f"({self.call_func_name}) @func_call")
-
-        # Execute the query
-        captures = function_call_query.captures(entry_node)
+        # Execute the query to find "function_call" nodes
+        captures = self.captures(f"({self.call_func_name}) @func_call", entry_node)
         if not captures:
             return None
             
@@ -314,24 +433,24 @@ class BaseParser:
         """Extract function declarations from a single file"""
         
         functions: list[FunctionDeclaration] = []
-        # Use simplified query to extract functions
+        if not self.func_query_dict:
+            return functions
 
-        for _, query_str in self.func_query_dict.items():
-            # Execute the query
-            query = self.parser_language.query(query_str)
-            captures = query.captures(self.tree.root_node)
+        # Use simplified query to extract functions, all patterns run in one query
+        query, pattern_keys = get_symbol_query(self.project_lang, tuple(self.func_query_dict.items()))
+        # keep the order of the query dict
+        nodes_by_key: dict[str, list[Node]] = {key: [] for key in self.func_query_dict}
+        for pattern_index, match in query.matches(self.tree.root_node):
+            id_nodes = match.get("identifier_name", [])
+            nodes_by_key[pattern_keys[pattern_index]] += id_nodes if isinstance(id_nodes, list) else [id_nodes]
             
-            # Check if there are captures - continue to next query instead of returning early
-            if not captures or "identifier_name" not in captures:
-                continue
-                
-            # Extract function names from captures
-            for node in captures["identifier_name"]:
-              
-                # TODO treat cpp method as function for now
-                func_decl = self.get_decl_funcs(node, self.file_path) # type: ignore
-                if func_decl:
-                    functions.append(func_decl)
+        # Extract function names from captures
+        for node in [node for nodes in nodes_by_key.values() for node in nodes]:
+          
+            # TODO treat cpp method as function for now
+            func_decl = self.get_decl_funcs(node, self.file_path) # type: ignore
+            if func_decl:
+                functions.append(func_decl)
         
         return functions
             
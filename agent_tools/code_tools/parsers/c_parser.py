@@ -153,10 +153,8 @@ class CParser(BaseParser):
         
     def get_definition_node(self, function_name: str) -> Optional[Node]:
         # Define a query to find "function_definition" nodes
-        function_definition_query = self.parser_language.query(f"({self.func_def_name}) @func_def")
-
         # Execute the query
-        captures = function_definition_query.captures(self.tree.root_node)
+        captures = self.captures(f"({self.func_def_name}) @func_def")
         if not captures:
             return None
         # Check the nodes
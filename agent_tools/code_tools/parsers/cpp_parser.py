@@ -103,6 +103,10 @@ cpp_decl_queries.update(common_query_dict)
 cpp_def_queries.update(common_query_dict)
 
 from tree_sitter import Node
+
+# matches uppercase-style macro between class and class name
+CLASS_MACRO_PATTERN = re.compile(r'(\bclass\s+)([A-Z_][A-Z0-9_]*\s+)')
+
 def node_text(node: Optional[Node]) -> str:
     if node is None:
         return ""
@@ -114,10 +118,15 @@ class CPPParser(CParser):
         # preprocess the file path
         # remove the macro between class and class name
         cleaned_code: str = file_path.read_text() if source_code is None and file_path else source_code  # type: ignore
-        pattern = r'(\bclass\s+)([A-Z_][A-Z0-9_]*\s+)'  # matches uppercase-style macro
-        # Replace the macro with an empty string
-        cleaned_code = re.sub(pattern, r'\1', cleaned_code) 
+        cleaned_code = self.preprocess(cleaned_code)
         super().__init__(file_path, cleaned_code, cpp_decl_queries, cpp_def_queries, cpp_func_queries, LanguageType.CPP)
+
+    def preprocess(self, source_code: str) -> str:
+        # most files (and harnesses) have no class at all, skip the regex over the whole file
+        if "class" not in source_code:
+            return source_code
+        # Replace the macro with an empty string
+        return CLASS_MACRO_PATTERN.sub(r'\1', source_code)
    
     def get_symbol_source(self, symbol_name: str, line: int, lsp_function: LSPFunction) -> tuple[str, str, int]:
         """
@@ -138,21 +147,11 @@ class CPPParser(CParser):
         # print("language: ", self.project_lang)
         # print("parser_language: ", self.parser_language)
         # type s
-        if lsp_function == LSPFunction.Declaration:
-            query_dict = self.decl_query_dict
-        elif lsp_function == LSPFunction.Definition:
-            query_dict = self.def_query_dict
-        else:
+        if lsp_function not in [LSPFunction.Declaration, LSPFunction.Definition]:
             print("Unsupported LSP function.")
             return "", "", 0
             
-        for key, query_str in query_dict.items():
-            # Execute the query
-            query_str = query_str.format(symbol_name)
-            query = self.parser_language.query(query_str)
-            src_node = self.exec_query(query, self.tree.root_node, line)
-            if not src_node:
-                continue
+        for key, src_node in self.find_symbol_nodes(symbol_name, line, lsp_function):
 
             # check if the src_node is the correct node filter this kind of line.  class LoggingEvent;
             if key == "classes":
@@ -0,0 +1,74 @@
+from typing import Optional
+from tree_sitter import Node
+from constants import LanguageType, FuzzEntryFunctionMapping
+from agent_tools.code_tools.parsers.base_parser import BaseParser
+from agent_tools.code_tools.parsers.c_parser import CParser
+from agent_tools.code_tools.parsers.cpp_parser import CPPParser
+from agent_tools.code_tools.parsers.java_parser import JavaParser
+
+
+def get_harness_parser(project_lang: LanguageType) -> type[BaseParser]:
+    if project_lang == LanguageType.C:
+        return CParser
+    elif project_lang == LanguageType.CPP:
+        return CPPParser
+    elif project_lang == LanguageType.JAVA:
+        return JavaParser
+    else:
+        raise Exception(f"Language {project_lang} not supported.")
+
+
+class HarnessAnalysis():
+    '''
+    Static analysis of the harness across fix iterations.
+    The tree of the previous draft is kept and updated with tree.edit, so a new draft only reparses the edited range.
+    The answers (entry node, target call node, defined/called functions) are cached until the code changes.
+    '''
+
+    def __init__(self, project_lang: LanguageType, parser_cls: Optional[type[BaseParser]] = None):
+        self.project_lang = project_lang
+        self.parser_cls = parser_cls if parser_cls else get_harness_parser(project_lang)
+        self.parser: Optional[BaseParser] = None
+        self.harness_code: Optional[str] = None
+        self.answers: dict[tuple[str, str, bool], object] = {}
+
+    def update(self, harness_code: str) -> BaseParser:
+        """
+        Analyze a new version of the harness, the cached answers are kept if the code is unchanged.
+        Returns:
+            The parser of the harness.
+        """
+        if self.parser is not None and harness_code == self.harness_code:
+            return self.parser
+
+        if self.parser is None:
+            self.parser = self.parser_cls(None, harness_code) # type: ignore
+        else:
+            self.parser.reparse(harness_code)
+        self.harness_code = harness_code
+        self.answers.clear()
+        return self.parser
+
+    def cached(self, kind: str, name: str, flag: bool, compute) -> object: # type: ignore
+        key = (kind, name, flag)
+        if key not in self.answers:
+            self.answers[key] = compute()
+        return self.answers[key]
+
+    def entry_node(self, harness_code: str) -> Optional[Node]:
+        parser = self.update(harness_code)
+        entry_function = FuzzEntryFunctionMapping[self.project_lang]
+        return self.cached("entry", entry_function, False, lambda: parser.get_definition_node(entry_function)) # type: ignore
+
+    def target_call_node(self, harness_code: str, function_name: str, expression_flag: bool = False) -> Optional[Node]:
+        parser = self.update(harness_code)
+        return self.cached("call", function_name, expression_flag,
+                           lambda: parser.get_fuzz_function_node(function_name, expression_flag)) # type: ignore
+
+    def is_function_defined(self, harness_code: str, function_name: str) -> bool:
+        parser = self.update(harness_code)
+        return self.cached("defined", function_name, False, lambda: parser.is_function_defined(function_name)) # type: ignore
+
+    def is_function_called(self, harness_code: str, function_name: str) -> bool:
+        parser = self.update(harness_code)
+        return self.cached("called", function_name, False, lambda: parser.is_function_called(function_name)) # type: ignore
@@ -0,0 +1,88 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, TypeVar
+from agent_tools.code_tools.parsers.base_parser import BaseParser
+
+ParserT = TypeVar("ParserT", bound=BaseParser)
+
+# a tree-sitter tree (plus the source bytes and cached captures) takes roughly this many bytes per source byte
+TREE_BYTES_FACTOR = 12
+DEFAULT_MEMORY_BUDGET = int(os.environ.get("AGENT_TOOLS_PARSER_CACHE_MB", "256")) * 1024 * 1024
+
+
+class ParserCache():
+    '''
+    LRU cache of parsed files, keyed by (parser class, path) and invalidated by (mtime, size).
+    The whole parser object is kept, so the query results cached on it are reused as well.
+    '''
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # (parser class name, resolved path) -> (mtime_ns, size, parser, cost)
+        self.entries: OrderedDict[tuple[str, str], tuple[int, int, BaseParser, int]] = OrderedDict()
+
+    def get(self, parser_cls: type[ParserT], file_path: Path) -> ParserT:
+        """
+        Get the parser of a file, parse it only if it is not cached or has changed on disk.
+        Args:
+            parser_cls: CParser, CPPParser, JavaParser or PythonParser.
+            file_path (Path): The source file.
+        Returns:
+            The parser of the file.
+        """
+        path = Path(file_path).resolve()
+        stat = path.stat()
+        key = (parser_cls.__name__, str(path))
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]  # type: ignore
+            self.misses += 1
+
+        parser = parser_cls(path, source_code=None)
+        cost = max(len(parser.source_code), 1) * TREE_BYTES_FACTOR
+        with self.lock:
+            self.discard(key)
+            # too large to keep, just return it
+            if cost > self.memory_budget:
+                return parser
+            self.entries[key] = (stat.st_mtime_ns, stat.st_size, parser, cost)
+            self.used_bytes += cost
+            while self.used_bytes > self.memory_budget:
+                oldest = next(iter(self.entries))
+                self.discard(oldest)
+        return parser
+
+    def discard(self, key: tuple[str, str]) -> None:
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.used_bytes -= entry[3]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+
+_parser_cache: Optional[ParserCache] = None
+
+
+def get_parser_cache() -> ParserCache:
+    # one cache for all retriever entry points in the process
+    global _parser_cache
+    if _parser_cache is None:
+        _parser_cache = ParserCache()
+    return _parser_cache
+
+
+def get_file_parser(parser_cls: type[ParserT], file_path: Path) -> ParserT:
+    return get_parser_cache().get(parser_cls, file_path)
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import contextlib
+from typing import Any, Iterator, Optional
+
+# The in-container retrievers return their result as one NDJSON frame on stdout:
+# a single line that starts with RESULT_FRAME_PREFIX followed by {"message": ..., "response": ...}.
+# Everything else printed by the retriever (progress, warnings) is ignored by the host.
+RESULT_FRAME_PREFIX = "@@retriever_result@@ "
+
+
+def emit_result(msg: str, res: Any, debug_file: Optional[str] = None) -> None:
+    """
+    Write the retriever result to stdout as a single frame.
+    Args:
+        msg (str): The retriever message (LSPResults).
+        res (Any): The retriever response.
+        debug_file (str): If set, also dump the result to this json file for debugging.
+    """
+    result = {"message": msg, "response": res}
+    # ensure_ascii keeps the frame on one line and safe for the tty of docker exec
+    sys.stdout.write(RESULT_FRAME_PREFIX + json.dumps(result, ensure_ascii=True) + "\n")
+    sys.stdout.flush()
+
+    if debug_file:
+        with open(debug_file, "w") as f:
+            f.write(json.dumps(result, indent=4))
+
+
+def parse_result(output: str) -> Optional[dict[str, Any]]:
+    """
+    Extract the result frame from the output of a retriever.
+    Args:
+        output (str): The stdout (and stderr) of the retriever.
+    Returns:
+        dict: {"message": "", "response": []}, or None if there is no valid frame.
+    """
+    # the frame is the last thing the retriever prints, search from the end
+    for line in reversed(output.splitlines()):
+        idx = line.find(RESULT_FRAME_PREFIX)
+        if idx == -1:
+            continue
+        try:
+            result = json.loads(line[idx + len(RESULT_FRAME_PREFIX):].strip())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(result, dict) or "message" not in result or "response" not in result:
+            return None
+        return result
+    return None
+
+
+@contextlib.contextmanager
+def profile_to(profile_dir: Optional[str], name: str) -> Iterator[None]:
+    """
+    Profile one retriever call with cProfile and dump it to <profile_dir>/<name>_<pid>_<time>.prof.
+    The retrievers run inside the container where utils/ is not mounted, so this does not use utils/profiler.py.
+    Args:
+        profile_dir (str): The directory in the container (under /out), None to disable profiling.
+        name (str): The prefix of the profile file.
+    """
+    if not profile_dir:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(profile_dir, f"{name}_{os.getpid()}_{int(time.time() * 1000)}.prof"))
+        except OSError as e:
+            print(f"Failed to save the profile: {e}")
@@ -2,10 +2,14 @@ from langchain_openai import ChatOpenAI
 from constants import PROJECT_PATH
 from pathlib import Path
 from pydantic import BaseModel, Field
+import re
 import json
-from typing import Any, Union
-import tiktoken
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Union
 import os
+from utils.token_budget import fits
 
 class AnswerStruct(BaseModel):
     """Split the response into the answer and the explanation."""
@@ -58,11 +62,45 @@ class LLMSelector:
                 return 0
         
 
-def cache_example_selection(json_file: Path, function_name:str, project_name:str,   llm_name: str = "gpt-4.1") -> list[dict[str, Any]]:
-    """Cache the example selection results."""
+def get_example_hash(code: str) -> str:
+    return hashlib.sha1(code.encode("utf-8", errors="replace")).hexdigest()
+
+
+def load_score_cache(score_file: Path, function_name: str) -> dict[str, int]:
+    """Read the scores of function_name already computed, the last score of an example wins."""
+    scores: dict[str, int] = {}
+    if not score_file.exists():
+        return scores
+    with open(score_file, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of a killed process may be incomplete
+                continue
+            if record.get("function") == function_name:
+                scores[record["hash"]] = int(record["score"])
+    return scores
+
+
+def calls_target(function_name: str, code: str) -> bool:
+    """Cheap lexical filter: the example must call the target function, not only mention it."""
+    short_name = function_name.split("::")[-1].split(".")[-1]
+    return re.search(rf"\b{re.escape(short_name)}\s*\(", code) is not None
+
+
+def cache_example_selection(json_file: Path, function_name:str, project_name:str,   llm_name: str = "gpt-4.1",
+                            max_workers: int = 8, prefilter: bool = False) -> list[dict[str, Any]]:
+    """
+    Cache the example selection results.
+    The examples are scored by max_workers threads, every score is appended to a jsonl file
+    (per function, example hash and model) so a crashed selection resumes where it stopped.
+    If prefilter, the examples that never call the function get score 0 without asking the LLM.
+    """
     # 
     llm_norm = llm_name.replace("/", "_")
     save_json_file = json_file.with_name(json_file.name.replace(".json", f"_{llm_norm}.json"))
+    score_file = json_file.with_name(f"example_scores_{llm_norm}.jsonl")
     if not json_file.exists():
         raise FileNotFoundError(f"File {json_file} does not exist.")
 
@@ -76,24 +114,39 @@ def cache_example_selection(json_file: Path, function_name:str, project_name:str
     with open(json_file, 'r') as f:
         data = f.read()
         json_data = json.loads(data)
+
     # add new key-value pair to indicate the example 
-    llm_selector = LLMSelector(llm_name)
-    # a roughly 1000 tokens limit for the source code
-    enc = tiktoken.encoding_for_model("gpt-4o")
-    res_list:list[dict[str, Any]] = []            
-    for example_json in json_data:
-        
-        source_code = example_json["source_code"]
-        if len(enc.encode(source_code)) > 1000:
-            res_list.append(example_json)
-            continue
+    cached_scores = load_score_cache(score_file, function_name)
+    llm_selector: Optional[LLMSelector] = None
+    write_lock = threading.Lock()
 
+    def score(example_json: dict[str, Any]) -> None:
+        source_code = example_json["source_code"]
+        example_hash = get_example_hash(source_code)
+        if example_hash in cached_scores:
+            example_json["selection_method"] = llm_selector.name if llm_selector else "LLM"
+            example_json["selection_score"] = cached_scores[example_hash]
+            return
+        if prefilter and not calls_target(function_name, source_code):
+            example_json["selection_method"] = "lexical"
+            example_json["selection_score"] = 0
+            return
+
+        assert llm_selector is not None
         example_json["selection_method"] = llm_selector.name
-        example_json["selection_score"] = llm_selector.score_example(
-            function_name,
-            example_json["source_code"]
-        )
-        res_list.append(example_json)
+        example_json["selection_score"] = llm_selector.score_example(function_name, source_code)
+        # one short line per write, appends of different processes do not interleave
+        with write_lock, open(score_file, "a") as f:
+            f.write(json.dumps({"function": function_name, "hash": example_hash, "score": example_json["selection_score"]}) + "\n")
+
+    # a roughly 1000 tokens limit for the source code
+    to_score = [example_json for example_json in json_data if fits(example_json["source_code"], 1000)]
+    if any(get_example_hash(example_json["source_code"]) not in cached_scores for example_json in to_score):
+        llm_selector = LLMSelector(llm_name)
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="example_score") as pool:
+        # list() raises the first exception of the workers
+        list(pool.map(score, to_score))
+    res_list: list[dict[str, Any]] = json_data
     
     # Write the modified JSON data back to the file
     with open(save_json_file, 'w') as f:
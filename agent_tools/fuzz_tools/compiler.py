@@ -1,10 +1,9 @@
 import time
 from utils.oss_fuzz_utils import OSSFuzzUtils
-from utils.docker_utils import DockerUtils
+from utils.docker_utils import DockerUtils, is_cancelled
+from utils.timing import timed
 from constants import CompileResults
-from utils.misc import save_code_to_file, remove_color_characters, kill_process
-import subprocess as sp
-import os
+from utils.misc import save_code_to_file, remove_color_characters
 import shutil
 from pathlib import Path
 from typing import Optional
@@ -87,6 +86,7 @@ class Compiler():
         with open(build_script_path, 'w') as f:
             f.writelines('\n'.join(all_lines))
         
+    @timed("compiler.compile_harness")
     def compile_harness(self,  harness_code: str, harness_path: Path, fuzzer_name: str, cmd: Optional[str]=None) -> tuple[CompileResults, str]:
         '''Compile the generated harness code'''
 
@@ -101,6 +101,9 @@ class Compiler():
         # build the image
         build_flag = False
         for _ in range(3):  # try multiple times to avoid some issues
+            # the draft of this build lost the race, the build is killed and not retried
+            if is_cancelled():
+                return CompileResults.ImageError, "Build cancelled, another draft passed first."
             if self.docker_tool.build_image(self.build_image_cmd):
                 build_flag = True
                 break
@@ -110,34 +113,12 @@ class Compiler():
         
         # recover the dockerfile, so that the harness file is not overwritten
 
-        # run the build command
-        process = None
-        try:
-            # self.docker_tool.run_cmd(["find", "-name", "comp"])
-            process = sp.run(self.build_harness_cmd,
-                   stdout=sp.PIPE,  # Capture standard output
-                    # Important!, build fuzzer error may not appear in stderr, so redirect stderr to stdout
-                   stderr=sp.STDOUT,  # Redirect standard error to standard output
-                   text=True,  # Get output as text (str) instead of bytes
-                   check=True,
-                   start_new_session=True
-                   ) # Raise exception if build fails
-
-            build_msg = remove_color_characters(process.stdout)
-            # succeed to run build command
-            fuzzer_name = os.path.join(self.oss_tool.get_path("fuzzer"), fuzzer_name)
-            if os.path.exists(fuzzer_name):
-                return CompileResults.Success, build_msg
-            
-            # For net-snmp, compile failed will also not generate the fuzzer but no error is raised
-            # TODO: more robust method to check compile error
-            else:
-                return CompileResults.CodeError, build_msg
-
-        except sp.CalledProcessError as e:
-            kill_process(process)
-            # remove color characters
-            build_msg = remove_color_characters(e.output)
-            return CompileResults.CodeError, build_msg
-
-          
\ No newline at end of file
+        # run the build command, the build output is the error message if the fuzzer is not built
+        fuzzer_path = Path(self.oss_tool.get_path("fuzzer")) / fuzzer_name
+        if is_cancelled():
+            return CompileResults.ImageError, "Build cancelled, another draft passed first."
+        build_ok, build_msg = self.docker_tool.build_fuzzers(self.build_harness_cmd, fuzzer_path)
+        build_msg = remove_color_characters(build_msg)
+        if build_ok:
+            return CompileResults.Success, build_msg
+        return CompileResults.CodeError, build_msg
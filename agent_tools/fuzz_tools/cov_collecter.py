@@ -5,12 +5,14 @@ from constants import PROJECT_PATH, CompileResults, COV_WRAP_FILE_NAME, Language
 from agent_tools.code_tools.parsers.cpp_parser import CPPParser
 from agent_tools.code_tools.parsers.c_parser import CParser
 from agent_tools.code_tools.parsers.java_parser import JavaParser
+from agent_tools.code_tools.parsers.harness_analysis import HarnessAnalysis
 from pathlib import Path
 import json
 import shutil
 import logging
 from typing import Optional
 from utils.misc import get_ext_lang
+from utils.timing import timed
 
 class CovCollector():
 
@@ -26,6 +28,7 @@ class CovCollector():
         self.project_lang = project_lang
         self.docker_utils = DockerUtils(oss_fuzz_dir, project_name, new_project_name, project_lang)
         self.parser = self.get_language_parser()
+        self.harness_analysis = HarnessAnalysis(project_lang, self.parser)
 
     def get_language_parser(self):
         if self.project_lang == LanguageType.CPP:
@@ -47,10 +50,9 @@ class CovCollector():
         wrap_code = wrap_file.read_text()
         
         # find the fuzz entry
-        parser = self.parser(None, harness_code)
-        fuzz_node = parser.get_fuzz_function_node(function_name, expression_flag=True)
+        fuzz_node = self.harness_analysis.target_call_node(harness_code, function_name, expression_flag=True)
         if not fuzz_node:
-            fuzz_node = parser.get_fuzz_function_node(function_name)
+            fuzz_node = self.harness_analysis.target_call_node(harness_code, function_name)
 
         if fuzz_node:
             fuzz_start_row, fuzz_start_col, fuzz_end_row = fuzz_node.start_point.row, fuzz_node.start_point.column, fuzz_node.end_point.row
@@ -70,7 +72,7 @@ class CovCollector():
 
         # insert the wrapper code before the fuzz entry
         entry_function = FuzzEntryFunctionMapping[self.project_lang]
-        entry_node = parser.get_definition_node(entry_function)
+        entry_node = self.harness_analysis.entry_node(harness_code)
         if not entry_node:
             raise Exception(f"Entry function {entry_function} not found")
         
@@ -94,10 +96,9 @@ class CovCollector():
         wrap_code = wrap_file.read_text()
         
         # Find the fuzz entry function and target function call
-        parser = self.parser(None, harness_code)
-        fuzz_node = parser.get_fuzz_function_node(function_name, expression_flag=True)
+        fuzz_node = self.harness_analysis.target_call_node(harness_code, function_name, expression_flag=True)
         if not fuzz_node:
-            fuzz_node = parser.get_fuzz_function_node(function_name)
+            fuzz_node = self.harness_analysis.target_call_node(harness_code, function_name)
 
         if fuzz_node:
             fuzz_start_row, fuzz_start_col, fuzz_end_row = fuzz_node.start_point.row, fuzz_node.start_point.column, fuzz_node.end_point.row
@@ -182,6 +183,7 @@ class CovCollector():
 
     # ./inchi_input_fuzzer -print_coverage=1 -runs=1  -timeout=100  ./corpora/ 2>&1 | grep inchi_dll.c | grep -w COVERED_FUNC | grep {}
     # ls -ltr
+    @timed("coverage.collect_coverage")
     def collect_coverage(self, harness_code: str, harness_path: Path, fuzzer_name: str,
                           function_name: str, corpora_dir: Path) -> tuple[int, int, bool]:
 
@@ -201,7 +203,8 @@ class CovCollector():
         cmd = ["python", cov_file, "--fuzzer-name", fuzzer_name, "--corpus-dir", "./corpora/"]
         local_out =  Path(self.oss_fuzz_dir) / "build" / "out" / self.new_project_name
 
-        # copy the cov_c.py to the out directory
+        # copy the cov_c.py to the out directory, which does not exist when the build is replayed
+        local_out.mkdir(parents=True, exist_ok=True)
         shutil.copy(Path(PROJECT_PATH) / "agent_tools" / "fuzz_tools" / cov_file, local_out / cov_file)
         
         # shutil.copy(Path(PROJECT_PATH) / "agent_tools" / "fuzz_tools" / "cov_wrap_code_c.txt", local_out / "cov_wrap_code_c.txt")
@@ -213,25 +216,23 @@ class CovCollector():
             self.logger.error(f"Docker Error running the coverage collection: {msg}") if self.logger else None
             return 0, 0, False
         
-        # sleep sev
-        cov_path = local_out / "cov.json"
-        if not cov_path.exists():
-            self.logger.error(f"Coverage file {cov_path} does not exist") if self.logger else None
+        # read through the docker tape, so that a replay gets the recorded coverage
+        cov_text = self.docker_utils.read_out_file("cov.json")
+        if not cov_text:
+            self.logger.error(f"Coverage file {local_out / 'cov.json'} does not exist") if self.logger else None
             return 0, 0, False
         
-        with open(cov_path, "r") as f:
-            cov = json.load(f)
-
-            msg = cov.get("msg", "")
-            if msg != "Success":
-                self.logger.error(f"Error running the coverage file: {msg}") if self.logger else None
-                return 0, 0, False
-            
-            init_cov, final_cov = cov.get("init_cov", 0), cov.get("final_cov", 0)
-            if init_cov != 0 and final_cov > init_cov:
-                return init_cov, final_cov, True
-            else:
-                return init_cov, final_cov, False
+        cov = json.loads(cov_text)
+        msg = cov.get("msg", "")
+        if msg != "Success":
+            self.logger.error(f"Error running the coverage file: {msg}") if self.logger else None
+            return 0, 0, False
+        
+        init_cov, final_cov = cov.get("init_cov", 0), cov.get("final_cov", 0)
+        if init_cov != 0 and final_cov > init_cov:
+            return init_cov, final_cov, True
+        else:
+            return init_cov, final_cov, False
             
 if __name__ == "__main__":
 
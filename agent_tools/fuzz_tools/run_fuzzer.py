@@ -2,9 +2,11 @@ import os
 import subprocess as sp
 from agent_tools.fuzz_tools.log_parser import FuzzLogParser
 from constants import ValResult, LanguageType
+from utils.timing import timed
+from utils.docker_tape import get_docker_tape
 import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 import threading
 
 def kill_process(process: Any):
@@ -25,7 +27,10 @@ class FuzzerRunner():
         self.run_timeout = run_timeout*60  # convert to seconds
         self.save_dir = save_dir
         self.project_lang = project_lang
+        # set by the owner to stop a running fuzzer early, e.g., another speculative draft already passed
+        self.cancel_event: Optional[threading.Event] = None
 
+    @timed("fuzzer.run_fuzzing")
     def run_fuzzing(self, counter: int, fuzzer_name: str, ignore_crashes: bool=False, no_log: bool=False) -> tuple[ValResult, list[str], list[list[str]]]:
         """
             Runs the fuzzer and captures its output. 
@@ -88,6 +93,15 @@ class FuzzerRunner():
             command.append('-fork=1')
 
         log_file_path = self.save_dir / f"fuzzing{counter}.log"
+        # with a docker tape, the fuzzing log of the same harness is recorded or replayed
+        tape = get_docker_tape()
+        tape_key, tape_call = "", ""
+        if tape is not None:
+            tape_key, tape_call = tape.key("run_fuzzing", {"fuzzer_name": fuzzer_name, "ignore_crashes": ignore_crashes, "run_timeout": self.run_timeout},
+                                           self.oss_fuzz_dir, self.oss_fuzz_dir / "projects" / self.new_project_name)
+            if tape.replaying:
+                log_file_path.write_text(tape.replay(tape_key, "run_fuzzing", ""), encoding='utf-8')
+                return FuzzLogParser(self.project_lang).parse_log(log_file_path)
       # Define the error patterns
         error_patterns = ['ERROR: LeakSanitizer',  'ERROR: libFuzzer:', 'ERROR: AddressSanitizer', "== Java Exception"]
         log_file = open(log_file_path, "w", encoding='utf-8', errors='ignore')
@@ -112,7 +126,11 @@ class FuzzerRunner():
             while time.time() - start_time < self.run_timeout+60:  # extra 60 seconds buffer
                 if process.poll() is not None:
                     break
-                time.sleep(10)  # Check every 10 seconds
+                if self.cancel_event is None:
+                    time.sleep(10)  # Check every 10 seconds
+                elif self.cancel_event.wait(10):
+                    print(f"Fuzzer {fuzzer_name} for {self.new_project_name} is cancelled")
+                    break
            
         except sp.TimeoutExpired:
             # sleep some time to make sure the log file is written, otherwise, some part of the log file may be missing
@@ -125,4 +143,6 @@ class FuzzerRunner():
             if reader_thread is not None:
                 reader_thread.join(timeout=2)
             log_file.close()
+            if tape is not None:
+                tape.record(tape_key, "run_fuzzing", tape_call, log_file_path.read_text(encoding='utf-8', errors='ignore'))
             return FuzzLogParser(self.project_lang).parse_log(log_file_path)
\ No newline at end of file
@@ -1,5 +1,5 @@
 import os
-from constants import EvalResult, LanguageType, PROJECT_PATH
+from constants import EvalResult, LanguageType, ValResult, PROJECT_PATH
 from collections import defaultdict
 from agent_tools.code_tools.parsers.cpp_parser import CPPParser
 from agent_tools.code_tools.parsers.java_parser import JavaParser 
@@ -7,10 +7,16 @@ from utils.misc import extract_name, get_run_path
 from pathlib import Path
 from typing import DefaultDict
 from utils.misc import write_list_to_file
-from typing import Any
+from utils.run_ledger import RunLedger
+from utils.event_log import Stage, EVENT_FILE, read_events, find_events
+from typing import Any, Optional
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
 
 OSSFUZZ = Path(f"{PROJECT_PATH}/code/oss-fuzz")
+# classification results of work dirs, the key changes when the harness or the log changes
+RES_CACHE_FILE = ".run_res_cache.json"
 benchmark_dir = Path(f"{PROJECT_PATH}/benchmark-sets")
 
 def get_language_info(project_name: str) -> str:
@@ -24,6 +30,22 @@ def get_language_info(project_name: str) -> str:
             return lang
     return "none"
 
+def is_run_passed(events: list[dict[str, Any]], semantic_mode: str) -> bool:
+    """
+    Decide from the events of a run whether the harness passed the fuzzing (and the semantic check).
+    A run that exited with an exception is judged by the same events, like the agent.log of the old runs
+    (the exception is logged as an error, not as the "WARNING ... Exit" line of NoLogError).
+    """
+    semantic_results = [e.get("result") for e in find_events(events, Stage.SemanticCheck, "result")]
+    if semantic_mode in ["both", "eval"]:
+        passed = "passed" in semantic_results
+    else:
+        passed = any(e.get("result") == ValResult.NoError.value for e in find_events(events, Stage.Fuzzer, "end"))
+
+    if semantic_mode == "eval" and "failed" in semantic_results:
+        return False
+    return passed
+
 def get_run_res(work_dir: Path, semantic_mode: str="eval", language: LanguageType=LanguageType.CPP) -> EvalResult:
 
     work_dir = Path(work_dir)
@@ -35,26 +57,32 @@ def get_run_res(work_dir: Path, semantic_mode: str="eval", language: LanguageTyp
     function_signature = func_sig_path.read_text()
     function_name = extract_name(function_signature, language=language)
 
-    if not log_file.exists():
-        return EvalResult.NoLogError
-
-    log_lines = log_file.read_text()
-   
-    for line in log_lines.split("\n"):
-        if "WARNING" in line and "Exit" in line:
+    event_file = work_dir / EVENT_FILE
+    if event_file.exists():
+        # runs with an event log, no need to grep agent.log
+        if not is_run_passed(read_events(event_file), semantic_mode):
+            return EvalResult.Failed
+    else:
+        if not log_file.exists():
             return EvalResult.NoLogError
 
-    # for issta
-    if semantic_mode in ["both", "eval"]:
-        pass_pattern = "Semantic check passed"
-    else:
-        pass_pattern = "Fuzz res:No Error"
+        log_lines = log_file.read_text()
+       
+        for line in log_lines.split("\n"):
+            if "WARNING" in line and "Exit" in line:
+                return EvalResult.NoLogError
+
+        # for issta
+        if semantic_mode in ["both", "eval"]:
+            pass_pattern = "Semantic check passed"
+        else:
+            pass_pattern = "Fuzz res:No Error"
+            
+        if pass_pattern not in log_lines:
+            return EvalResult.Failed
         
-    if pass_pattern not in log_lines:
-        return EvalResult.Failed
-    
-    if semantic_mode == "eval" and "Semantic check failed" in log_lines:
-        return EvalResult.Failed
+        if semantic_mode == "eval" and "Semantic check failed" in log_lines:
+            return EvalResult.Failed
 
     if language in [LanguageType.CPP, LanguageType.C]:
         parser = CPPParser(file_path=harness_path)
@@ -71,7 +99,100 @@ def get_run_res(work_dir: Path, semantic_mode: str="eval", language: LanguageTyp
     else:
         return EvalResult.NoCall
 
+def get_run_res_key(work_dir: Path, semantic_mode: str, language: LanguageType) -> str:
+    """
+    The memo key of a work dir: the harness hash, the size and mtime of agent.log/events.jsonl and the evaluation options.
+    """
+    key_parts: list[str] = [semantic_mode, language.value]
+    for file_name in ["harness.txt", "function.txt"]:
+        file_path = work_dir / file_name
+        key_parts.append(hashlib.sha1(file_path.read_bytes()).hexdigest() if file_path.exists() else "")
+
+    for file_name in ["agent.log", EVENT_FILE]:
+        file_path = work_dir / file_name
+        if file_path.exists():
+            stat = file_path.stat()
+            key_parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+        else:
+            key_parts.append("")
+    return "|".join(key_parts)
+
+
+def _classify_work_dir(args: tuple[Path, str, LanguageType]) -> tuple[str, str]:
+    work_dir, semantic_mode, language = args
+    return str(work_dir), get_run_res(work_dir, semantic_mode=semantic_mode, language=language).value
+
+
+def get_run_res_batch(work_dirs: list[Path], semantic_mode: str = "eval", language: LanguageType = LanguageType.CPP,
+                      num_workers: Optional[int] = None, cache_file: Optional[Path] = None) -> dict[str, EvalResult]:
+    """
+    Classify work dirs with a process pool, only the work dirs that changed since the last call are classified.
+    Args:
+        work_dirs (list[Path]): The run directories.
+        semantic_mode (str): The semantic mode, same as get_run_res.
+        language (LanguageType): The project language.
+        num_workers (int): The number of processes, default is the number of CPUs.
+        cache_file (Path): The memo file, no memoization if None.
+    Returns:
+        dict[str, EvalResult]: work dir -> result.
+    """
+    memo: dict[str, dict[str, str]] = {}
+    if cache_file and cache_file.exists():
+        try:
+            with open(cache_file, "r") as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+
+    results: dict[str, EvalResult] = {}
+    keys: dict[str, str] = {}
+    todo: list[tuple[Path, str, LanguageType]] = []
+    for work_dir in work_dirs:
+        key = get_run_res_key(work_dir, semantic_mode, language)
+        keys[str(work_dir)] = key
+        cached = memo.get(str(work_dir))
+        if cached and cached.get("key") == key:
+            results[str(work_dir)] = EvalResult(cached["res"])
+        else:
+            todo.append((work_dir, semantic_mode, language))
+
+    print(f"Classify {len(todo)} of {len(work_dirs)} work dirs, {len(work_dirs) - len(todo)} unchanged")
+    num_workers = min(num_workers or os.cpu_count() or 1, len(todo))
+    if num_workers <= 1:
+        classified = map(_classify_work_dir, todo)
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            classified = list(pool.map(_classify_work_dir, todo, chunksize=16))
+
+    for work_dir_str, res in classified:
+        results[work_dir_str] = EvalResult(res)
+        memo[work_dir_str] = {"key": keys[work_dir_str], "res": res}
+
+    if cache_file and todo:
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}")
+        with open(tmp_file, "w") as f:
+            json.dump(memo, f)
+        os.replace(tmp_file, cache_file)
+    return results
+
+def collect_run_info_from_ledger(ledger: RunLedger, n_run:int=1, single_run:bool=False) -> tuple[list[tuple[str, str, Path]], list[str], set[str]]:
+    build_failed: list[str] = []
+    all_path:list[tuple[str, str, Path]] = []
+    for project_name, func_sig, work_dir in ledger.get_runs(n_run, single_run=single_run):
+        # check if the directory is empty
+        if not work_dir.is_dir() or len(os.listdir(work_dir)) <= 4 or not (work_dir / "function.txt").exists():
+            build_failed.append(f"{project_name}/{work_dir.parent.name}")
+            continue
+        all_path.append((project_name, func_sig, work_dir))
+
+    return all_path, build_failed, ledger.get_projects()
+
 def collect_run_info(output_path: Path, n_run:int=1, single_run:bool=False) -> tuple[list[tuple[str, str, Path]], list[str], set[str]]:
+    # the runner records every run in the ledger, no need to walk the output tree
+    ledger = RunLedger(output_path)
+    if ledger.exists():
+        return collect_run_info_from_ledger(ledger, n_run=n_run, single_run=single_run)
+
     build_failed: list[str] = []
     all_projects: set[str] = set()
     all_path:list[tuple[str, str, Path]] = []
@@ -112,7 +233,8 @@ def collect_run_info(output_path: Path, n_run:int=1, single_run:bool=False) -> t
 
     return all_path, build_failed, all_projects
 
-def run_agent_res(output_path: Path, semantic_mode:str, n_run:int=1, language: LanguageType=LanguageType.CPP): 
+def run_agent_res(output_path: Path, semantic_mode:str, n_run:int=1, language: LanguageType=LanguageType.CPP,
+                  num_workers: Optional[int] = None): 
 
     res_count: DefaultDict[str, int] = defaultdict(int)
     lang_count: DefaultDict[str, int] = defaultdict(int)
@@ -124,13 +246,21 @@ def run_agent_res(output_path: Path, semantic_mode:str, n_run:int=1, language: L
     # save the projects whose functions are all failed
     all_path, build_failed, all_projects = collect_run_info(output_path, n_run=n_run)
     
+    # classify all work dirs first, unchanged work dirs are read from the memo file
+    run_res = get_run_res_batch([work_dir for _, _, work_dir in all_path], semantic_mode=semantic_mode, language=language,
+                                num_workers=num_workers, cache_file=output_path / RES_CACHE_FILE)
+
+    ledger = RunLedger(output_path)
+    if ledger.exists():
+        ledger.set_eval_results({work_dir: eval_res.value for work_dir, eval_res in run_res.items()})
+
     # collect results first
     results_list: list[tuple[str, str, EvalResult]] = []
     for project_name, func_sig, work_dir in all_path:
 
         # get language info
         function_name = extract_name(func_sig, keep_namespace=True, language=language)
-        eval_res = get_run_res(work_dir, semantic_mode=semantic_mode, language=language)
+        eval_res = run_res[str(work_dir)]
 
         if eval_res != EvalResult.Success:
             res_count[eval_res.value] += 1
@@ -195,10 +325,15 @@ def get_evaluation_results(eval_path: Path) -> tuple[float, float, float, float]
             continue
 
         # check whether the fuzz crash 
-        log_file = run_dir / "agent.log"
-        assert log_file.exists(), f"Log file not found: {log_file}"
-
-        if "ValResult.Crash" in log_file.read_text():
+        event_file = run_dir / EVENT_FILE
+        if event_file.exists():
+            crashed = any(e.get("result") == ValResult.Crash.value for e in find_events(read_events(event_file), Stage.Fuzzer, "end"))
+        else:
+            log_file = run_dir / "agent.log"
+            assert log_file.exists(), f"Log file not found: {log_file}"
+            crashed = "ValResult.Crash" in log_file.read_text()
+
+        if crashed:
             # print(f"Fuzzer crashed during evaluation: {log_file}")
             eval_res[key] = (-1, -1)
             continue
@@ -0,0 +1,194 @@
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import logging
+from pathlib import Path, PurePosixPath
+from typing import Optional
+from utils.docker_utils import DockerUtils
+
+# build outputs and binaries are not useful for reading code
+SKIPPED_EXTENSIONS = {".o", ".a", ".so", ".lo", ".la", ".obj", ".dylib", ".pyc", ".class", ".jar", ".zip",
+                      ".tar", ".gz", ".xz", ".bz2", ".png", ".jpg", ".pdf"}
+SKIPPED_DIRS = {".git", ".svn", ".hg"}
+# larger files are read from the container
+MAX_FILE_SIZE = 4 * 1024 * 1024
+INDEX_FILE = "index.json"
+# image id -> name of its mirror dir, so the runs of the same image skip the export
+IMAGE_DIR = "images"
+
+
+class SourceMirror():
+    '''
+    A read-only local copy of /src of the project image.
+    The mirror directory is named by a digest of the mirrored files, so runs of a project with identical sources share
+    one copy under cache_root. The mirror of an image id is remembered under images/, the other runs of the same image
+    load it without exporting /src again. It keeps a file name -> paths index of the whole /src (the same answer as find /src -name)
+    and reads line ranges with mmap, so the tools do not need a docker exec to read the source code.
+    '''
+
+    def __init__(self, mirror_root: Path, logger: logging.Logger):
+        self.mirror_root = mirror_root
+        self.logger = logger
+        self.mirror_dir: Optional[Path] = None
+        # file name -> absolute paths in the container
+        self.file_index: dict[str, list[str]] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.mirror_dir is not None
+
+    def build(self, docker_tool: DockerUtils, container_id: str, src_dir: str = "/src") -> bool:
+        """
+        Export src_dir from the container and load (or create) the local mirror.
+        Returns:
+            bool: True if the mirror is ready to use.
+        """
+        self.mirror_root.mkdir(parents=True, exist_ok=True)
+        image_file = self.image_file(docker_tool.get_image_id(container_id))
+        if image_file is not None and image_file.exists():
+            mirror_dir = self.mirror_root / image_file.read_text().strip()
+            if (mirror_dir / INDEX_FILE).exists():
+                self.load(mirror_dir)
+                return True
+
+        # keep the archive on the same disk as the mirror, /tmp may be small
+        with tempfile.TemporaryFile(dir=self.mirror_root) as archive:
+            if not docker_tool.export_path(container_id, src_dir, archive):
+                return False
+            archive.seek(0)
+            with tarfile.open(fileobj=archive, mode="r:") as tar:
+                members = tar.getmembers()
+                digest = self.digest_members(tar, members)
+                mirror_dir = self.mirror_root / digest
+                if not (mirror_dir / INDEX_FILE).exists():
+                    self.logger.info(f"Create source mirror {mirror_dir}")
+                    self.extract_members(tar, members, mirror_dir)
+
+        if image_file is not None:
+            image_file.parent.mkdir(parents=True, exist_ok=True)
+            image_file.write_text(mirror_dir.name)
+        self.load(mirror_dir)
+        return True
+
+    def image_file(self, image_id: str) -> Optional[Path]:
+        if not image_id:
+            return None
+        return self.mirror_root / IMAGE_DIR / image_id.replace(":", "_")
+
+    def load(self, mirror_dir: Path) -> None:
+        with open(mirror_dir / INDEX_FILE, "r") as f:
+            self.file_index = json.load(f)
+        self.mirror_dir = mirror_dir
+
+    @staticmethod
+    def is_mirrored(member: tarfile.TarInfo) -> bool:
+        if not member.isfile() or member.size > MAX_FILE_SIZE:
+            return False
+        path = PurePosixPath(member.name)
+        if path.is_absolute() or ".." in path.parts:
+            return False
+        if SKIPPED_DIRS.intersection(path.parts):
+            return False
+        return path.suffix.lower() not in SKIPPED_EXTENSIONS
+
+    def digest_members(self, tar: tarfile.TarFile, members: list[tarfile.TarInfo]) -> str:
+        # only the path and content matter, timestamps differ from build to build
+        hasher = hashlib.sha256()
+        for member in members:
+            if not self.is_mirrored(member):
+                continue
+            hasher.update(member.name.encode("utf-8", errors="replace") + b"\0")
+            fileobj = tar.extractfile(member)
+            if fileobj is None:
+                continue
+            for chunk in iter(lambda: fileobj.read(1 << 20), b""):
+                hasher.update(chunk)
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def extract_members(self, tar: tarfile.TarFile, members: list[tarfile.TarInfo], mirror_dir: Path) -> None:
+        # extract into a temporary directory and rename it, concurrent runs of the same project may race here
+        tmp_dir = mirror_dir.with_name(f"{mirror_dir.name}.tmp{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        file_index: dict[str, list[str]] = {}
+        for member in members:
+            # the index covers every entry, like find does
+            name = PurePosixPath(member.name)
+            if name.name:
+                file_index.setdefault(name.name, []).append("/" + str(name))
+            if not self.is_mirrored(member):
+                continue
+            fileobj = tar.extractfile(member)
+            if fileobj is None:
+                continue
+            target = tmp_dir / member.name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "wb") as f:
+                shutil.copyfileobj(fileobj, f)
+
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        with open(tmp_dir / INDEX_FILE, "w") as f:
+            json.dump(file_index, f)
+        try:
+            os.rename(tmp_dir, mirror_dir)
+        except OSError:
+            # another run created the same mirror first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def find(self, file_name: str) -> Optional[list[str]]:
+        """
+        Get all paths of a file name in /src, None if the mirror is not ready.
+        """
+        if not self.ready:
+            return None
+        return list(self.file_index.get(file_name, []))
+
+    def local_path(self, file_path: str) -> Optional[Path]:
+        if self.mirror_dir is None:
+            return None
+        path = PurePosixPath(file_path)
+        if not path.is_absolute() or ".." in path.parts:
+            return None
+        local = self.mirror_dir / str(path).lstrip("/")
+        if not local.is_file():
+            return None
+        return local
+
+    def read_lines(self, file_path: str, start_line: int, end_line: int) -> Optional[str]:
+        """
+        Read lines [start_line, end_line] (1-indexed) of a file, like sed -n 'start,endp'.
+        Returns:
+            str: The lines, None if the file is not in the mirror.
+        """
+        local = self.local_path(file_path)
+        if local is None:
+            return None
+
+        with open(local, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start, lineno = 0, 1
+                while lineno < start_line:
+                    start = mm.find(b"\n", start)
+                    if start == -1:
+                        return ""
+                    start += 1
+                    lineno += 1
+
+                end = start
+                while lineno <= end_line:
+                    pos = mm.find(b"\n", end)
+                    if pos == -1:
+                        end = size
+                        break
+                    end = pos + 1
+                    lineno += 1
+                return mm[start:end].decode("utf-8", errors="replace")
+
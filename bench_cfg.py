@@ -30,11 +30,30 @@ class BenchConfig:
         self.max_fix = self.config.get('max_fix', 5)
         self.max_tool_call = self.config.get('max_tool_call', 15)
         self.usage_token_limit = self.config.get('usage_token_limit', 1000)
+        # LLM response cache under cache_root: read_through, record, replay (fail on miss) or bypass
+        self.llm_cache_mode = self.config.get('llm_cache_mode', "bypass")
+        # base url of an OpenAI-compatible server for all LLM calls (e.g., the mock server), empty for the providers
+        self.llm_base_url = self.config.get('llm_base_url', "")
+        self.llm_cache_size_mb = self.config.get('llm_cache_size_mb', 1024)
+        # requests and tokens per minute of the model shared by all workers, 0 to disable
+        self.llm_rpm = self.config.get('llm_rpm', 0)
+        self.llm_tpm = self.config.get('llm_tpm', 0)
+        # compact old drafts, tool results and errors before an LLM call above this many tokens, 0 to disable
+        self.history_token_budget = self.config.get('history_token_budget', 0)
+        # number of drafts forked from the initial prompt, each runs its generate/compile/fix/fuzz loop concurrently in its own
+        # workspace and the first one that passes the semantic check wins, 1 to generate a single draft
+        self.speculative_drafts = self.config.get('speculative_drafts', 1)
+        # draft k uses temperature + k * step (at most 1.0) and another window of the examples
+        self.speculative_temperature_step = self.config.get('speculative_temperature_step', 0.2)
         self.model_token_limit = self.config.get('model_token_limit', 8096)
         self.n_examples = self.config.get('n_examples', 1)
         self.funcs_per_project = self.config.get('funcs_per_project', 1)
         self.example_mode = self.config.get('example_mode', "rank")
         self.example_source = self.config.get('example_source', "project")
+        # threads scoring the examples in rank mode
+        self.example_score_workers = self.config.get('example_score_workers', 8)
+        # if True, examples that never call the function get score 0 without asking the LLM
+        self.example_prefilter = self.config.get('example_prefilter', False)
         self.iterations = self.config.get('iterations', 3)
         self.num_processes = self.config.get('num_processes', os.cpu_count() // 3) # type: ignore
         self.project_name = self.config.get('project_name', [])
@@ -51,6 +70,32 @@ class BenchConfig:
         # if True, only use semantic check for evaluation
         self.semantic_mode = self.config.get('semantic_mode', "both")
         self.use_cache_harness_pairs = self.config.get('use_cache_harness_pairs', True)
+        # seconds to wait for the LSP retriever in mixed mode before using the parser result,
+        # capped below the exec timeout of the retriever (60s for C/C++)
+        self.mixed_retriever_timeout = self.config.get('mixed_retriever_timeout', 45)
+        # max number of docker execs (a mixed query counts once, its LSP and parser run together) in the retriever container
+        # at the same time, shared by the tool calls of a turn and by the speculative drafts of the run.
+        # 1 (serial) by default, raise it for speculative_drafts > 1 or when the retriever execs are stable for the project
+        self.tool_concurrency = self.config.get('tool_concurrency', 1)
+        # if True, the in-container retrievers also dump their results into /out (debug only)
+        self.debug_retriever_files = self.config.get('debug_retriever_files', False)
+        # keep a local read-only copy of /src under cache_root for view_code and file lookups
+        self.src_mirror = self.config.get('src_mirror', True)
+        # record the docker calls of each run into its run dir, or replay them without docker (off, record or replay)
+        # use with llm_cache_mode replay or the mock server for hermetic benchmarks
+        self.docker_tape_mode = self.config.get('docker_tape_mode', "off")
+        # the save_root of the recorded runs, for replay
+        self.docker_tape_dir = Path(self.config.get('docker_tape_dir', ""))
+        if not self.docker_tape_dir.is_absolute():
+            self.docker_tape_dir = PROJECT_PATH / self.docker_tape_dir
+
+        # seconds between rewrites of <save_root>/metrics.prom, 0 to disable
+        self.metrics_interval = self.config.get('metrics_interval', 30)
+        # profile every run: none, cprofile (each graph node in its thread) or sampling (all threads),
+        # saved as profile.prof/profile.collapsed in the run dir
+        self.profile_mode = self.config.get('profile_mode', "none")
+        # if True, the in-container retrievers also dump a cProfile file per call into the run dir
+        self.profile_retrievers = self.config.get('profile_retrievers', False)
 
         # for fuzzing
         self.no_log = self.config.get('no_log', False)
@@ -89,7 +89,8 @@ class CoverageDocker:
         print("[*] Building coverage fuzzers...")
         cmd = ["python", str(self.helper), "build_fuzzers", 
                "--clean", "--sanitizer=coverage", self.new_project]
-        if not self.docker.build_fuzzers(cmd):
+        build_ok, _ = self.docker.build_fuzzers(cmd)
+        if not build_ok:
             print("[-] Failed to build fuzzers")
             return False
         
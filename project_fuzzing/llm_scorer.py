@@ -6,6 +6,7 @@ Usage:
     python coverage_scorer.py coverage_output/libssh/functions.json
     python coverage_scorer.py functions.json --limit 50 --model gpt-4o-mini
     python coverage_scorer.py functions.json --batch  # Use Batch API (50% cheaper)
+    python coverage_scorer.py functions.json --concurrency 32  # Async calls, resumable from the checkpoint
     
 Output: functions_scored.json with LLM scores
 """
@@ -15,6 +16,9 @@ import json
 import os
 import sys
 import time
+import random
+import asyncio
+import hashlib
 from pathlib import Path
 from typing import Optional
 import openai
@@ -154,6 +158,104 @@ class CoverageScorer:
         func['reason'] = "LLM scoring failed, pass"
         return func
     
+    def func_key(self, func: dict[str, Any]) -> str:
+        """Key of a function in the checkpoint file."""
+        raw = f"{func.get('name', '')}\x00{func.get('source_code', '')}"
+        return hashlib.sha1(raw.encode("utf-8", errors="replace")).hexdigest()
+
+    def load_checkpoint(self, checkpoint_file: Path) -> dict[str, dict[str, Any]]:
+        """Read the completed scores, the last line may be incomplete if the scorer was killed."""
+        done: dict[str, dict[str, Any]] = {}
+        if not checkpoint_file.exists():
+            return done
+        with open(checkpoint_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[record['key']] = record
+        return done
+
+    async def ascore(self, client: Any, func: dict[str, Any], semaphore: asyncio.Semaphore,
+                     max_retries: int = 5) -> dict[str, Any]:
+        """Score one function with the async client, retry with exponential backoff and jitter."""
+        prompt = SCORE_PROMPT.format(
+            project=self.project,
+            name=func.get('name', ""),
+            source_code=self.truncate_source(func.get('source_code', '')),
+        )
+
+        for attempt in range(max_retries):
+            async with semaphore:
+                try:
+                    resp = await client.chat.completions.create(
+                        model=self.model,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=self.temperature,
+                    )
+                    result = self._parse_score_response(resp.choices[0].message.content or "")
+                    if result['score'] != -1:
+                        func['score'] = result['score']
+                        func['reason'] = result['reason']
+                        return func
+                except Exception as e:
+                    print(f"[!] LLM error for {func.get('name', '?')} (attempt {attempt + 1}): {e}")
+            # back off outside the semaphore, so the other requests keep going
+            await asyncio.sleep(min(2 ** attempt, 60) + random.random())
+
+        func['score'] = -1
+        func['reason'] = "LLM scoring failed, pass"
+        return func
+
+    async def ascore_all(self, to_score: list[dict[str, Any]], concurrency: int,
+                         checkpoint_file: Path, max_retries: int) -> None:
+        done = self.load_checkpoint(checkpoint_file)
+        pending: list[dict[str, Any]] = []
+        for func in to_score:
+            record = done.get(self.func_key(func))
+            if record:
+                func['score'] = record['score']
+                func['reason'] = record['reason']
+            else:
+                pending.append(func)
+        print(f"[*] {len(to_score) - len(pending)} scores loaded from {checkpoint_file}, {len(pending)} to score")
+
+        client = openai.AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [asyncio.create_task(self.ascore(client, func, semaphore, max_retries)) for func in pending]
+        checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        # stream every completed score to the checkpoint, failed ones are retried on the next run
+        with open(checkpoint_file, 'a') as f:
+            for i, task in enumerate(asyncio.as_completed(tasks)):
+                func = await task
+                if func['score'] != -1:
+                    record = {'key': self.func_key(func), 'name': func.get('name', ''),
+                              'score': func['score'], 'reason': func['reason']}
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+                if (i + 1) % 50 == 0:
+                    print(f"[*] Scored {i+1}/{len(pending)}")
+        await client.close()
+
+    def score_all_async(self, functions: list[dict[str, Any]],
+                        limit: int = 100,
+                        concurrency: int = 16,
+                        checkpoint_file: Optional[Path] = None,
+                        max_retries: int = 5) -> list[dict[str, Any]]:
+        """Score multiple functions with up to concurrency async API calls at the same time.
+
+        Completed scores are appended to checkpoint_file, a restarted run only scores the rest.
+        """
+        to_score = functions[:limit]
+        if checkpoint_file is None:
+            checkpoint_file = Path(f"{self.project}_scores.checkpoint.jsonl")
+        asyncio.run(self.ascore_all(to_score, max(concurrency, 1), checkpoint_file, max_retries))
+
+        # Sort by score descending
+        to_score.sort(key=lambda f: f.get('score', 0), reverse=True)
+        return to_score
+
     def score_all_individual(self, functions: list[dict[str, Any]], 
                     limit: int = 100, 
                     delay: float = 0.3) -> list[dict[str, Any]]:
@@ -307,6 +409,11 @@ def main():
     # Batch API options (50% cheaper)
     parser.add_argument("--batch", action="store_true", help="Use Batch API (50% cheaper, async)")
     parser.add_argument("--batch-id", default="", help="Retrieve results from existing batch")
+
+    # Async options
+    parser.add_argument("--concurrency", type=int, default=0, help="Number of concurrent API calls, 0 for sequential calls")
+    parser.add_argument("--checkpoint", default="", help="Checkpoint jsonl of the completed scores (async mode)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per function (async mode)")
     
     args = parser.parse_args()
    
@@ -341,6 +448,13 @@ def main():
         print(f"\n[+] Batch submitted! To retrieve results later, run:")
         print(f"    python {sys.argv[0]} --project {args.project} --batch-id {batch_id}")
         return
+    # Async scoring with bounded concurrency
+    elif args.concurrency > 0:
+        print(f"[*] Scoring {min(args.limit, len(functions))} functions with {args.concurrency} concurrent calls...")
+        checkpoint_file = Path(args.checkpoint) if args.checkpoint else \
+            Path("/home/yk/code/LLM-reasoning-agents/project_fuzzing/projects") / args.project / "functions_scored.checkpoint.jsonl"
+        scored = scorer.score_all_async(functions, limit=args.limit, concurrency=args.concurrency,
+                                        checkpoint_file=checkpoint_file, max_retries=args.max_retries)
     # Regular scoring (individual API calls)
     else:
         print(f"[*] Scoring {min(args.limit, len(functions))} functions...")
@@ -0,0 +1,176 @@
+import re
+import json
+import hashlib
+import inspect
+import functools
+import threading
+from enum import Enum
+from pathlib import Path
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+from utils.event_log import Stage, emit_event
+
+DOCKER_TAPE_FILE = "docker_tape.jsonl"
+
+# the random parts of a run: the new project name and the names of the copied harness files
+RUN_NAME_PATTERN = re.compile(r"run\d+_[a-z]{16}")
+HARNESS_NAME_PATTERN = re.compile(r"_[a-z]{16}(?=\.\w+)")
+RUN_NAME_BYTES = re.compile(rb"run\d+_[a-z]{16}")
+HARNESS_NAME_BYTES = re.compile(rb"_[a-z]{16}(?=\.\w+)")
+
+
+class DockerTapeMode(Enum):
+    # run docker as usual
+    Off = "off"
+    # run docker and save the inputs and outputs of every call into the run dir
+    Record = "record"
+    # serve the saved outputs, docker is never called
+    Replay = "replay"
+
+
+class DockerTape():
+    '''
+    The docker calls of one run (build_image, build_fuzzers, run_cmd, exec_in_container and the fuzzing log) with their outputs.
+    The key of a call is its method and arguments without the random run name, the oss-fuzz path, the save_root (the corpus
+    volumes of the coverage are under the run dir), the container id and the timeout.
+    Builds and fuzzing also hash the project dir (Dockerfile, build.sh and the harness files), so each draft has its own key.
+    The same key called n times replays the n-th recorded output (the last one after that), e.g., the retries of a build.
+    The retriever results are the stdout of exec_in_container, so they are replayed with the other calls.
+    The files the pipeline reads back from /out (e.g., cov.json) are taped with read_out_file.
+    '''
+
+    def __init__(self, tape_file: Path, mode: DockerTapeMode, save_root: Optional[Path] = None):
+        self.tape_file = tape_file
+        self.mode = mode
+        self.save_root = save_root
+        self.lock = threading.Lock()
+        # key -> recorded outputs in call order
+        self.entries: dict[str, list[Any]] = {}
+        self.counters: dict[str, int] = {}
+        if self.replaying and self.tape_file.exists():
+            with open(self.tape_file, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry["key"], []).append(entry["result"])
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == DockerTapeMode.Replay
+
+    def workspace_digest(self, project_dir: Path) -> str:
+        # the copied harness files have random names, only their normalized names and contents matter
+        items: list[tuple[str, str]] = []
+        if project_dir.exists():
+            for path in project_dir.rglob("*"):
+                if not path.is_file() or path.suffix == ".bak":
+                    continue
+                name = HARNESS_NAME_PATTERN.sub("_", str(path.relative_to(project_dir)))
+                content = HARNESS_NAME_BYTES.sub(b"_", RUN_NAME_BYTES.sub(b"<run>", path.read_bytes()))
+                items.append((name, hashlib.sha1(content).hexdigest()))
+        return hashlib.sha1(json.dumps(sorted(items)).encode("utf-8")).hexdigest()
+
+    def key(self, method: str, args: dict[str, Any], oss_fuzz_dir: Path, project_dir: Optional[Path] = None) -> tuple[str, str]:
+        """
+        Returns:
+            tuple[str, str]: The key of the call and its normalized arguments.
+        """
+        call = json.dumps(args, sort_keys=True, default=str)
+        # the longer path first, in case one of them is under the other
+        host_paths = [(str(oss_fuzz_dir), "<oss_fuzz>")]
+        if self.save_root is not None:
+            host_paths.append((str(self.save_root), "<save_root>"))
+        for path, name in sorted(host_paths, key=lambda item: len(item[0]), reverse=True):
+            call = call.replace(path, name)
+        call = RUN_NAME_PATTERN.sub("<run>", call)
+        workspace = self.workspace_digest(project_dir) if project_dir else ""
+        return hashlib.sha1(f"{method}\n{call}\n{workspace}".encode("utf-8")).hexdigest(), call
+
+    def record(self, key: str, method: str, call: str, result: Any) -> None:
+        with self.lock:
+            self.tape_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.tape_file, "a") as f:
+                f.write(json.dumps({"key": key, "method": method, "call": call, "result": result}) + "\n")
+
+    def replay(self, key: str, method: str, miss: Any) -> Any:
+        with self.lock:
+            results = self.entries.get(key)
+            index = self.counters.get(key, 0)
+            self.counters[key] = index + 1
+        emit_event(Stage.Cache, "lookup", cache="docker", method=method, hit=bool(results))
+        if not results:
+            return miss
+        return results[min(index, len(results) - 1)]
+
+
+_current_docker_tape: ContextVar[Optional[DockerTape]] = ContextVar("current_docker_tape", default=None)
+
+
+def set_docker_tape(tape: Optional[DockerTape]) -> None:
+    _current_docker_tape.set(tape)
+
+
+def get_docker_tape() -> Optional[DockerTape]:
+    return _current_docker_tape.get()
+
+
+def find_recorded_tape(tape_root: Path, project_name: str, function_name: str, n_run: int) -> Optional[Path]:
+    """The tape of the same project/function/run under the save_root of a recorded benchmark."""
+    function_dir = tape_root / project_name.lower() / function_name.lower()
+    if not function_dir.exists():
+        return None
+    for tape_file in sorted(function_dir.glob(f"run{n_run}_*/{DOCKER_TAPE_FILE}")):
+        return tape_file
+    return None
+
+
+def load_docker_tape(mode: str, save_root: Path, save_dir: Path, tape_root: Path, project_name: str, function_name: str, n_run: int) -> Optional[DockerTape]:
+    """
+    Returns:
+        DockerTape: The tape of the run, None if the mode is off. A replay without a recorded tape misses on every call.
+    """
+    tape_mode = DockerTapeMode(mode)
+    if tape_mode == DockerTapeMode.Off:
+        return None
+    if tape_mode == DockerTapeMode.Record:
+        return DockerTape(save_dir / DOCKER_TAPE_FILE, tape_mode, save_root)
+    tape_file = find_recorded_tape(tape_root, project_name, function_name, n_run)
+    return DockerTape(tape_file if tape_file else tape_root / DOCKER_TAPE_FILE, tape_mode, save_root)
+
+
+def to_json(result: Any) -> Any:
+    # tuples are saved as lists
+    return list(result) if isinstance(result, tuple) else result
+
+
+def taped(method: str, miss: Any, ignore: tuple[str, ...] = (), workspace: bool = False) -> Callable[..., Any]:
+    """
+    Record or replay a DockerUtils method with the tape of the current run.
+    Args:
+        method (str): The name of the call in the tape.
+        miss (Any): The output in replay mode when the call was not recorded.
+        ignore (tuple[str, ...]): The arguments that are not part of the key (container id, timeout).
+        workspace (bool): If True, the key also has the digest of the project dir.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            tape = get_docker_tape()
+            if tape is None:
+                return func(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            call_args = {name: value for name, value in bound.arguments.items() if name != "self" and name not in ignore}
+            project_dir = Path(self.ossfuzz_dir) / "projects" / self.new_project_name if workspace else None
+            key, call = tape.key(method, call_args, self.ossfuzz_dir, project_dir)
+            if tape.replaying:
+                result = tape.replay(key, method, to_json(miss))
+                return tuple(result) if isinstance(miss, tuple) else result
+            result = func(self, *args, **kwargs)
+            tape.record(key, method, call, to_json(result))
+            return result
+        return wrapper
+    return decorator
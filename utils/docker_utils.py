@@ -3,8 +3,33 @@ import subprocess as sp
 import os
 from constants import LanguageType, DockerResults, PROJECT_PATH
 from pathlib import Path
-from typing import Union, Optional, Any
+from typing import Union, Optional, Any, IO
+from utils.timing import timed
+from utils.docker_tape import taped, get_docker_tape
+import time
+import signal
 import threading
+import shlex
+from contextvars import ContextVar
+
+# exit codes of the timeout command (124, or 128 + 9 if the command is killed after ignoring SIGTERM)
+TIMEOUT_EXIT_CODES = {124, 137}
+# seconds to wait for docker exec after the command timeout
+EXEC_GRACE = 30
+# seconds between two checks of the cancel event while a build runs
+CANCEL_POLL = 2
+
+# set by a speculative draft, its builds are killed when another draft wins
+_current_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("current_cancel_event", default=None)
+
+
+def set_cancel_event(cancel_event: Optional[threading.Event]) -> None:
+    _current_cancel_event.set(cancel_event)
+
+
+def is_cancelled() -> bool:
+    cancel_event = _current_cancel_event.get()
+    return cancel_event is not None and cancel_event.is_set()
 
 # c++  # cpp for tree-sitter
 # go
@@ -27,46 +52,103 @@ class DockerUtils:
         # for CPP, the language is c++, other languages are the same as the project language
         self.fuzzing_lang = project_lang.value.lower() if project_lang !=  LanguageType.CPP else "c++"
 
+    @property
+    def replaying(self) -> bool:
+        # the docker calls of this run are served from a recorded tape
+        tape = get_docker_tape()
+        return tape is not None and tape.replaying
+
 
+    @timed("docker.build_image")
+    @taped("build_image", miss=False, workspace=True)
     def build_image(self, build_image_cmd: list[str]) -> bool:
         '''Build the image for the project'''
         try:
-            sp.run(build_image_cmd, stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.STDOUT, check=True, timeout=1200, start_new_session=True)
-            # sp.run(build_image_cmd, stdin=sp.DEVNULL, stdout=None, stderr=None, check=True, timeout=600)
-            return True
-        except sp.CalledProcessError as e:
-            return False
-        except sp.TimeoutExpired as e:
-            return False
+            returncode, _ = self.run_build_cmd(build_image_cmd, timeout=1200, capture=False)
+            return returncode == 0
         except Exception as e:
             print(f"Error building image: {e}")
             return False
 
-    def build_fuzzers(self, build_fuzzer_cmd: list[str]) -> bool:
-
+    @timed("docker.build_fuzzers")
+    @taped("build_fuzzers", miss=(False, "No recorded build for this harness."), workspace=True)
+    def build_fuzzers(self, build_fuzzer_cmd: list[str], fuzzer_path: Optional[Path] = None) -> tuple[bool, str]:
+        '''
+        Build the fuzzers of the project.
+        Returns:
+            tuple[bool, str]: True if the build succeeds (and fuzzer_path exists if given), and the build output.
+        '''
         # run the build command
         try:
-            # self.docker_tool.run_cmd(["find", "-name", "comp"])
-            sp.run(build_fuzzer_cmd,
-                   stdout=sp.PIPE,  # Capture standard output
-                    # Important!, build fuzzer error may not appear in stderr, so redirect stderr to stdout
-                   stderr=sp.STDOUT,  # Redirect standard error to standard output
-                   text=True,  # Get output as text (str) instead of bytes
-                   check=True) # Raise exception if build fails
-            return True
-        except sp.CalledProcessError as e:
-            return False
-        except sp.TimeoutExpired as e:
-            return False
+            returncode, output = self.run_build_cmd(build_fuzzer_cmd, timeout=None, capture=True, run_container=True)
+            if returncode != 0:
+                return False, output
+            # For net-snmp, compile failed will also not generate the fuzzer but no error is raised
+            if fuzzer_path is not None and not os.path.exists(fuzzer_path):
+                return False, output
+            return True, output
         except Exception as e:
             print(f"Error building fuzzers: {e}")
-            return False
+            return False, f"Error building fuzzers: {e}"
+
+
+    def run_build_cmd(self, cmd: list[str], timeout: Optional[int], capture: bool, run_container: bool = False) -> tuple[Optional[int], str]:
+        """
+        Run a helper.py command in its own process group. On timeout, or when the draft of the call is cancelled,
+        the process group is killed, and the containers it started from the image if run_container.
+        Returns:
+            tuple[Optional[int], str]: The return code (None if killed) and the output (stderr is redirected to stdout).
+        """
+        # the containers that are already running from the image (e.g., the retriever) are not part of the build
+        before = self.image_containers() if run_container else None
+        process = sp.Popen(cmd, stdin=sp.DEVNULL, stdout=sp.PIPE if capture else sp.DEVNULL,
+                           # Important!, build fuzzer error may not appear in stderr, so redirect stderr to stdout
+                           stderr=sp.STDOUT, text=True, errors="replace", start_new_session=True)
+        start = time.time()
+        while True:
+            try:
+                output, _ = process.communicate(timeout=CANCEL_POLL)
+                return process.returncode, output or ""
+            except sp.TimeoutExpired:
+                cancelled = is_cancelled()
+                if not cancelled and (timeout is None or time.time() - start < timeout):
+                    continue
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            # killing the docker client does not stop a container started by docker run
+            if before is not None:
+                self.kill_image_containers(before)
+            output, _ = process.communicate()
+            reason = "Build cancelled, another draft passed first." if cancelled else f"Build timeout after {timeout} seconds."
+            return None, (output or "") + reason
+
+    def image_containers(self) -> Optional[set[str]]:
+        """The ids of the running containers of the image, None on error."""
+        try:
+            client = docker.from_env()
+            return {container.id for container in client.containers.list(filters={"ancestor": self.image_name})} # type: ignore
+        except Exception as e:
+            print(f"Error listing the containers of {self.image_name}: {e}")
+            return None
 
+    def kill_image_containers(self, keep: set[str]) -> None:
+        try:
+            client = docker.from_env()
+            for container in client.containers.list(filters={"ancestor": self.image_name}):
+                if container.id not in keep:
+                    container.kill()
+        except Exception as e:
+            print(f"Error killing the containers of {self.image_name}: {e}")
 
+    @timed("docker.remove_image")
     def remove_image(self) -> str:
         """
         Remove the Docker image from the local machine.
         """
+        if self.replaying:
+            return "Image removed successfully."
         try:
             client = docker.from_env()
             client.images.remove(self.image_name) # type: ignore
@@ -85,7 +167,20 @@ class DockerUtils:
         self.run_cmd(["rm", "-rf", "/out/*"], volumes={compile_out_path: {"bind": "/out", "mode": "rw"}})
         self.run_cmd(["rm", "-rf", "/work/*"])
 
+    @taped("read_out_file", miss="", workspace=True)
+    def read_out_file(self, file_name: str) -> str:
+        """
+        Read a file the fuzzer or a script wrote into /out of the project, taped so that a replay gets the recorded file.
+        Returns:
+            str: The content of the file, empty if it does not exist.
+        """
+        out_file = Path(self.ossfuzz_dir) / "build" / "out" / self.new_project_name / file_name
+        if not out_file.exists():
+            return ""
+        return out_file.read_text()
 
+    @timed("docker.run_cmd")
+    @taped("run_cmd", miss=f"{DockerResults.Error.value}: No recorded output for this command.", ignore=("timeout",))
     def run_cmd(self, cmd_list: Union[list[str], str], timeout:int=120, **kargs:Any) -> str:
 
         # The client timeout should be longer than the container wait timeout
@@ -123,6 +218,8 @@ class DockerUtils:
                 except:
                     pass # Ignore error if container was already removed
 
+    @timed("docker.exec_in_container")
+    @taped("exec_in_container", miss=f"{DockerResults.Error.value}: No recorded output for this command.", ignore=("container_id", "timeout"))
     def exec_in_container(self, container_id: str, cmd: Union[list[str], str], workdir: Optional[str] = None, timeout: Optional[int] = 60) -> str:
         """
         Execute a command inside a running Docker container with an optional timeout.
@@ -136,38 +233,78 @@ class DockerUtils:
         container = client.containers.get(container_id)
         if isinstance(cmd, list):
             cmd = " ".join(cmd)
+        if timeout:
+            # kill only this command on timeout, other commands may run in the same container at the same time
+            cmd = f"timeout -k 5 {timeout} sh -c {shlex.quote(cmd)}"
         exec_kwargs: dict[str, Any] = {"cmd": cmd, "stdout": True, "stderr": True, "tty": True, "privileged": True}
         if workdir:
             exec_kwargs["workdir"] = workdir
 
-        result = {"output": ""}
+        result: dict[str, Any] = {"output": "", "exit_code": None}
 
         def run_exec():
             try:
                 exec_result = container.exec_run(**exec_kwargs) # type: ignore
                 output = exec_result.output.decode("utf-8", errors="replace") if hasattr(exec_result, "output") else exec_result[1].decode("utf-8", errors="replace")
                 result["output"] = output
+                result["exit_code"] = exec_result.exit_code if hasattr(exec_result, "exit_code") else exec_result[0]
             except Exception as e:
                 result["output"] = f"{DockerResults.Error.value}: {str(e)}"
 
-        thread = threading.Thread(target=run_exec)
+        thread = threading.Thread(target=run_exec, daemon=True)
         thread.start()
-        thread.join(timeout)
-        if thread.is_alive():
-            # Timeout occurred
-            try:
-                container.kill()  # type: ignore
-                container.start()  # Restart the container if needed
-            except Exception:
-                pass
+        # the timeout command kills the process in the container, the join timeout is only a safety net
+        thread.join(timeout + EXEC_GRACE if timeout else None)
+        if thread.is_alive() or (timeout and result["exit_code"] in TIMEOUT_EXIT_CODES):
             return f"{DockerResults.Error.value}: Command timed out after {timeout} seconds."
         return result["output"]
 
+    @timed("docker.export_path")
+    def export_path(self, container_id: str, path: str, fileobj: IO[bytes], timeout: int = 600) -> bool:
+        """
+        Stream a path of a running container into fileobj as a tar archive (like docker cp).
+        :param container_id: The ID or name of the running container.
+        :param path: The path inside the container.
+        :param fileobj: A writable binary file object.
+        :return: True if the archive is written successfully.
+        """
+        if self.replaying:
+            return False
+        try:
+            client = docker.from_env(timeout=timeout)
+            container = client.containers.get(container_id)
+            bits, _ = container.get_archive(path) # type: ignore
+            for chunk in bits:
+                fileobj.write(chunk)
+            return True
+        except Exception as e:
+            print(f"Error exporting {path} from container: {e}")
+            return False
+
+    def get_image_id(self, container_id: str) -> str:
+        """
+        The id (sha256 digest) of the image of a running container, empty on error.
+        Images of different runs built from the same project files have the same id thanks to the build cache.
+        """
+        if self.replaying:
+            return ""
+        try:
+            client = docker.from_env()
+            container = client.containers.get(container_id)
+            return container.image.id or "" # type: ignore
+        except Exception as e:
+            print(f"Error getting the image of the container: {e}")
+            return ""
+
+    @timed("docker.start_container")
     def start_container(self, timeout: int=600) -> str:
         """
         Start a Docker container from the image and return its container ID.
         If the container is already running, reuse it.
         """
+        if self.replaying:
+            # the calls to the container are replayed, no container is needed
+            return f"{self.new_project_name}_retriever"
         try:
 
             workdir = self.run_cmd(["pwd"], timeout=timeout, volumes=None).strip()
@@ -211,6 +348,8 @@ class DockerUtils:
         """
         Stop and remove a running Docker container by its ID.
         """
+        if self.replaying:
+            return
         client = docker.from_env()
         try:
             container = client.containers.get(container_id)
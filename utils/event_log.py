@@ -0,0 +1,176 @@
+import json
+import time
+import threading
+import contextlib
+from contextvars import ContextVar
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+from utils.profiler import profile_node
+
+EVENT_FILE = "events.jsonl"
+
+
+class Stage(Enum):
+    Run = "run"
+    Workspace = "workspace"
+    Generator = "generator"
+    Compiler = "compiler"
+    FixBuilder = "fix_builder"
+    Fixer = "fixer"
+    Fuzzer = "fuzzer"
+    SemanticCheck = "semantic_check"
+    Tool = "tool"
+    # timing spans of hot spots, see utils/timing.py
+    Span = "span"
+    # hit/miss of the retrieval and LLM caches
+    Cache = "cache"
+    # code extraction from the LLM answers, local fast path or LLM fallback
+    CodeFormat = "code_format"
+    # compaction of the message history
+    History = "history"
+    # speculative drafts racing for the first harness that passes
+    Draft = "draft"
+
+
+def to_value(value: Any) -> Any:
+    # enums (ValResult, CompileResults, ...) are saved by value
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Path):
+        return str(value)
+    return value
+
+
+class EventLog():
+    '''
+    Typed events of one run, appended to <save_dir>/events.jsonl.
+    One event per line: {"ts": ..., "stage": ..., "event": ..., other fields}.
+    Events are buffered and written in batches, end events of the run are written immediately.
+    '''
+
+    def __init__(self, path: Path, buffer_size: int = 32):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer: list[str] = []
+        self.lock = threading.Lock()
+
+    def emit(self, stage: Stage, event: str, **fields: Any) -> None:
+        record: dict[str, Any] = {"ts": round(time.time(), 3), "stage": stage.value, "event": event}
+        record.update({key: to_value(value) for key, value in fields.items()})
+        line = json.dumps(record, default=str)
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) < self.buffer_size and stage != Stage.Run:
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.buffer:
+                return
+            lines, self.buffer = self.buffer, []
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def close(self) -> None:
+        self.flush()
+
+    def append_events(self, events: list[dict[str, Any]], **fields: Any) -> None:
+        """Append the events of another log (e.g., the winning draft) with their timestamps, plus the given fields."""
+        lines = [json.dumps({**event, **{key: to_value(value) for key, value in fields.items()}}, default=str) for event in events]
+        self.flush()
+        if lines:
+            with self.lock:
+                with open(self.path, "a") as f:
+                    f.write("\n".join(lines) + "\n")
+
+    @contextlib.contextmanager
+    def stage(self, stage: Stage, **fields: Any) -> Iterator[dict[str, Any]]:
+        """
+        Emit the start and end events of a stage. The caller can add fields (e.g., result) to the yielded dict.
+        """
+        start = time.time()
+        self.emit(stage, "start", **fields)
+        end_fields: dict[str, Any] = dict(fields)
+        try:
+            yield end_fields
+        except BaseException as e:
+            end_fields.setdefault("result", "exception")
+            end_fields["error"] = str(e)
+            raise
+        finally:
+            self.emit(stage, "end", start_ts=round(start, 3), duration=round(time.time() - start, 3), **end_fields)
+
+    def trace_node(self, stage: Stage, node: Callable[[dict[str, Any]], dict[str, Any]]) -> Callable[[dict[str, Any]], dict[str, Any]]:
+        """
+        Wrap a graph node, the result is taken from the user message it returns.
+        The node is also profiled in its thread when the run is profiled in cprofile mode.
+        """
+        def traced(state: dict[str, Any]) -> dict[str, Any]:
+            with self.stage(stage, fix_counter=state.get("fix_counter", 0)) as end_fields:
+                with profile_node():
+                    output = node(state)
+                end_fields["result"] = node_result(output)
+                for key in ["fuzzer_name", "fuzzer_path", "fix_counter"]:
+                    if key in output:
+                        end_fields[key] = output[key]
+            return output
+        return traced
+
+
+def node_result(output: dict[str, Any]) -> str:
+    """The result of a graph node: the enum value of its user message, "code", "tool_calls" or the END message."""
+    message = output.get("messages")
+    if isinstance(message, tuple) and len(message) == 2:
+        # a new draft from the generator or the fixer
+        if message[0] == "assistant":
+            return "code"
+        return str(to_value(message[1]))[:200]
+    if getattr(message, "tool_calls", None):
+        return "tool_calls"
+    if isinstance(message, str):
+        return message[:200]
+    return "ok"
+
+
+def usage_fields(response: Any) -> dict[str, int]:
+    """Token counts of an LLM response, empty if the provider does not report them."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {key: usage[key] for key in ["input_tokens", "output_tokens", "total_tokens"] if key in usage}
+
+
+_current_event_log: ContextVar[Optional[EventLog]] = ContextVar("current_event_log", default=None)
+
+
+def set_event_log(event_log: Optional[EventLog]) -> None:
+    _current_event_log.set(event_log)
+
+
+def get_event_log() -> Optional[EventLog]:
+    return _current_event_log.get()
+
+
+def emit_event(stage: Stage, event: str, **fields: Any) -> None:
+    """Emit an event to the event log of the current run, if any."""
+    event_log = _current_event_log.get()
+    if event_log is not None:
+        event_log.emit(stage, event, **fields)
+
+
+def read_events(path: Path) -> list[dict[str, Any]]:
+    events: list[dict[str, Any]] = []
+    if not path.exists():
+        return events
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the last line of a killed run may be incomplete
+                continue
+    return events
+
+
+def find_events(events: list[dict[str, Any]], stage: Stage, event: Optional[str] = None) -> list[dict[str, Any]]:
+    return [e for e in events if e.get("stage") == stage.value and (event is None or e.get("event") == event)]
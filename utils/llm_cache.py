@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import warnings
+import sqlite3
+from enum import Enum
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from utils.event_log import Stage, emit_event
+
+LLM_CACHE_FILE = "llm_cache.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_access ON responses (last_access);
+"""
+
+# message fields that change between two identical calls (provider ids, timing, token usage)
+VOLATILE_KEYS = {"id", "response_metadata", "usage_metadata"}
+
+
+class LLMCacheMode(Enum):
+    # look up first, call the LLM and store the response on a miss
+    ReadThrough = "read_through"
+    # always call the LLM and store the response
+    Record = "record"
+    # only use stored responses, a miss raises LLMCacheMiss
+    Replay = "replay"
+    # no cache
+    Bypass = "bypass"
+
+
+class LLMCacheMiss(Exception):
+    pass
+
+
+# the retry of the current LLM call, a retry must not get the cached response of the call it retries
+_retry_attempt: ContextVar[int] = ContextVar("llm_retry_attempt", default=0)
+
+
+@contextmanager
+def retry_attempt(attempt: int) -> Iterator[None]:
+    """The LLM calls in this block are the given retry (0 for the first call) of the same messages."""
+    token = _retry_attempt.set(attempt)
+    try:
+        yield
+    finally:
+        _retry_attempt.reset(token)
+
+
+def has_invalid_tool_calls(return_val: Sequence[Generation]) -> bool:
+    return any(getattr(getattr(generation, "message", None), "invalid_tool_calls", None) for generation in return_val)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Remove the volatile fields from the serialized messages, so a replayed conversation has the same key.
+    """
+    def strip(obj: Any) -> Any:
+        if isinstance(obj, dict):
+            return {key: strip(value) for key, value in obj.items() if key not in VOLATILE_KEYS} # type: ignore
+        if isinstance(obj, list):
+            return [strip(value) for value in obj] # type: ignore
+        return obj
+
+    try:
+        return json.dumps(strip(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        return prompt
+
+
+class LLMDiskCache(BaseCache):
+    '''
+    A persistent response cache for the chat models, set as the cache of the model in load_model.
+    The key is the hash of (namespace, llm_string, normalized messages), llm_string already holds the model,
+    the temperature and the schema of the bound tools. The responses are zlib compressed in a SQLite file,
+    the least recently used ones are evicted when the file exceeds max_size_mb.
+    The retries of a call (retry_attempt) have their own keys. In read_through mode, the responses with invalid tool calls
+    are not stored, the record mode keeps them so that a replay takes the same retries.
+    '''
+
+    def __init__(self, cache_dir: Path, mode: LLMCacheMode = LLMCacheMode.ReadThrough, namespace: str = "", max_size_mb: int = 1024):
+        self.db_path = Path(cache_dir) / LLM_CACHE_FILE
+        self.mode = mode
+        # e.g., the iteration, so the runs of different iterations are still independent samples
+        self.namespace = namespace
+        self.max_size = max_size_mb * 1024 * 1024
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # sqlite connections must not cross fork, keep one per process
+        if self._conn is None or self._pid != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def __getstate__(self) -> dict[str, object]:
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    def get_key(self, prompt: str, llm_string: str) -> str:
+        parts = [self.namespace, llm_string, normalize_prompt(prompt)]
+        # the first call keeps the plain key
+        attempt = _retry_attempt.get()
+        if attempt:
+            parts.append(f"retry{attempt}")
+        raw = "\x00".join(parts)
+        return hashlib.sha256(raw.encode("utf-8", errors="replace")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if self.mode in [LLMCacheMode.Record, LLMCacheMode.Bypass]:
+            return None
+
+        key = self.get_key(prompt, llm_string)
+        row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        emit_event(Stage.Cache, "lookup", cache="llm", hit=row is not None)
+        if row is None:
+            if self.mode == LLMCacheMode.Replay:
+                raise LLMCacheMiss(f"No cached LLM response for key {key[:16]} in {self.db_path}")
+            return None
+
+        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        try:
+            # loads is a beta api of langchain
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return loads(zlib.decompress(row[0]).decode("utf-8"))
+        except Exception:
+            # written by an incompatible langchain version, call the LLM again
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self.mode in [LLMCacheMode.Replay, LLMCacheMode.Bypass]:
+            return
+        if self.mode == LLMCacheMode.ReadThrough and has_invalid_tool_calls(return_val):
+            return
+
+        value = zlib.compress(dumps(list(return_val)).encode("utf-8"))
+        self.conn.execute("INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                          (self.get_key(prompt, llm_string), value, len(value), time.time()))
+        self.evict()
+
+    def evict(self) -> None:
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        # evict down to 90% of the budget, so we do not evict on every update
+        target = total - int(self.max_size * 0.9)
+        keys: list[str] = []
+        freed = 0
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            keys.append(key)
+            freed += size
+            if freed >= target:
+                break
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self, **kwargs: Any) -> None:
+        self.conn.execute("DELETE FROM responses")
+
+
+def get_llm_cache(cache_dir: Path, mode: str, namespace: str = "", max_size_mb: int = 1024) -> Optional[LLMDiskCache]:
+    """
+    Returns:
+        LLMDiskCache: The cache for the mode, None in bypass mode.
+    """
+    cache_mode = LLMCacheMode(mode)
+    if cache_mode == LLMCacheMode.Bypass:
+        return None
+    return LLMDiskCache(cache_dir, cache_mode, namespace, max_size_mb)
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import threading
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Optional
+from constants import EvalResult
+from utils.run_ledger import RunLedger, RunStatus
+from utils.event_log import Stage, EVENT_FILE, read_events
+
+METRICS_FILE = "metrics.prom"
+# images and containers created for the runs are named run{n}_{16 random letters}
+RUN_NAME_PATTERN = re.compile(r"run\d+_[a-z]{16}")
+# window of the token rate
+TOKEN_WINDOW = 300
+
+
+class MetricsExporter():
+    '''
+    Rewrite a Prometheus textfile (<save_root>/metrics.prom) every interval seconds, e.g., for the node_exporter
+    textfile collector. It runs as a thread in the runner process and reads what the pool workers already write:
+    the run ledger and the events.jsonl of each run, so no state is shared with the workers.
+    '''
+
+    def __init__(self, save_root: Path, interval: int = 30, output_file: Optional[Path] = None):
+        self.save_root = Path(save_root)
+        self.interval = interval
+        self.output_file = output_file if output_file else self.save_root / METRICS_FILE
+        self.ledger = RunLedger(self.save_root)
+        self.start_time = time.time()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+        # the current iteration, set by the runner
+        self.n_run = 0
+        self.n_scheduled = 0
+        self.iteration_start = 0.0
+
+        # events already consumed: events file -> number of lines
+        self.event_offsets: dict[Path, int] = {}
+        # the runs finished before this exporter started are not counted
+        self.last_scan = self.start_time
+        self.stage_latency: dict[str, list[float]] = defaultdict(lambda: [0.0, 0])
+        self.cache_requests: dict[tuple[str, bool], int] = defaultdict(int)
+        self.code_extracts: dict[str, int] = defaultdict(int)
+        self.llm_tokens_total = 0
+        self.llm_tokens: deque[tuple[float, int]] = deque()
+
+    def set_iteration(self, n_run: int, n_scheduled: int) -> None:
+        if n_run != self.n_run:
+            self.iteration_start = time.time()
+        self.n_run = n_run
+        self.n_scheduled = n_scheduled
+
+    def start(self) -> None:
+        if self.interval <= 0:
+            return
+        self.thread = threading.Thread(target=self.loop, name="metrics_exporter", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.interval)
+        if self.interval > 0:
+            self.export()
+
+    def loop(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.export()
+            except Exception as e:
+                print(f"Failed to export metrics: {e}")
+
+    def consume_events(self) -> None:
+        # only runs that are running or finished since the last scan can have new events
+        scan_time = time.time()
+        for work_dir in self.ledger.get_active_work_dirs(self.last_scan - self.interval):
+            event_file = work_dir / EVENT_FILE
+            events = read_events(event_file)
+            offset = self.event_offsets.get(event_file, 0)
+            self.event_offsets[event_file] = len(events)
+            for event in events[offset:]:
+                stage = event.get("stage")
+                if event.get("event") == "end" and "duration" in event:
+                    name = event.get("name", "unknown") if stage == Stage.Span.value else f"stage.{stage}"
+                    self.stage_latency[name][0] += float(event["duration"])
+                    self.stage_latency[name][1] += 1
+                elif stage == Stage.Cache.value:
+                    self.cache_requests[(event.get("cache", "unknown"), bool(event.get("hit")))] += 1
+                elif stage == Stage.CodeFormat.value:
+                    self.code_extracts[event.get("method", "unknown")] += 1
+                elif event.get("event") == "llm":
+                    tokens = int(event.get("total_tokens", event.get("input_tokens", 0) + event.get("output_tokens", 0)))
+                    self.llm_tokens_total += tokens
+                    self.llm_tokens.append((float(event.get("ts", scan_time)), tokens))
+        self.last_scan = scan_time
+
+        while self.llm_tokens and self.llm_tokens[0][0] < scan_time - TOKEN_WINDOW:
+            self.llm_tokens.popleft()
+
+    def count_docker_objects(self) -> tuple[int, int]:
+        try:
+            import docker
+            client = docker.from_env(timeout=30)
+            containers = [c for c in client.containers.list() if RUN_NAME_PATTERN.search(c.name or "")]
+            images = [i for i in client.images.list() if any(RUN_NAME_PATTERN.search(tag) for tag in i.tags)]
+            return len(images), len(containers)
+        except Exception:
+            return -1, -1
+
+    def collect(self) -> list[str]:
+        self.consume_events()
+        now = time.time()
+        # metric name -> (help, samples), the samples of a metric must be written together
+        families: dict[str, tuple[str, list[str]]] = {}
+
+        def gauge(name: str, value: float, help_text: str, labels: Optional[dict[str, str]] = None) -> None:
+            label_str = ",".join(f'{key}="{label}"' for key, label in (labels or {}).items())
+            sample = f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}"
+            families.setdefault(name, (help_text, []))[1].append(sample)
+
+        status_counts = self.ledger.count_by_status()
+        gauge("fuzz_agent_active_workers", status_counts.get(RunStatus.Running.value, 0), "Runs in progress.")
+        for status, count in sorted(status_counts.items()):
+            gauge("fuzz_agent_runs", count, "Runs in the ledger by status.", {"status": status})
+
+        if self.n_run:
+            queued = max(self.n_scheduled - self.ledger.count_started(self.n_run, self.iteration_start), 0)
+            gauge("fuzz_agent_queue_depth", queued, "Functions of the iteration not started yet.", {"iteration": str(self.n_run)})
+
+        gauge("fuzz_agent_completed_per_hour", self.ledger.count_finished(now - 3600), "Runs finished in the last hour.")
+        eval_counts = self.ledger.count_by_eval_res()
+        classified = sum(eval_counts.values())
+        success_rate = eval_counts.get(EvalResult.Success.value, 0) / classified if classified else 0.0
+        gauge("fuzz_agent_success_rate", round(success_rate, 4), "Fraction of classified runs that succeeded.")
+
+        n_images, n_containers = self.count_docker_objects()
+        gauge("fuzz_agent_docker_images", n_images, "Docker images of the runs (-1 if docker is unavailable).")
+        gauge("fuzz_agent_docker_containers", n_containers, "Running containers of the runs (-1 if docker is unavailable).")
+
+        for cache in sorted({cache for cache, _ in self.cache_requests}):
+            hits, misses = self.cache_requests[(cache, True)], self.cache_requests[(cache, False)]
+            gauge("fuzz_agent_cache_hit_ratio", round(hits / (hits + misses), 4), "Cache hit ratio.", {"cache": cache})
+            gauge("fuzz_agent_cache_requests", hits + misses, "Cache lookups.", {"cache": cache})
+
+        for method, count in sorted(self.code_extracts.items()):
+            gauge("fuzz_agent_code_extracts", count, "Code extractions by method (local or llm fallback).", {"method": method})
+
+        window = min(TOKEN_WINDOW, max(now - self.start_time, 1))
+        tokens_per_minute = sum(tokens for _, tokens in self.llm_tokens) * 60 / window
+        gauge("fuzz_agent_llm_tokens_per_minute", round(tokens_per_minute, 1), "LLM tokens per minute over the last 5 minutes.")
+        gauge("fuzz_agent_llm_tokens", self.llm_tokens_total, "LLM tokens since the exporter started.")
+
+        for name, (total, count) in sorted(self.stage_latency.items()):
+            gauge("fuzz_agent_stage_latency_mean_seconds", round(total / count, 3), "Mean latency by stage.", {"stage": name})
+            gauge("fuzz_agent_stage_count", count, "Completed stages since the exporter started.", {"stage": name})
+
+        lines: list[str] = []
+        for name, (help_text, samples) in families.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] + samples
+        return lines
+
+    def export(self) -> None:
+        lines = self.collect()
+        # write and rename, the collector must never read a partial file
+        tmp_file = self.output_file.with_name(f"{self.output_file.name}.{os.getpid()}")
+        with open(tmp_file, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_file, self.output_file)
@@ -10,6 +10,8 @@ import re
 import random
 from typing import DefaultDict, Any, Optional
 from pathlib import Path
+from utils.run_ledger import RunLedger
+from utils.token_budget import fits
 from tree_sitter import Language, Parser
 import tree_sitter_cpp
 
@@ -19,7 +21,7 @@ def filter_examples(project_code_usage: list[dict[str, str]], project_lang: Lang
         if FuzzEntryFunctionMapping[project_lang] in code["source_code"]:
             continue
         # token limit
-        if len(code["source_code"].split()) > usage_token_limit:
+        if not fits(code["source_code"], usage_token_limit):
             continue
         filter_code_usage.append(code)
 
@@ -498,6 +500,17 @@ def is_empty_json_file(json_path: Path) -> bool:
 def get_run_path(save_dir:Path, n_run:int=1) -> list[Path]:
     
     run_list: list[Path] = []
+    ledger = RunLedger(save_dir)
+    if ledger.exists():
+        # the first run dir of each function
+        seen_functions: set[Path] = set()
+        for _, _, run_dir in ledger.get_runs(n_run, single_run=True):
+            if run_dir.parent in seen_functions or not run_dir.is_dir():
+                continue
+            seen_functions.add(run_dir.parent)
+            run_list.append(run_dir)
+        return run_list
+
     for project_path in sorted(save_dir.iterdir()):
         if not project_path.is_dir():
             continue
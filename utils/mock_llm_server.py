@@ -0,0 +1,315 @@
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+# answers when no script matches and the prompt has no target signature, they do not call the target
+DEFAULT_C_HARNESS = """```c
+#include <stdint.h>
+#include <stddef.h>
+
+#ifdef __cplusplus
+extern "C"
+#endif
+int LLVMFuzzerTestOneInput(const uint8_t *data, size_t size) {
+    (void)data;
+    (void)size;
+    return 0;
+}
+```"""
+
+DEFAULT_JAVA_HARNESS = """```java
+import com.code_intelligence.jazzer.api.FuzzedDataProvider;
+
+public class MockFuzzer {
+    public static void fuzzerTestOneInput(FuzzedDataProvider data) {
+        data.consumeRemainingAsBytes();
+    }
+}
+```"""
+
+# libFuzzer looks up the unmangled entry point, the guard also compiles as C
+ENTRY_LINKAGE = ["#ifdef __cplusplus", 'extern "C"', "#endif"]
+# the words of a C type, the last word of a parameter is its name otherwise
+C_TYPE_WORDS = {"void", "char", "short", "int", "long", "float", "double", "signed", "unsigned", "bool", "_Bool",
+                "const", "volatile", "struct", "enum", "union", "size_t", "ssize_t"}
+JAVA_CONSUMERS = {"int": "data.consumeInt()", "long": "data.consumeLong()", "short": "data.consumeShort()",
+                  "byte": "data.consumeByte()", "boolean": "data.consumeBoolean()", "char": "data.consumeChar()",
+                  "float": "data.consumeFloat()", "double": "data.consumeDouble()",
+                  "java.lang.String": "data.consumeString(64)", "String": "data.consumeString(64)",
+                  "byte[]": "data.consumeBytes(64)"}
+
+
+def uncomment(prompt: str) -> str:
+    # the initial prompt is saved and sent as a comment block
+    return re.sub(r"^[ \t]*// ?", "", prompt, flags=re.MULTILINE)
+
+
+def prompt_section(prompt: str, title: str) -> str:
+    """The text after `title:` up to the next blank line."""
+    match = re.search(rf"{re.escape(title)}:[ \t]*\n(.*?)(?:\n[ \t]*\n|\n<|$)", prompt, flags=re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+
+def split_params(params: str) -> list[str]:
+    # split at the commas outside of templates and brackets
+    parts: list[str] = []
+    depth, current = 0, ""
+    for ch in params:
+        if ch in "<([":
+            depth += 1
+        elif ch in ">)]":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def c_param_type(param: str) -> str:
+    param = re.sub(r"\[[^\]]*\]", "*", param).strip()
+    if "*" in param:
+        return param[:param.rindex("*") + 1].strip()
+    tokens = param.replace("&", " & ").split()
+    if len(tokens) >= 2 and tokens[-1] not in C_TYPE_WORDS and tokens[-1] != "&" and tokens[-2] not in ["struct", "enum", "union"]:
+        tokens = tokens[:-1]
+    return " ".join(tokens)
+
+
+def c_target_harness(signature: str, headers: str, cpp: bool) -> str:
+    """A harness that calls the target with zeroed values, and pointers into the input for pointer parameters."""
+    head, _, params = signature.partition("(")
+    function_name = head.split()[-1].lstrip("*&") if head.split() else ""
+    if not function_name:
+        return ""
+    lines: list[str] = []
+    args: list[str] = []
+    for i, param in enumerate(split_params(params[:params.rfind(")")])):
+        param_type = c_param_type(param)
+        if param_type in ["", "void", "..."]:
+            continue
+        if param_type.endswith("*"):
+            lines.append(f"    {param_type} arg{i} = ({param_type})data;")
+        else:
+            value_type = " ".join(t for t in param_type.replace("&", " ").split() if t != "const")
+            lines.append(f"    {value_type} arg{i}{{}};" if cpp else f"    {value_type} arg{i};\n    memset(&arg{i}, 0, sizeof(arg{i}));")
+        args.append(f"arg{i}")
+    includes = "\n".join(line for line in headers.splitlines() if line.strip().startswith("#include"))
+    return "\n".join([f"```{'cpp' if cpp else 'c'}", "#include <stdint.h>", "#include <stddef.h>", "#include <string.h>", includes, "",
+                      *ENTRY_LINKAGE, "int LLVMFuzzerTestOneInput(const uint8_t *data, size_t size) {",
+                      "    if (size < 64) {", "        return 0;", "    }",
+                      *lines, f"    {function_name}({', '.join(args)});", "    return 0;", "}", "```"])
+
+
+def java_target_harness(signature: str) -> str:
+    """A harness that calls the target with values from FuzzedDataProvider, null for the other objects."""
+    match = re.match(r"\[([^\]]+)\]\.([^(]+)\(([^)]*)\)", signature.strip())
+    if not match:
+        return ""
+    class_path = match.group(1).replace("$", ".")
+    method = match.group(2)
+    args: list[str] = []
+    for param in split_params(match.group(3)):
+        param = re.sub(r"<.*>", "", param).replace("$", ".")
+        args.append(JAVA_CONSUMERS.get(param, f"({param}) null"))
+    call = f"new {class_path}({', '.join(args)})" if method == "<init>" else f"(({class_path}) null).{method}({', '.join(args)})"
+    return "\n".join(["```java", "import com.code_intelligence.jazzer.api.FuzzedDataProvider;", "",
+                      "public class MockFuzzer {", "    public static void fuzzerTestOneInput(FuzzedDataProvider data) {",
+                      f"        {call};", "    }", "}", "```"])
+
+
+def default_harness(prompt: str) -> str:
+    """Call the target of the prompt so that the run goes past the call check, the stub harnesses otherwise."""
+    prompt = uncomment(prompt)
+    java = "fuzzerTestOneInput" in prompt
+    signature = " ".join(prompt_section(prompt, "Target Function Signature").split())
+    if signature:
+        if java:
+            harness = java_target_harness(signature)
+        else:
+            harness = c_target_harness(signature, prompt_section(prompt, "Relevant Headers"), "C++" in prompt or "::" in signature)
+        if harness:
+            return harness
+    return DEFAULT_JAVA_HARNESS if java else DEFAULT_C_HARNESS
+
+
+def message_text(message: dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        # content blocks
+        return "\n".join(block.get("text", "") for block in content if isinstance(block, dict)) # type: ignore
+    return str(content)
+
+
+class MockLLM():
+    '''
+    Scripted answers of the mock server. The script is a json list of entries:
+        {"match": "text in the last message", "content": "...", "tool_calls": [{"name": ..., "arguments": {...}}],
+         "json": {...}, "delay": 0.5, "times": 1}
+    The first entry whose match is in the last message (no match: any message) and has uses left answers.
+    "json" answers structured output requests, "delay" simulates the latency of the provider.
+    '''
+
+    def __init__(self, script: Optional[list[dict[str, Any]]] = None, delay: float = 0.0):
+        self.script = script or []
+        self.delay = delay
+        self.used = [0] * len(self.script)
+        self.lock = threading.Lock()
+        self.n_requests = 0
+
+    def pick(self, last_text: str) -> Optional[dict[str, Any]]:
+        with self.lock:
+            self.n_requests += 1
+            for i, entry in enumerate(self.script):
+                if entry.get("match", "") not in last_text:
+                    continue
+                if "times" in entry and self.used[i] >= entry["times"]:
+                    continue
+                self.used[i] += 1
+                return entry
+        return None
+
+    def structured_answer(self, response_format: dict[str, Any], last_text: str) -> str:
+        # fill the string fields of the schema, the fields about code get the last message
+        schema = response_format.get("json_schema", {}).get("schema", {})
+        properties: dict[str, Any] = schema.get("properties", {})
+        code_fields = ["source_code"] if "source_code" in properties else [name for name in properties if "code" in name]
+        answer: dict[str, Any] = {}
+        for name, prop in properties.items():
+            if prop.get("type") == "boolean":
+                answer[name] = False
+            elif prop.get("type") in ["integer", "number"]:
+                answer[name] = 0
+            else:
+                answer[name] = last_text if name in code_fields else ""
+        return json.dumps(answer)
+
+    def complete(self, request: dict[str, Any]) -> dict[str, Any]:
+        messages: list[dict[str, Any]] = request.get("messages", [])
+        last_text = message_text(messages[-1]) if messages else ""
+        entry = self.pick(last_text) or {}
+        time.sleep(entry.get("delay", self.delay))
+
+        message: dict[str, Any] = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        if entry.get("tool_calls") and request.get("tools"):
+            message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                                      "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))}}
+                                     for call in entry["tool_calls"]]
+            finish_reason = "tool_calls"
+        elif "json" in entry:
+            message["content"] = json.dumps(entry["json"])
+        elif request.get("response_format", {}).get("type") == "json_schema":
+            message["content"] = self.structured_answer(request["response_format"], last_text)
+        elif "content" in entry:
+            message["content"] = entry["content"]
+        else:
+            message["content"] = default_harness("\n".join(message_text(m) for m in messages))
+
+        # rough token counts, 4 characters per token
+        prompt_tokens = sum(len(message_text(m)) for m in messages) // 4
+        completion_tokens = len(message["content"] or json.dumps(message.get("tool_calls", []))) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+def make_handler(mock: MockLLM) -> type[BaseHTTPRequestHandler]:
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def send_json(self, code: int, body: dict[str, Any]) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/").endswith("/models"):
+                self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            else:
+                self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def do_POST(self) -> None:
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError as e:
+                self.send_json(400, {"error": {"message": str(e)}})
+                return
+            if request.get("stream"):
+                self.send_json(400, {"error": {"message": "streaming is not supported by the mock server"}})
+                return
+            self.send_json(200, mock.complete(request))
+
+    return Handler
+
+
+class MockLLMServer():
+    '''
+    A local OpenAI-compatible chat completions server for benchmarks without a real LLM.
+    Set llm_base_url in the config to its base_url.
+    '''
+
+    def __init__(self, script_file: Optional[Path] = None, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        script = json.loads(Path(script_file).read_text()) if script_file else []
+        self.mock = MockLLM(script, delay)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.mock))
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock_llm_server", daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an OpenAI-compatible mock LLM server.")
+    parser.add_argument("--script", type=str, default="", help="Json list of scripted answers.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before each answer.")
+    args = parser.parse_args()
+
+    server = MockLLMServer(Path(args.script) if args.script else None, args.host, args.port, args.delay)
+    print(f"Mock LLM server on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import yaml
+import argparse
+from pathlib import Path
+from typing import Any, Optional
+from constants import PROJECT_PATH, EvalResult
+from utils.run_ledger import RunLedger
+from utils.timing import collect_durations, percentile, report
+from utils.mock_llm_server import MockLLMServer
+
+BENCH_FILE = "bench.json"
+
+
+def select_projects(bench_dir: Path, n_projects: int) -> list[str]:
+    """The first n projects of the benchmark set, sorted by file name so every release runs the same set."""
+    projects: list[str] = []
+    for file in sorted(os.listdir(bench_dir)):
+        with open(bench_dir / file, "r") as f:
+            data = yaml.safe_load(f)
+        if data.get("project") and data.get("functions"):
+            projects.append(data["project"])
+        if len(projects) >= n_projects:
+            break
+    return projects
+
+
+def summarize(save_root: Path, elapsed: float, n_functions: int) -> dict[str, Any]:
+    ledger = RunLedger(save_root)
+    status_counts = ledger.count_by_status()
+    eval_counts = ledger.count_by_eval_res()
+    n_runs = sum(status_counts.values())
+
+    stages: dict[str, dict[str, float]] = {}
+    for name, values in collect_durations(save_root).items():
+        values.sort()
+        stages[name] = {"count": len(values), "total": round(sum(values), 3),
+                        "p50": percentile(values, 50), "p95": percentile(values, 95)}
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "functions": n_functions,
+        "runs": n_runs,
+        "elapsed": round(elapsed, 1),
+        "functions_per_hour": round(n_runs / elapsed * 3600, 2) if elapsed > 0 else 0.0,
+        "status": status_counts,
+        "success": eval_counts.get(EvalResult.Success.value, 0),
+        "stages": stages,
+    }
+
+
+def run_bench(cfg_path: str, n_functions: int, bench_dir: Path, save_root: Optional[Path], mock: bool,
+              script: Optional[Path], delay: float) -> dict[str, Any]:
+    # the runner imports the whole agent
+    from agent.run_gen import Runner
+
+    server = None
+    runner = Runner(cfg_path)
+    config = runner.config
+    config.benchmark_dir = bench_dir
+    config.project_name = select_projects(bench_dir, n_functions)
+    config.function_signatures = []
+    config.funcs_per_project = 1
+    config.iterations = 1
+    config.save_root = save_root if save_root else config.save_root / f"bench_{time.strftime('%Y%m%d_%H%M%S')}"
+    runner.ledger = RunLedger(config.save_root)
+    if mock:
+        server = MockLLMServer(script, delay=delay)
+        config.llm_base_url = server.start()
+        # the other ChatOpenAI clients (e.g., the example selector) read the environment
+        os.environ["OPENAI_BASE_URL"] = config.llm_base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+        print(f"Mock LLM server on {config.llm_base_url}")
+
+    start = time.time()
+    try:
+        runner.run()
+    finally:
+        if server:
+            server.stop()
+    summary = summarize(config.save_root, time.time() - start, len(config.project_name))
+    summary["config"] = cfg_path
+    summary["mock"] = mock
+    summary["save_root"] = str(config.save_root)
+    with open(config.save_root / BENCH_FILE, "w") as f:
+        json.dump(summary, f, indent=4)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fixed set of functions through the pipeline and report the throughput.")
+    parser.add_argument("config", type=str, help="The yaml config of the runner.")
+    parser.add_argument("--functions", type=int, default=10, help="Number of functions (one per project).")
+    parser.add_argument("--bench-dir", type=str, default=os.path.join(PROJECT_PATH, "benchmark-sets", "function_0"))
+    parser.add_argument("--save-root", type=str, default="", help="Default is <save_root>/bench_<time>.")
+    parser.add_argument("--mock", action="store_true", help="Answer all LLM calls with the local mock server.")
+    parser.add_argument("--script", type=str, default="", help="Scripted answers of the mock server.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Latency of each mock answer in seconds.")
+    args = parser.parse_args()
+
+    summary = run_bench(args.config, args.functions, Path(args.bench_dir), Path(args.save_root) if args.save_root else None,
+                        args.mock, Path(args.script) if args.script else None, args.delay)
+    print(f"{summary['runs']} runs in {summary['elapsed']}s: {summary['functions_per_hour']} functions/hour, "
+          f"{summary['success']} succeeded")
+    print(report(Path(summary["save_root"])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import io
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import threading
+import contextlib
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional
+
+PROFILE_FILE = "profile.prof"
+COLLAPSED_FILE = "profile.collapsed"
+PROFILE_MODES = ["none", "cprofile", "sampling"]
+# the in-container retrievers dump their profiles into /out/<RETRIEVER_PROFILE_DIR>, copied into the save_dir of the run
+RETRIEVER_PROFILE_DIR = "retriever_profiles"
+
+
+class SamplingProfiler():
+    '''
+    Sample the Python stacks of all threads every interval seconds (like py-spy, but in process).
+    The result is a collapsed-stack file ("frame;frame;frame count" per line) for flamegraph.pl or speedscope.
+    '''
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.sample, name="sampling_profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def sample(self) -> None:
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack: list[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def save(self, collapsed_file: Path) -> None:
+        write_collapsed(self.stacks, collapsed_file)
+
+
+class NodeProfiles():
+    '''
+    The cProfile of each graph node, taken in the thread that runs the node and merged into one pstats.Stats.
+    LangGraph runs the sync nodes in executor threads, a profiler enabled by the event loop thread would not see them.
+    Since Python 3.12, only one cProfile can be active in the process, a node that overlaps another profiled node
+    (e.g., concurrent drafts) is skipped and counted.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats: Optional[pstats.Stats] = None
+        self.n_nodes = 0
+        self.n_skipped = 0
+
+    @contextlib.contextmanager
+    def profile(self) -> Iterator[None]:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            with self.lock:
+                self.n_skipped += 1
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                self.n_nodes += 1
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler) # type: ignore
+
+
+_current_node_profiles: ContextVar[Optional[NodeProfiles]] = ContextVar("current_node_profiles", default=None)
+
+
+@contextlib.contextmanager
+def profile_node() -> Iterator[None]:
+    """Profile a graph node if the run is profiled in cprofile mode."""
+    node_profiles = _current_node_profiles.get()
+    if node_profiles is None:
+        yield
+        return
+    with node_profiles.profile():
+        yield
+
+
+def write_collapsed(stacks: Counter[str], collapsed_file: Path) -> None:
+    with open(collapsed_file, "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def read_collapsed(collapsed_file: Path) -> Counter[str]:
+    stacks: Counter[str] = Counter()
+    with open(collapsed_file, "r") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+def stats_to_collapsed(stats: pstats.Stats) -> Counter[str]:
+    """
+    cProfile only keeps caller -> callee edges, so the collapsed stacks have two frames: caller;callee,
+    weighted by the callee's own time (in ms) attributed to that caller.
+    """
+    stacks: Counter[str] = Counter()
+    for (file_name, line, func_name), (_, _, _, _, callers) in stats.stats.items(): # type: ignore
+        callee = f"{func_name} ({Path(file_name).name}:{line})"
+        for (caller_file, caller_line, caller_name), caller_stats in callers.items():
+            own_ms = int(caller_stats[2] * 1000)
+            if own_ms > 0:
+                stacks[f"{caller_name} ({Path(caller_file).name}:{caller_line});{callee}"] += own_ms
+    return stacks
+
+
+@contextlib.contextmanager
+def profile_run(save_dir: Path, mode: str = "cprofile", interval: float = 0.01) -> Iterator[None]:
+    """
+    Profile a block and save profile.prof (cprofile mode) and profile.collapsed into save_dir.
+    The cprofile mode profiles the traced graph nodes (see NodeProfiles), the sampling mode every thread.
+    Args:
+        save_dir (Path): The directory of the run.
+        mode (str): none, cprofile or sampling.
+        interval (float): The sampling interval in seconds of the sampling mode.
+    """
+    if mode not in PROFILE_MODES or mode == "none":
+        yield
+        return
+
+    start = time.time()
+    if mode == "sampling":
+        sampler = SamplingProfiler(interval)
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            if save_dir.exists():
+                sampler.save(save_dir / COLLAPSED_FILE)
+    else:
+        # cProfile only sees the thread that enables it, so each node is profiled in its executor thread,
+        # the tool calls are not traced nodes and need sampling mode
+        node_profiles = NodeProfiles()
+        token = _current_node_profiles.set(node_profiles)
+        try:
+            yield
+        finally:
+            _current_node_profiles.reset(token)
+            if node_profiles.n_skipped:
+                print(f"{node_profiles.n_skipped} nodes overlapped another profiled node and were not profiled, use sampling mode")
+            if save_dir.exists() and node_profiles.stats is not None:
+                node_profiles.stats.dump_stats(str(save_dir / PROFILE_FILE))
+                write_collapsed(stats_to_collapsed(node_profiles.stats), save_dir / COLLAPSED_FILE)
+    print(f"Profiled {save_dir} in {mode} mode ({time.time() - start:.1f}s)")
+
+
+def merge_profiles(save_root: Path, output_dir: Path, top: int = 40) -> str:
+    """
+    Merge the profiles of all runs (and in-container retriever calls) under save_root.
+    Returns:
+        str: The top functions by own time.
+    """
+    # skip the output of a previous merge
+    prof_files = sorted(str(p) for p in save_root.rglob("*.prof") if output_dir not in p.parents)
+    collapsed_files = sorted(p for p in save_root.rglob(f"*{Path(COLLAPSED_FILE).suffix}") if output_dir not in p.parents)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    stacks: Counter[str] = Counter()
+    for collapsed_file in collapsed_files:
+        stacks.update(read_collapsed(collapsed_file))
+    if stacks:
+        write_collapsed(stacks, output_dir / f"merged{Path(COLLAPSED_FILE).suffix}")
+
+    if not prof_files:
+        return f"Merged {len(collapsed_files)} collapsed stack files, no .prof files found under {save_root}"
+
+    stats = pstats.Stats(prof_files[0])
+    for prof_file in prof_files[1:]:
+        stats.add(prof_file)
+    stats.dump_stats(str(output_dir / "merged.prof"))
+
+    # print_stats writes to the stream of the Stats object
+    stream = io.StringIO()
+    stats.stream = stream # type: ignore
+    stats.sort_stats("tottime").print_stats(top)
+    return f"Merged {len(prof_files)} profiles and {len(collapsed_files)} collapsed stack files into {output_dir}\n" + stream.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the profiles of agent runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge_parser = subparsers.add_parser("merge", help="Merge all .prof and .collapsed files under a save_root.")
+    merge_parser.add_argument("save_root", type=str, help="The save_root of the experiment.")
+    merge_parser.add_argument("--output-dir", type=str, default="", help="Default is <save_root>/profiles.")
+    merge_parser.add_argument("--top", type=int, default=40, help="Number of functions to print.")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        save_root = Path(args.save_root)
+        output_dir = Path(args.output_dir) if args.output_dir else save_root / "profiles"
+        print(merge_profiles(save_root, output_dir, args.top))
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import fcntl
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Optional
+from langchain_core.rate_limiters import BaseRateLimiter
+from utils.event_log import usage_fields
+from utils.token_budget import count_tokens_batch
+
+# output tokens reserved for a call before the real usage is known
+DEFAULT_OUTPUT_TOKENS = 1024
+MAX_BACKOFF = 60.0
+MAX_ATTEMPTS = 5
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    try:
+        import openai
+        if isinstance(e, openai.RateLimitError):
+            return True
+    except ImportError:
+        pass
+    return getattr(e, "status_code", None) == 429
+
+
+def get_retry_after(e: Exception) -> float:
+    # the Retry-After header of the 429 response, if the provider sends it
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) # type: ignore
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class LLMRateLimiter(BaseRateLimiter):
+    '''
+    A token bucket for requests/min and tokens/min of one model, shared by all pool workers.
+    The buckets live in a small json file under cache_root, every read-modify-write holds an flock on it,
+    so there is no broker process to start or clean up.
+    It is set as the rate_limiter of the chat model, so langchain only acquires on LLM calls that miss the cache.
+    A 429 from the provider empties the buckets and blocks all workers for an exponential backoff,
+    which is halved again after every successful call.
+    '''
+
+    def __init__(self, state_dir: Path, model_name: str, rpm: int = 0, tpm: int = 0):
+        self.state_file = Path(state_dir) / f"{model_name.replace('/', '_')}.json"
+        self.lock_file = self.state_file.with_suffix(".lock")
+        self.rpm = rpm
+        self.tpm = tpm
+        # the estimated tokens of the next call of this thread, set by invoke
+        self.local = threading.local()
+
+    def __getstate__(self) -> dict[str, object]:
+        state = self.__dict__.copy()
+        state["local"] = None
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def update_state(self, func) -> Any: # type: ignore
+        """Run func(state, now) under the file lock and save the modified state."""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                try:
+                    state = json.loads(self.state_file.read_text())
+                except (OSError, ValueError):
+                    state = {"requests": float(self.rpm), "tokens": float(self.tpm), "ts": now, "backoff": 0.0, "blocked_until": 0.0}
+                # refill the buckets
+                elapsed = max(now - state["ts"], 0.0)
+                state["requests"] = min(state["requests"] + elapsed * self.rpm / 60, float(self.rpm))
+                state["tokens"] = min(state["tokens"] + elapsed * self.tpm / 60, float(self.tpm))
+                state["ts"] = now
+                result = func(state, now)
+                tmp_file = self.state_file.with_name(f"{self.state_file.name}.{os.getpid()}")
+                tmp_file.write_text(json.dumps(state))
+                os.replace(tmp_file, self.state_file)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def try_acquire(self, tokens: int) -> float:
+        """
+        Returns:
+            float: 0 if acquired, otherwise the seconds to wait before trying again.
+        """
+        # a request larger than the bucket would wait forever
+        tokens = min(tokens, self.tpm) if self.tpm > 0 else 0
+
+        def acquire(state: dict[str, float], now: float) -> float:
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+            waits = [0.0]
+            if self.rpm > 0 and state["requests"] < 1:
+                waits.append((1 - state["requests"]) * 60 / self.rpm)
+            if self.tpm > 0 and state["tokens"] < tokens:
+                waits.append((tokens - state["tokens"]) * 60 / self.tpm)
+            if max(waits) > 0:
+                return max(waits)
+            if self.rpm > 0:
+                state["requests"] -= 1
+            state["tokens"] -= tokens
+            return 0.0
+        return self.update_state(acquire)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        tokens = getattr(self.local, "tokens", DEFAULT_OUTPUT_TOKENS)
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                self.local.acquired = tokens
+                return True
+            if not blocking:
+                return False
+            time.sleep(min(wait, MAX_BACKOFF))
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        tokens = getattr(self.local, "tokens", DEFAULT_OUTPUT_TOKENS)
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                self.local.acquired = tokens
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(min(wait, MAX_BACKOFF))
+
+    def settle(self, used_tokens: Optional[int]) -> None:
+        """Correct the token bucket with the real usage of the last call and relax the backoff."""
+        acquired = getattr(self.local, "acquired", None)
+        self.local.acquired = None
+        if acquired is None:
+            # served from the cache, nothing was acquired
+            return
+
+        def update(state: dict[str, float], now: float) -> None:
+            if self.tpm > 0 and used_tokens is not None:
+                state["tokens"] = max(state["tokens"] - (used_tokens - acquired), -float(self.tpm))
+            state["backoff"] = state["backoff"] / 2 if state["backoff"] > 0.5 else 0.0
+        self.update_state(update)
+
+    def throttled(self, retry_after: float = 0.0) -> float:
+        """
+        The provider returned 429: empty the buckets and block every worker for the backoff.
+        Returns:
+            float: The backoff in seconds.
+        """
+        self.local.acquired = None
+
+        def update(state: dict[str, float], now: float) -> float:
+            state["backoff"] = min(max(state["backoff"] * 2, 1.0), MAX_BACKOFF)
+            backoff = max(state["backoff"], retry_after)
+            state["blocked_until"] = max(state["blocked_until"], now + backoff)
+            state["requests"] = min(state["requests"], 0.0)
+            state["tokens"] = min(state["tokens"], 0.0)
+            return backoff
+        return self.update_state(update)
+
+    def invoke(self, runnable: Any, messages: list[Any]) -> Any:
+        """
+        Invoke the model (which holds this limiter) with the token estimate of the messages,
+        and retry on 429 after the shared backoff.
+        """
+        contents = [str(getattr(message, "content", message)) for message in messages]
+        self.local.tokens = sum(count_tokens_batch(contents)) + DEFAULT_OUTPUT_TOKENS
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                response = runnable.invoke(messages)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                backoff = self.throttled(get_retry_after(e))
+                print(f"Rate limited by the provider, all workers back off for {backoff:.1f}s")
+                continue
+            self.settle(usage_fields(response).get("total_tokens"))
+            return response
+
+
+def get_rate_limiter(state_dir: Path, model_name: str, rpm: int, tpm: int) -> Optional[LLMRateLimiter]:
+    """
+    Returns:
+        LLMRateLimiter: The limiter of the model, None if both limits are 0.
+    """
+    if rpm <= 0 and tpm <= 0:
+        return None
+    return LLMRateLimiter(state_dir, model_name, rpm, tpm)
+
+
+def invoke_llm(runnable: Any, messages: list[Any], rate_limiter: Optional[LLMRateLimiter] = None) -> Any:
+    if rate_limiter is None:
+        return runnable.invoke(messages)
+    return rate_limiter.invoke(runnable, messages)
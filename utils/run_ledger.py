@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import time
+import json
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+from constants import EvalResult
+
+LEDGER_FILE = "runs.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    work_dir TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    function_sig TEXT NOT NULL,
+    function_dir TEXT NOT NULL,
+    n_run INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    eval_res TEXT,
+    start_time REAL,
+    end_time REAL
+);
+CREATE INDEX IF NOT EXISTS runs_function ON runs (project, function_dir, n_run);
+CREATE INDEX IF NOT EXISTS runs_iteration ON runs (n_run, eval_res);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# set in meta once the output tree of save_root has been imported
+IMPORTED_KEY = "imported"
+
+
+class RunStatus(Enum):
+    Running = "running"
+    Finished = "finished"
+    Error = "error"
+    # imported from an existing output tree
+    Imported = "imported"
+
+
+class RunLedger():
+    '''
+    A SQLite (WAL mode) ledger of every (project, function, iteration) attempt under save_root.
+    The workers of the pool write their own rows, the runner and the analysis read them with indexed queries
+    instead of walking save_root.
+    The first connection to a ledger without the imported marker imports the existing output tree, so run dirs
+    created before the ledger (or by a tool that never imported) are not lost.
+    '''
+
+    def __init__(self, save_root: Path):
+        self.save_root = Path(save_root)
+        self.db_path = self.save_root / LEDGER_FILE
+        # sqlite connections must not cross fork, keep one per process
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self.save_root.mkdir(parents=True, exist_ok=True)
+            # the metrics exporter reads the ledger from its own thread
+            self._conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (IMPORTED_KEY,)).fetchone() is None:
+                # concurrent first connections may both import, the inserts are idempotent
+                n_imported = self.import_tree()
+                if n_imported:
+                    print(f"Imported {n_imported} existing runs into {self.db_path}")
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (IMPORTED_KEY, str(time.time())))
+        return self._conn
+
+    def __getstate__(self) -> dict[str, object]:
+        # the ledger is passed to pool workers with the config
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    def exists(self) -> bool:
+        return self.db_path.exists()
+
+    def start_run(self, project: str, function_sig: str, function_dir: str, n_run: int, work_dir: Path) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO runs (work_dir, project, function_sig, function_dir, n_run, status, start_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (str(work_dir), project.lower(), function_sig.strip(), function_dir.lower(), n_run, RunStatus.Running.value, time.time()))
+
+    def finish_run(self, work_dir: Path, status: RunStatus = RunStatus.Finished) -> None:
+        self.conn.execute("UPDATE runs SET status = ?, end_time = ? WHERE work_dir = ?",
+                          (status.value, time.time(), str(work_dir)))
+
+    def set_eval_results(self, eval_results: dict[str, str]) -> None:
+        """
+        Args:
+            eval_results (dict[str, str]): work dir -> EvalResult value.
+        """
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE runs SET eval_res = ? WHERE work_dir = ?",
+                                  [(res, work_dir) for work_dir, res in eval_results.items()])
+
+    def has_run(self, project: str, function_dir: str, n_run: int) -> bool:
+        row = self.conn.execute("SELECT 1 FROM runs WHERE project = ? AND function_dir = ? AND n_run = ? LIMIT 1",
+                                (project.lower(), function_dir.lower(), n_run)).fetchone()
+        return row is not None
+
+    def get_successful_functions(self, success_value: str, max_n_run: int) -> list[str]:
+        """
+        Get the signatures of functions that succeeded in an iteration before max_n_run.
+        """
+        rows = self.conn.execute("SELECT DISTINCT function_sig FROM runs WHERE eval_res = ? AND n_run < ?",
+                                 (success_value, max_n_run)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_runs(self, n_run: int, single_run: bool = False) -> list[tuple[str, str, Path]]:
+        """
+        Get (project, function signature, work dir) of the runs up to n_run (or exactly n_run if single_run).
+        """
+        op = "=" if single_run else "<="
+        rows = self.conn.execute(f"SELECT project, function_sig, work_dir FROM runs WHERE n_run {op} ? ORDER BY project, work_dir",
+                                 (n_run,)).fetchall()
+        return [(project, function_sig, Path(work_dir)) for project, function_sig, work_dir in rows]
+
+    def count_by_status(self) -> dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM runs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def count_by_eval_res(self) -> dict[str, int]:
+        rows = self.conn.execute("SELECT eval_res, COUNT(*) FROM runs WHERE eval_res IS NOT NULL GROUP BY eval_res").fetchall()
+        return {eval_res: count for eval_res, count in rows}
+
+    def count_started(self, n_run: int, since: float) -> int:
+        row = self.conn.execute("SELECT COUNT(*) FROM runs WHERE n_run = ? AND start_time >= ?", (n_run, since)).fetchone()
+        return row[0]
+
+    def count_finished(self, since: float) -> int:
+        row = self.conn.execute("SELECT COUNT(*) FROM runs WHERE end_time >= ? AND status != ?",
+                                (since, RunStatus.Imported.value)).fetchone()
+        return row[0]
+
+    def get_active_work_dirs(self, since: float) -> list[Path]:
+        """Work dirs of running runs and runs that finished after since."""
+        rows = self.conn.execute("SELECT work_dir FROM runs WHERE status = ? OR end_time >= ?",
+                                 (RunStatus.Running.value, since)).fetchall()
+        return [Path(row[0]) for row in rows]
+
+    def get_projects(self) -> set[str]:
+        return {row[0] for row in self.conn.execute("SELECT DISTINCT project FROM runs").fetchall()}
+
+    def import_tree(self) -> int:
+        """
+        Add the run directories of an existing output tree that are not in the ledger yet.
+        The results are taken from success_functions_{n}.json if they exist.
+        Returns:
+            int: The number of imported runs.
+        """
+        known = {row[0] for row in self.conn.execute("SELECT work_dir FROM runs").fetchall()}
+        rows: list[tuple[str, str, str, str, int, str, Optional[float]]] = []
+        for project_path in sorted(self.save_root.iterdir()):
+            if not project_path.is_dir():
+                continue
+            for function_path in project_path.iterdir():
+                if not function_path.is_dir():
+                    continue
+                for work_dir in function_path.iterdir():
+                    if not work_dir.is_dir() or not work_dir.name.startswith("run") or str(work_dir) in known:
+                        continue
+                    try:
+                        n_run = int(work_dir.name.split("_")[0][3:])
+                    except ValueError:
+                        continue
+                    func_sig_path = work_dir / "function.txt"
+                    function_sig = func_sig_path.read_text().strip() if func_sig_path.exists() else ""
+                    log_file = work_dir / "agent.log"
+                    end_time = log_file.stat().st_mtime if log_file.exists() else None
+                    rows.append((str(work_dir), project_path.name, function_sig, function_path.name, n_run,
+                                 RunStatus.Imported.value, end_time))
+
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO runs (work_dir, project, function_sig, function_dir, n_run, status, end_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+        # results of the old runs
+        eval_results: dict[str, str] = {}
+        for res_file in self.save_root.glob("success_functions_*.json"):
+            try:
+                with open(res_file, "r") as f:
+                    success_data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for value in success_data.values():
+                if value.get("work_dir"):
+                    eval_results[value["work_dir"]] = EvalResult.Success.value
+        if eval_results:
+            self.set_eval_results(eval_results)
+        return len(rows)
@@ -0,0 +1,103 @@
+import sys
+import math
+import time
+import argparse
+import functools
+import contextlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Iterator, TypeVar
+from utils.event_log import Stage, EVENT_FILE, emit_event, read_events
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@contextlib.contextmanager
+def span(name: str, **fields: Any) -> Iterator[dict[str, Any]]:
+    """
+    Time a block and record it as a span event in the event log of the current run.
+    The caller can add fields to the yielded dict. Nothing is recorded outside a run.
+    """
+    start, cpu_start = time.time(), time.process_time()
+    end_fields: dict[str, Any] = dict(fields)
+    try:
+        yield end_fields
+    except BaseException as e:
+        end_fields["error"] = type(e).__name__
+        raise
+    finally:
+        emit_event(Stage.Span, "end", name=name, start_ts=round(start, 3), duration=round(time.time() - start, 3),
+                   process_cpu=round(time.process_time() - cpu_start, 3), **end_fields)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator version of span."""
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper # type: ignore
+    return decorator
+
+
+def percentile(values: list[float], q: float) -> float:
+    # nearest-rank percentile, values must be sorted
+    if not values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(values)), 1)
+    return values[min(rank, len(values)) - 1]
+
+
+def collect_durations(save_root: Path) -> dict[str, list[float]]:
+    """
+    Collect the durations of spans and graph stages of all runs under save_root.
+    Returns:
+        dict[str, list[float]]: span name (or stage) -> durations in seconds.
+    """
+    durations: dict[str, list[float]] = defaultdict(list)
+    for event_file in save_root.glob(f"*/*/*/{EVENT_FILE}"):
+        for event in read_events(event_file):
+            if event.get("event") != "end" or "duration" not in event:
+                continue
+            if event.get("stage") == Stage.Span.value:
+                key = event.get("name", "unknown")
+            else:
+                key = f"stage.{event.get('stage')}"
+            durations[key].append(float(event["duration"]))
+    return durations
+
+
+def report(save_root: Path) -> str:
+    durations = collect_durations(save_root)
+    if not durations:
+        return f"No timing events found under {save_root}"
+
+    rows: list[tuple[str, int, float, float, float, float]] = []
+    for name, values in durations.items():
+        values.sort()
+        rows.append((name, len(values), sum(values), percentile(values, 50), percentile(values, 95), values[-1]))
+    # the most expensive stages first
+    rows.sort(key=lambda row: row[2], reverse=True)
+
+    lines = [f"{'name':<40} {'count':>8} {'total(s)':>12} {'p50(s)':>10} {'p95(s)':>10} {'max(s)':>10}"]
+    for name, count, total, p50, p95, max_value in rows:
+        lines.append(f"{name:<40} {count:>8} {total:>12.1f} {p50:>10.2f} {p95:>10.2f} {max_value:>10.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate the timing spans of all runs under a save_root.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Print count/total/p50/p95/max time by stage.")
+    report_parser.add_argument("save_root", type=str, help="The save_root of the experiment.")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print(report(Path(args.save_root)))
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+from typing import Any
+
+# the tokenizer used for all prompt budgets, the models we use have similar tokenizers
+DEFAULT_MODEL = "gpt-4o"
+# max number of memoized counts per process
+MAX_CACHED_COUNTS = 65536
+
+_count_cache: "OrderedDict[tuple[str, bytes], int]" = OrderedDict()
+_count_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model: str = DEFAULT_MODEL) -> Any:
+    """The tiktoken encoder of the model, loaded once per process."""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
+def text_key(model: str, text: str) -> tuple[str, bytes]:
+    # keep the digest instead of the text, the examples can be large
+    return model, hashlib.blake2b(text.encode("utf-8", errors="replace"), digest_size=16).digest()
+
+
+def _remember(key: tuple[str, bytes], count: int) -> None:
+    with _count_lock:
+        _count_cache[key] = count
+        _count_cache.move_to_end(key)
+        if len(_count_cache) > MAX_CACHED_COUNTS:
+            _count_cache.popitem(last=False)
+
+
+def _lookup(key: tuple[str, bytes]) -> int:
+    with _count_lock:
+        count = _count_cache.get(key, -1)
+        if count >= 0:
+            _count_cache.move_to_end(key)
+        return count
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """The exact number of tokens of the text, memoized by the hash of the text."""
+    key = text_key(model, text)
+    count = _lookup(key)
+    if count < 0:
+        count = len(get_encoder(model).encode(text, disallowed_special=()))
+        _remember(key, count)
+    return count
+
+
+def count_tokens_batch(texts: list[str], model: str = DEFAULT_MODEL) -> list[int]:
+    """Count the tokens of many texts, the texts not counted before are encoded in one batch."""
+    keys = [text_key(model, text) for text in texts]
+    counts = [_lookup(key) for key in keys]
+    missing = [i for i, count in enumerate(counts) if count < 0]
+    if missing:
+        encoded = get_encoder(model).encode_batch([texts[i] for i in missing], disallowed_special=())
+        for i, tokens in zip(missing, encoded):
+            counts[i] = len(tokens)
+            _remember(keys[i], counts[i])
+    return counts
+
+
+def upper_bound(text: str) -> int:
+    # every token has at least one byte
+    return len(text.encode("utf-8", errors="replace"))
+
+
+def lower_bound(text: str) -> int:
+    # the BPE pre-tokenizer never merges two words into one token
+    return len(text.split())
+
+
+def fits(text: str, budget: int, model: str = DEFAULT_MODEL) -> bool:
+    """
+    Check the text has at most budget tokens. The cheap bounds decide most cases without encoding.
+    """
+    if upper_bound(text) <= budget:
+        return True
+    if lower_bound(text) > budget:
+        return False
+    return count_tokens(text, model) <= budget
+
+
+def truncate_head_lines(text: str, budget: int, model: str = DEFAULT_MODEL) -> str:
+    """
+    Remove the fewest leading lines so that the text fits the budget (binary search over the cut line).
+    The last line is returned even if it is longer than the budget.
+    """
+    if fits(text, budget, model):
+        return text
+    lines = text.split("\n")
+    # the text without the first low lines does not fit, the text without the first high lines does
+    low, high = 0, len(lines) - 1
+    while high - low > 1:
+        mid = (low + high) // 2
+        if fits("\n".join(lines[mid:]), budget, model):
+            high = mid
+        else:
+            low = mid
+    return "\n".join(lines[high:])